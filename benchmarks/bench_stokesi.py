@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Compare the fused Stokes I + downsample path with the previous three-copy path.
+
+Run from the repository root::
+
+    python benchmarks/bench_stokesi.py --ntime 16384 --nchan 4096 -c 8 -t 4
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from psrtool.psrfits import stokesi_downsample
+
+
+def previous_path(data: np.ndarray, dchan_factor: int, dt_factor: int) -> np.ndarray:
+    """Stokes I and downsampling as implemented before the fused kernel."""
+    dtype = data.dtype
+    stokesi = ((data[:, 0, :] + data[:, 1, :]) / 2).astype(dtype)
+    ntime, nchan = stokesi.shape
+    out = stokesi[:, :nchan // dchan_factor * dchan_factor].reshape(ntime, -1, dchan_factor).mean(axis=2)
+    ntime_ds = ntime // dt_factor
+    out = out[:ntime_ds * dt_factor].reshape(ntime_ds, dt_factor, -1).mean(axis=1)
+    return out.astype(dtype)
+
+
+def measure(func, *args) -> tuple[float, int]:
+    """Return wall time in seconds and peak traced allocation in bytes."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ntime", type=int, default=16384)
+    parser.add_argument("--nchan", type=int, default=4096)
+    parser.add_argument("-c", "--dchan-factor", type=int, default=8)
+    parser.add_argument("-t", "--dt-factor", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 128, size=(args.ntime, 2, args.nchan), dtype=np.uint8)
+    nbytes = data.nbytes
+    print(f"2-pol uint8 input: {nbytes / 1e6:.1f} MB, -c {args.dchan_factor} -t {args.dt_factor}")
+    for name, func in (("previous", previous_path), ("fused", stokesi_downsample)):
+        results = [measure(func, data, args.dchan_factor, args.dt_factor) for _ in range(args.repeat)]
+        seconds = min(r[0] for r in results)
+        peak = max(r[1] for r in results)
+        print(f"{name:>8}: {seconds:.3f} s  {nbytes / seconds / 1e6:8.1f} MB/s  peak {peak / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Time and memory-profile the conversion hot paths on synthetic PSRFITS data.
+
+Every combination of the parameter grid is run in a fresh interpreter, so
+the reported peak RSS belongs to that case alone. Results are written as
+JSON and can be compared against an earlier run to catch regressions.
+
+Run from the repository root::
+
+    python benchmarks/bench_suite.py --size-mb 256 --nchan 1024 4096 --npol 1 2 \\
+        --nbits 8 2 -o results.json
+    python benchmarks/bench_suite.py ... --baseline results.json --tolerance 0.1
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS = ("get_stokesi_data", "downsample_data", "fits2fil", "combinefits", "fil2fits", "fildecimate")
+
+# Parameters identifying a case; results with equal keys are compared
+CASE_KEYS = ("bench", "size_mb", "nchan", "npol", "nbits", "nsblk", "dchan", "dt")
+
+
+def write_input(fitsfile: str, nbytes: int, nchan: int, npol: int, nbits: int, nsblk: int, seed: int = 0) -> None:
+    """Write a synthetic PSRFITS file of about ``nbytes`` of DATA, a subint at a time."""
+    from psrtool.fitswriter import DATA_FORMATS, PsrfitsWriter
+
+    subint_bytes = nsblk * npol * nchan * nbits // 8
+    nsubint = max(1, round(nbytes / subint_bytes))
+    high = 1 << min(nbits, 8)
+    dtype = DATA_FORMATS[nbits][1] if nbits >= 8 else np.uint8
+    rng = np.random.default_rng(seed)
+    with PsrfitsWriter(
+        fitsfile, nchan=nchan, nsblk=nsblk, tbin=64e-6, obsfreq=1250.0, obsbw=500.0, nbits=nbits, npol=npol,
+        stt_imjd=60000, stt_offs=seed * nsubint * nsblk * 64e-6, src_name="BENCH",
+    ) as writer:
+        for _ in range(nsubint):
+            data = rng.integers(0, high, size=(1, nsblk, npol, nchan), dtype=np.uint8).astype(dtype)
+            writer.write_subints(data)
+
+
+def make_inputs(workdir: str, case: dict, nfiles: int) -> dict:
+    """Create (or reuse) the single-file and split inputs of a case's data shape."""
+    name = "n{nchan}_p{npol}_b{nbits}_s{nsblk}_{size_mb}mb".format(**case)
+    single = os.path.join(workdir, name + ".fits")
+    if not os.path.exists(single):
+        write_input(single, case["size_mb"] * 10**6, case["nchan"], case["npol"], case["nbits"], case["nsblk"])
+    split = [os.path.join(workdir, f"{name}_part{i}.fits") for i in range(nfiles)]
+    for i, path in enumerate(split):
+        if not os.path.exists(path):
+            # Consecutive seeds start each file where the previous one ends
+            write_input(path, case["size_mb"] * 10**6 // nfiles, case["nchan"], case["npol"], case["nbits"],
+                        case["nsblk"], seed=i)
+    return {"single": single, "split": split}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+
+def run_case(case: dict) -> dict:
+    """Run one case in this process and return its measurements."""
+    from psrtool.combinefits import combinefits
+    from psrtool.fits2fil import fil2fits, fildecimate, fits2fil
+    from psrtool.psrfits import downsample_data, get_stokesi_data
+
+    single, split = case["inputs"]["single"], case["inputs"]["split"]
+    dchan, dt = case["dchan"], case["dt"]
+    outdir = tempfile.mkdtemp(dir=case["workdir"])
+    outfil = os.path.join(outdir, "out.fil")
+    nbytes = os.path.getsize(single)
+
+    if case["bench"] == "get_stokesi_data":
+        func = lambda: get_stokesi_data(single)
+    elif case["bench"] == "downsample_data":
+        data = get_stokesi_data(single)
+        nbytes = data.nbytes
+        func = lambda: downsample_data(data, dchan, dt)
+    elif case["bench"] == "fits2fil":
+        func = lambda: fits2fil(single, outfil, dchan, dt)
+    elif case["bench"] == "combinefits":
+        nbytes = sum(os.path.getsize(path) for path in split)
+        func = lambda: combinefits(split, outfil, dchan, dt)
+    elif case["bench"] == "fil2fits":
+        infil = os.path.join(outdir, "in.fil")
+        fits2fil(single, infil)
+        nbytes = os.path.getsize(infil)
+        func = lambda: fil2fits(infil, os.path.join(outdir, "out.fits"))
+    elif case["bench"] == "fildecimate":
+        infil = os.path.join(outdir, "in.fil")
+        fits2fil(single, infil)
+        nbytes = os.path.getsize(infil)
+        func = lambda: fildecimate(infil, outfil, dchan, dt)
+    else:
+        raise ValueError(f"Unknown benchmark {case['bench']!r}")
+
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "mb_per_s": nbytes / seconds / 1e6,
+        "input_mb": nbytes / 1e6,
+        "peak_rss_mb": peak_rss_mb(),
+        "base_rss_mb": base_rss,
+    }
+
+
+def run_isolated(case: dict, repeat: int) -> dict:
+    """Run a case ``repeat`` times in fresh interpreters; keep the best time and worst RSS."""
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--run-case", json.dumps(case)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run["seconds"])
+    best["peak_rss_mb"] = max(run["peak_rss_mb"] for run in runs)
+    return best
+
+
+def case_key(result: dict) -> tuple:
+    return tuple(result[key] for key in CASE_KEYS)
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Describe cases that got slower or use more memory than in ``baseline``."""
+    previous = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None or "error" in result or "error" in old:
+            continue
+        label = " ".join(f"{key}={result[key]}" for key in CASE_KEYS)
+        if result["mb_per_s"] < old["mb_per_s"] * (1 - tolerance):
+            regressions.append(f"{label}: {old['mb_per_s']:.1f} -> {result['mb_per_s']:.1f} MB/s")
+        if result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak RSS {old['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bench", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--size-mb", nargs="+", type=int, default=[64], help="DATA size per case in MB.")
+    parser.add_argument("--nchan", nargs="+", type=int, default=[1024])
+    parser.add_argument("--npol", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--nbits", nargs="+", type=int, default=[8])
+    parser.add_argument("--nsblk", nargs="+", type=int, default=[1024])
+    parser.add_argument("-c", "--dchan", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("-t", "--dt", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--nfiles", type=int, default=4, help="Number of files combinefits combines.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", help="Directory for the synthetic inputs, reused across runs.")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown or RSS growth.")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="psrtool-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    grid = itertools.product(args.size_mb, args.nchan, args.npol, args.nbits, args.nsblk)
+    for size_mb, nchan, npol, nbits, nsblk in grid:
+        shape = dict(size_mb=size_mb, nchan=nchan, npol=npol, nbits=nbits, nsblk=nsblk)
+        inputs = make_inputs(workdir, shape, args.nfiles)
+        for bench in args.bench:
+            # get_stokesi_data and fil2fits do not downsample
+            factors = [(1, 1)] if bench in ("get_stokesi_data", "fil2fits") else itertools.product(args.dchan, args.dt)
+            for dchan, dt in factors:
+                case = dict(shape, bench=bench, dchan=dchan, dt=dt)
+                result = dict(case, **run_isolated(dict(case, inputs=inputs, workdir=workdir), args.repeat))
+                results.append(result)
+                label = " ".join(f"{key}={case[key]}" for key in CASE_KEYS)
+                if "error" in result:
+                    print(f"{label}: FAILED {result['error']}")
+                else:
+                    print(f"{label}: {result['seconds']:.3f} s  {result['mb_per_s']:8.1f} MB/s  "
+                          f"peak RSS {result['peak_rss_mb']:8.1f} MB")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Measure the throughput of the 1/2/4-bit unpacking and packing kernels.
+
+Run from the repository root::
+
+    python benchmarks/bench_unpack.py --mbytes 256
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from psrtool.bits import pack_bits, unpack_bits
+
+
+def best_time(func, *args, repeat: int = 3) -> float:
+    """Return the fastest of ``repeat`` calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mbytes", type=int, default=256, help="Size of the packed input in MB.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    packed = rng.integers(0, 256, size=(args.mbytes * 1024, 1024), dtype=np.uint8)
+    print(f"packed input: {packed.nbytes / 1e9:.2f} GB")
+    for nbits in (1, 2, 4):
+        for bitorder in ("big", "little"):
+            seconds = best_time(unpack_bits, packed, nbits, bitorder, repeat=args.repeat)
+            unpacked = unpack_bits(packed, nbits, bitorder)
+            pack_seconds = best_time(pack_bits, unpacked, nbits, bitorder, repeat=args.repeat)
+            print(
+                f"{nbits}-bit {bitorder:>6}: unpack {packed.nbytes / seconds / 1e9:6.2f} GB/s packed "
+                f"({unpacked.nbytes / seconds / 1e9:6.2f} GB/s out), "
+                f"pack {packed.nbytes / pack_seconds / 1e9:6.2f} GB/s packed"
+            )
+            del unpacked
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional, Sequence, Union
+
+from .fits2fil import fits2fil
+from .options import DEFAULT_CACHE_MAX_BYTES
+from .psrfits import read_fits_header, output_nbits
+from .rfi import rfi_mask_path
+from .sigproc import read_header
+
+
+class BatchResult(NamedTuple):
+    """Outcome of converting one file in a batch.
+
+    ``status`` is one of ``"ok"``, ``"skipped"`` (output already complete)
+    or ``"failed"``; ``error`` holds the formatted traceback of a failure.
+    """
+
+    fitsfile: str
+    outfile: str
+    status: str
+    seconds: float
+    nbytes: int
+    error: Optional[str] = None
+
+    @property
+    def throughput(self) -> float:
+        """Input bytes converted per second, in MB/s."""
+        if self.status != "ok" or self.seconds <= 0:
+            return 0.0
+        return self.nbytes / self.seconds / 1e6
+
+
+def batch_outfile(fitsfile: str, outdir: str) -> str:
+    """Return the filterbank path a batch conversion writes ``fitsfile`` to."""
+    name = os.path.splitext(os.path.basename(fitsfile))[0]
+    return os.path.join(outdir, name + ".fil")
+
+
+def is_conversion_complete(
+    fitsfile: str,
+    outfile: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    repack: bool = False,
+    float_output: bool = False,
+    nbits_out: Optional[int] = None,
+) -> bool:
+    """Check whether ``outfile`` holds a complete conversion of ``fitsfile``.
+
+    The output is complete when its data section is exactly as long as the
+    downsampled input, so a file left behind by an interrupted run is not
+    mistaken for a finished one.
+    """
+    if not os.path.isfile(outfile):
+        return False
+    _, header1 = read_fits_header(fitsfile)
+    nsamples = int(header1["NAXIS2"]) * int(header1["NSBLK"]) // dt_factor  # type: ignore
+    nchan = int(header1["NCHAN"]) // dchan_factor  # type: ignore
+    nbits = output_nbits(int(header1["NBITS"]), repack, float_output, nbits_out)  # type: ignore
+    try:
+        header, hdrbytes = read_header(outfile)
+    except Exception:
+        return False
+    if header.get("nchans") != nchan or header.get("nbits") != nbits:
+        return False
+    expected = hdrbytes + nsamples * nchan * nbits // 8
+    return os.path.getsize(outfile) == expected
+
+
+def _convert_one(
+    fitsfile: str,
+    outfile: str,
+    dchan_factor: int,
+    dt_factor: int,
+    nsubint_per_chunk: int,
+    threads: int,
+    overwrite: bool,
+    repack: bool,
+    apply_scales: bool,
+    requantize: Optional[str],
+    nbits_out: Optional[int] = None,
+    rfi_sigma: Optional[float] = None,
+    rfi_mask: Optional[Union[str, Sequence[int]]] = None,
+    rfi_fill: str = "mean",
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+) -> BatchResult:
+    """Convert a single file, capturing any error in the returned result."""
+    start = time.perf_counter()
+    try:
+        nbytes = os.path.getsize(fitsfile)
+        float_output = apply_scales and requantize is None
+        # The RFI mask sidecar is written last, so its absence marks an unfinished conversion
+        needs_mask = (rfi_sigma is not None or rfi_mask is not None) and not os.path.exists(rfi_mask_path(outfile))
+        if not overwrite and not needs_mask and is_conversion_complete(
+            fitsfile, outfile, dchan_factor, dt_factor, repack, float_output, nbits_out
+        ):
+            return BatchResult(fitsfile, outfile, "skipped", 0.0, nbytes)
+        fits2fil(
+            fitsfile,
+            outfile,
+            dchan_factor=dchan_factor,
+            dt_factor=dt_factor,
+            nsubint_per_chunk=nsubint_per_chunk,
+            threads=threads,
+            repack=repack,
+            apply_scales=apply_scales,
+            requantize=requantize,
+            nbits_out=nbits_out,
+            rfi_sigma=rfi_sigma,
+            rfi_mask=rfi_mask,
+            rfi_fill=rfi_fill,
+            cache_dir=cache_dir,
+            cache_max_bytes=cache_max_bytes,
+        )
+    except Exception:
+        return BatchResult(fitsfile, outfile, "failed", time.perf_counter() - start, 0, traceback.format_exc())
+    return BatchResult(fitsfile, outfile, "ok", time.perf_counter() - start, nbytes)
+
+
+def batch_fits2fil(
+    fitsfiles: list[str],
+    outdir: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    workers: Optional[int] = None,
+    nsubint_per_chunk: int = 16,
+    threads: int = 0,
+    overwrite: bool = False,
+    repack: bool = False,
+    apply_scales: bool = False,
+    requantize: Optional[str] = None,
+    nbits_out: Optional[int] = None,
+    rfi_sigma: Optional[float] = None,
+    rfi_mask: Optional[Union[str, Sequence[int]]] = None,
+    rfi_fill: str = "mean",
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+) -> list[BatchResult]:
+    """Convert many PSRFITS files to filterbank files in parallel.
+
+    Each input is written to ``<outdir>/<name>.fil`` by ``fits2fil`` in a
+    pool of worker processes. A failure only affects its own file, and
+    outputs that are already complete are skipped unless ``overwrite`` is
+    set, so an interrupted batch can simply be rerun.
+
+    Parameters
+    ----------
+    fitsfiles : list[str]
+        Input PSRFITS file paths.
+    outdir : str
+        Directory the filterbank files are written to.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    workers : Optional[int]
+        Number of worker processes; defaults to the number of CPUs.
+    nsubint_per_chunk : int
+        Number of subints read per chunk within each conversion.
+    threads : int
+        Pipeline worker threads per conversion; 0 runs each conversion in
+        series, which is usually best when ``workers`` already fills the CPUs.
+    overwrite : bool
+        Convert files even if their output is already complete.
+    repack : bool
+        Pack 1, 2 and 4-bit input back to its original NBITS.
+    apply_scales : bool
+        Apply DAT_SCL, DAT_OFFS and DAT_WTS (see ``fits2fil``).
+    requantize : Optional[str]
+        Clipping policy used to round scaled samples back to the input NBITS.
+    nbits_out : Optional[int]
+        Output NBITS (see ``fits2fil``).
+    rfi_sigma, rfi_mask, rfi_fill
+        RFI masking of each conversion (see ``fits2fil``); each output gets
+        its own ``<name>.rfimask.npz`` sidecar.
+    cache_dir : Optional[str]
+        Conversion cache directory shared by the workers (see ``fits2fil``).
+    cache_max_bytes : int
+        Size cap of the conversion cache.
+
+    Returns
+    -------
+    list[BatchResult]
+        One result per input file, in input order.
+    """
+    if dchan_factor < 1 or dt_factor < 1:
+        raise ValueError("dchan_factor and dt_factor must be >= 1")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be >= 1")
+
+    os.makedirs(outdir, exist_ok=True)
+    outfiles = [batch_outfile(fitsfile, outdir) for fitsfile in fitsfiles]
+    if len(set(outfiles)) != len(outfiles):
+        raise ValueError("Input files must have distinct base names in batch mode.")
+
+    results: dict[int, BatchResult] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _convert_one,
+                fitsfile,
+                outfile,
+                dchan_factor,
+                dt_factor,
+                nsubint_per_chunk,
+                threads,
+                overwrite,
+                repack,
+                apply_scales,
+                requantize,
+                nbits_out,
+                rfi_sigma,
+                rfi_mask,
+                rfi_fill,
+                cache_dir,
+                cache_max_bytes,
+            ): i
+            for i, (fitsfile, outfile) in enumerate(zip(fitsfiles, outfiles))
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for running out of memory)
+                results[i] = BatchResult(fitsfiles[i], outfiles[i], "failed", 0.0, 0, traceback.format_exc())
+    return [results[i] for i in range(len(fitsfiles))]
+
+
+def format_batch_report(results: list[BatchResult]) -> str:
+    """Format a per-file throughput summary of a batch conversion."""
+    lines = [f"{'status':<8} {'seconds':>9} {'MB/s':>9}  file"]
+    for result in results:
+        lines.append(f"{result.status:<8} {result.seconds:>9.2f} {result.throughput:>9.1f}  {result.fitsfile}")
+    converted = [result for result in results if result.status == "ok"]
+    seconds = sum(result.seconds for result in converted)
+    nbytes = sum(result.nbytes for result in converted)
+    counts = {status: sum(result.status == status for result in results) for status in ("ok", "skipped", "failed")}
+    lines.append(
+        f"{counts['ok']} converted, {counts['skipped']} skipped, {counts['failed']} failed; "
+        f"{nbytes / 1e6:.1f} MB in {seconds:.2f} worker-seconds"
+    )
+    for result in results:
+        if result.error:
+            lines.append(f"--- {result.fitsfile}\n{result.error.rstrip()}")
+    return "\n".join(lines)
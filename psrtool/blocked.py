@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+import numpy as np
+
+from typing import Union
+
+from .options import LAYOUTS
+from .profiling import stage
+from .sigproc import _DTYPES, Filterbank, create_filterbank
+
+
+# Edge of the square tiles spectra are transposed in; a 256 x 256 tile of
+# float32 samples (256 KB) stays in L2 cache on both sides of the copy
+_TRANSPOSE_TILE = 256
+
+
+def blocked_header_path(path: str) -> str:
+    """Path of the JSON header written next to a channel-major ``.npy`` file."""
+    return path + ".json"
+
+
+class BlockedSpectra:
+    """A channel-major blocked output file with its data mapped into memory.
+
+    The spectra are stored in a ``.npy`` file of shape
+    (nblocks, nchans, block_length): each block holds ``block_length``
+    consecutive time samples with every channel's time series contiguous,
+    so dedispersion can map per-channel series without transposing. The
+    last block is zero-padded. The SIGPROC header fields, ``nspectra`` and
+    ``block_length`` are kept in a JSON file next to it (see
+    ``blocked_header_path``).
+
+    Indexing with a slice of time samples reads or writes time-major
+    spectra of shape (nsamp, nchans), transposing in cache-sized tiles, so
+    the converters can treat it like ``Filterbank.data``.
+
+    Parameters
+    ----------
+    path : str
+        ``.npy`` file path.
+    mode : str
+        ``"r"`` to read or ``"r+"`` to also write the data.
+    """
+
+    def __init__(self, path: str, mode: str = "r") -> None:
+        self.path = path
+        with open(blocked_header_path(path)) as f:
+            self.header = json.load(f)
+        self.nspectra = int(self.header["nspectra"])
+        self.block_length = int(self.header["block_length"])
+        self.nchans = int(self.header["nchans"])
+        self.nbits = int(self.header["nbits"])
+        self.data = np.load(path, mmap_mode=mode)
+
+    def __enter__(self) -> "BlockedSpectra":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def tsamp(self) -> float:
+        return self.header["tsamp"]
+
+    @property
+    def tstart(self) -> float:
+        return self.header["tstart"]
+
+    @property
+    def fch1(self) -> float:
+        return self.header["fch1"]
+
+    @property
+    def foff(self) -> float:
+        return self.header["foff"]
+
+    @property
+    def source_name(self) -> str:
+        return self.header.get("source_name", "")
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.nspectra, self.nchans)
+
+    def _blocks(self, start: int, stop: int):
+        """Yield (block, first, last) sample ranges of ``[start, stop)`` within each block they touch."""
+        for iblock in range(start // self.block_length, -(-stop // self.block_length)):
+            base = iblock * self.block_length
+            yield iblock, max(start, base) - base, min(stop, base + self.block_length) - base
+
+    def _rows(self, rows: slice) -> tuple[int, int]:
+        start, stop, step = rows.indices(self.nspectra)
+        if step != 1:
+            raise IndexError("BlockedSpectra only supports contiguous slices of time samples")
+        return start, max(start, stop)
+
+    def __getitem__(self, rows: slice) -> np.ndarray:
+        start, stop = self._rows(rows)
+        spectra = np.empty((stop - start, self.nchans), dtype=self.data.dtype)
+        for iblock, first, last in self._blocks(start, stop):
+            offset = iblock * self.block_length + first - start
+            _transpose(self.data[iblock, :, first:last], spectra[offset : offset + last - first])
+        return spectra
+
+    def __setitem__(self, rows: slice, spectra: Union[np.ndarray, float]) -> None:
+        start, stop = self._rows(rows)
+        spectra = np.asarray(spectra)
+        with stage("transpose", (stop - start) * self.nchans * self.data.itemsize):
+            for iblock, first, last in self._blocks(start, stop):
+                region = self.data[iblock, :, first:last]
+                if spectra.ndim < 2:
+                    # A single spectrum (or value) repeated over time, e.g. a gap fill
+                    region[...] = np.broadcast_to(spectra, (self.nchans,))[:, np.newaxis]
+                    continue
+                offset = iblock * self.block_length + first - start
+                _transpose(spectra[offset : offset + last - first], region)
+
+    def get_spectra(self, start: int, nsamp: int) -> np.ndarray:
+        """Return ``nsamp`` spectra from ``start``, with shape (nsamp, nchans)."""
+        return self[start : start + nsamp]
+
+    def get_channel(self, channel: int) -> np.ndarray:
+        """Return the whole time series of one channel."""
+        return self.data[:, channel, :].reshape(-1)[: self.nspectra]
+
+    def close(self) -> None:
+        """Flush writes and release the mapping."""
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.data = np.zeros((0,) + self.data.shape[1:], dtype=self.data.dtype)
+
+
+def _transpose(src: np.ndarray, dst: np.ndarray) -> None:
+    """Copy ``src`` of shape (n, m) into ``dst`` of shape (m, n) in cache-sized tiles."""
+    nrow, ncol = src.shape
+    for c0 in range(0, ncol, _TRANSPOSE_TILE):
+        for r0 in range(0, nrow, _TRANSPOSE_TILE):
+            tile = src[r0 : r0 + _TRANSPOSE_TILE, c0 : c0 + _TRANSPOSE_TILE]
+            dst[c0 : c0 + _TRANSPOSE_TILE, r0 : r0 + _TRANSPOSE_TILE] = tile.T
+
+
+def create_blocked(path: str, header: dict, nspectra: int, block_length: int) -> BlockedSpectra:
+    """Create a channel-major blocked file of ``nspectra`` zeroed spectra and map it for writing.
+
+    Parameters
+    ----------
+    path : str
+        Output ``.npy`` file path.
+    header : dict
+        Header, e.g. from ``psrtool.sigproc.make_header``. Only 8, 16 and
+        32-bit samples can be stored.
+    nspectra : int
+        Number of spectra in the file.
+    block_length : int
+        Number of time samples per block.
+
+    Returns
+    -------
+    BlockedSpectra
+        The new file, opened with ``mode="r+"``.
+    """
+    if block_length < 1:
+        raise ValueError("block_length must be >= 1")
+    nbits = header["nbits"]
+    if nbits not in _DTYPES:
+        raise ValueError(f"Channel-major output needs 8, 16 or 32-bit samples, not {nbits}")
+    with open(blocked_header_path(path), "w") as f:
+        json.dump(dict(header, nspectra=nspectra, block_length=block_length, layout="channel"), f, indent=2)
+    nblocks = -(-nspectra // block_length)
+    shape = (nblocks, header["nchans"] * header.get("nifs", 1), block_length)
+    data = np.lib.format.open_memmap(path, mode="w+", dtype=_DTYPES[nbits], shape=shape)
+    del data
+    return BlockedSpectra(path, mode="r+")
+
+
+def replace_blocked(src: str, dst: str) -> None:
+    """Move a blocked file and its header into place, the header first."""
+    os.replace(blocked_header_path(src), blocked_header_path(dst))
+    os.replace(src, dst)
+
+
+def create_output(
+    path: str, header: dict, nspectra: int, layout: str = "time", block_length: int = 8192
+) -> tuple[Union[Filterbank, BlockedSpectra], Union[np.ndarray, BlockedSpectra]]:
+    """Create a converter's preallocated output in the given layout.
+
+    Parameters
+    ----------
+    path : str
+        Output file path.
+    header : dict
+        Header, e.g. from ``psrtool.sigproc.make_header``.
+    nspectra : int
+        Number of spectra in the file.
+    layout : str
+        ``"time"`` for a SIGPROC filterbank, ``"channel"`` for a
+        channel-major blocked ``.npy`` file.
+    block_length : int
+        Time samples per block of a channel-major file.
+
+    Returns
+    -------
+    tuple[Union[Filterbank, BlockedSpectra], Union[np.ndarray, BlockedSpectra]]
+        The open file, to be closed once written, and the spectra to
+        write into with time-major slices.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {', '.join(LAYOUTS)}")
+    if layout == "channel":
+        blocked = create_blocked(path, header, nspectra, block_length)
+        return blocked, blocked
+    fil = create_filterbank(path, header, nspectra)
+    return fil, fil.data
+
+
+def break_link(path: str) -> None:
+    """Give ``path`` a private, writable copy of its data if other names link to it.
+
+    Outputs fetched from a conversion cache are hard links to its read-only
+    files, so they must not be written in place.
+    """
+    if os.stat(path).st_nlink > 1:
+        tmpfile = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmpfile)
+        os.replace(tmpfile, path)
+
+
+def open_output(
+    path: str, layout: str = "time"
+) -> tuple[Union[Filterbank, BlockedSpectra], Union[np.ndarray, BlockedSpectra]]:
+    """Open an output made by ``create_output`` for writing, e.g. in a worker process."""
+    if layout == "channel":
+        blocked = BlockedSpectra(path, mode="r+")
+        return blocked, blocked
+    fil = Filterbank(path, mode="r+")
+    return fil, fil.data
+
+
+def replace_output(src: str, dst: str, layout: str = "time") -> None:
+    """Move a completed output made by ``create_output`` into place."""
+    if layout == "channel":
+        replace_blocked(src, dst)
+    else:
+        os.replace(src, dst)
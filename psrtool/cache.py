@@ -0,0 +1,322 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+
+from contextlib import contextmanager
+from importlib.metadata import PackageNotFoundError, version
+from typing import Optional, Sequence
+
+from .blocked import blocked_header_path
+from .options import DEFAULT_CACHE_MAX_BYTES
+from .profiling import stage
+from .rfi import rfi_mask_path
+
+
+CACHE_VERSION = 1
+
+
+def _psrtool_version() -> str:
+    try:
+        return version("pulsartools")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def conversion_products(outfiles: list[str], layout: str = "time", rfi: bool = False) -> list[str]:
+    """Return every file a conversion writing ``outfiles`` leaves behind.
+
+    That is each output, its JSON header for channel-major output and its
+    RFI mask sidecar if the conversion was RFI-masked.
+    """
+    products = []
+    for outfile in outfiles:
+        products.append(outfile)
+        if layout == "channel":
+            products.append(blocked_header_path(outfile))
+        if rfi:
+            products.append(rfi_mask_path(outfile))
+    return products
+
+
+def _output_stem(outfile: str) -> str:
+    return os.path.splitext(os.path.basename(outfile))[0]
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hard link ``src`` to ``dst``, copying across filesystems; ``dst`` is replaced atomically."""
+    tmpfile = f"{dst}.{os.getpid()}.tmp"
+    if os.path.lexists(tmpfile):
+        os.remove(tmpfile)
+    try:
+        os.link(src, tmpfile)
+    except OSError:
+        shutil.copyfile(src, tmpfile)
+    os.replace(tmpfile, dst)
+
+
+def _lock_fd(path: str, blocking: bool) -> Optional[int]:
+    """Open and ``flock`` ``path``; None if ``blocking`` is off and it is taken.
+
+    A lock file removed (see ``ConversionCache.evict``) while waiting for it
+    is opened again, so every holder locks the file at ``path``.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and os.path.samestat(current, os.fstat(fd)):
+            return fd
+        os.close(fd)
+
+
+@contextmanager
+def _flock(path: str, blocking: bool = True):
+    """Hold an exclusive ``flock`` on ``path``; yields False if ``blocking`` is off and it is taken."""
+    fd = _lock_fd(path, blocking)
+    if fd is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.close(fd)
+
+
+class ConversionCache:
+    """On-disk cache of converted products, shared safely between processes.
+
+    Entries are keyed on the identity of the input files (real path, size
+    and modification time), the conversion options and the psrtool version,
+    so changing any of them misses. A hit hard links the cached files to
+    the requested output path (or copies them if the cache is on another
+    filesystem), which takes no time however large they are; storing links
+    the products into the cache the same way. Cached files are made
+    read-only, and outputs share their data with the cache, so they must be
+    replaced rather than modified in place, as the in-place writers of
+    psrtool do (see ``psrtool.blocked.break_link``).
+
+    Once an entry is stored, the least recently used entries are removed
+    until the cache holds at most ``max_bytes``. Each key has its own lock
+    file, so processes asking for the same conversion wait for the first
+    to finish it rather than repeat it, and entries in use are never
+    evicted.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory, created if needed; may be shared between machines
+        on a filesystem with working ``flock``.
+    max_bytes : int
+        Size cap of the cached files.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> None:
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be >= 0")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        for name in ("entries", "locks", "tmp"):
+            os.makedirs(os.path.join(cache_dir, name), exist_ok=True)
+
+    def key(self, command: str, fitsfiles: Sequence[str], options: dict) -> str:
+        """Return the cache key of running ``command`` on ``fitsfiles`` with ``options``.
+
+        ``options`` must be JSON serializable and hold every option that
+        changes the output, and none that do not (threads, workers, ...).
+        An ``rfi_mask`` file is keyed on its content, a sequence on its
+        channels.
+        """
+        options = dict(options)
+        if isinstance(options.get("rfi_mask"), str):
+            with open(options["rfi_mask"], "rb") as f:
+                options["rfi_mask"] = "sha256:" + hashlib.sha256(f.read()).hexdigest()
+        elif options.get("rfi_mask") is not None:
+            options["rfi_mask"] = [int(channel) for channel in options["rfi_mask"]]
+        inputs = []
+        for fitsfile in fitsfiles:
+            info = os.stat(fitsfile)
+            inputs.append([os.path.realpath(fitsfile), info.st_size, info.st_mtime_ns])
+        identity = {
+            "cache": CACHE_VERSION,
+            "psrtool": _psrtool_version(),
+            "command": command,
+            "inputs": sorted(inputs),
+            "options": options,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "entries", key)
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "locks", key + ".lock")
+
+    def lock(self, key: str):
+        """Context manager holding the lock of one key, e.g. around a fetch and the store after a miss."""
+        return _flock(self._lock_path(key))
+
+    def lock_nowait(self, key: str):
+        """Like ``lock``, but yields False at once if another holder has the key."""
+        return _flock(self._lock_path(key), blocking=False)
+
+    def fetch(self, key: str, outfile: str) -> Optional[tuple[list[str], dict]]:
+        """Link a cached entry to ``outfile``, with the caller holding ``lock(key)``.
+
+        Each cached file is linked next to ``outfile`` under the name it had
+        next to the output it was stored from, with the stem of
+        ``outfile``, e.g. ``b.rfimask.npz`` for ``b.fil`` from ``a.rfimask.npz``
+        and ``a.fil``.
+
+        Returns
+        -------
+        Optional[tuple[list[str], dict]]
+            The outputs linked and the result stored with them, or None on a
+            miss.
+        """
+        entry = self._entry(key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        outdir = os.path.dirname(outfile)
+        stem = _output_stem(outfile)
+        outfiles = []
+        with stage("cache", file=outfile):
+            for index, item in enumerate(manifest["files"]):
+                dst = os.path.join(outdir, stem + item["suffix"])
+                _link_or_copy(os.path.join(entry, str(index)), dst)
+                if item["output"]:
+                    outfiles.append(dst)
+        # The manifest's modification time orders entries for eviction
+        os.utime(manifest_path)
+        return outfiles, manifest["result"]
+
+    def store(
+        self, key: str, outfile: str, products: list[str], outfiles: list[str], result: Optional[dict] = None
+    ) -> None:
+        """Add the files of a finished conversion, with the caller holding ``lock(key)``.
+
+        Parameters
+        ----------
+        key : str
+            Key from ``key``.
+        outfile : str
+            Output path the conversion was asked for; every product must be
+            in its directory and start with its stem.
+        products : list[str]
+            Every file written, see ``conversion_products``.
+        outfiles : list[str]
+            Those of ``products`` that ``fetch`` should return.
+        result : Optional[dict]
+            JSON-serializable result returned by ``fetch`` on a hit.
+        """
+        stem = _output_stem(outfile)
+        files = []
+        for path in products:
+            name = os.path.basename(path)
+            if os.path.dirname(path) != os.path.dirname(outfile) or not name.startswith(stem):
+                raise ValueError(f"{path} is not named after {outfile}")
+            files.append({"suffix": name[len(stem) :], "output": path in outfiles})
+
+        tmpdir = os.path.join(self.cache_dir, "tmp", f"{key}.{os.getpid()}")
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        os.makedirs(tmpdir)
+        with stage("cache", file=outfile):
+            for index, path in enumerate(products):
+                cached = os.path.join(tmpdir, str(index))
+                _link_or_copy(path, cached)
+                mode = os.stat(cached).st_mode
+                os.chmod(cached, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+            with open(os.path.join(tmpdir, "manifest.json"), "w") as f:
+                json.dump({"version": CACHE_VERSION, "files": files, "result": result or {}}, f)
+        entry = self._entry(key)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmpdir, entry)
+        self.evict()
+
+    def entries(self) -> list[tuple[str, float, int]]:
+        """Return (key, last use, bytes) of every entry, least recently used first."""
+        entries = []
+        root = os.path.join(self.cache_dir, "entries")
+        for key in os.listdir(root):
+            entry = os.path.join(root, key)
+            try:
+                last_used = os.stat(os.path.join(entry, "manifest.json")).st_mtime
+                nbytes = sum(os.stat(os.path.join(entry, name)).st_size for name in os.listdir(entry))
+            except OSError:
+                continue
+            entries.append((key, last_used, nbytes))
+        entries.sort(key=lambda item: item[1])
+        return entries
+
+    def size(self) -> int:
+        """Total bytes of the cached files."""
+        return sum(nbytes for _, _, nbytes in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> list[str]:
+        """Remove least recently used entries until at most ``max_bytes`` (default: the cap) remain.
+
+        Entries whose key is locked, i.e. being fetched or stored, are
+        skipped. The lock files of removed entries are deleted too. Returns
+        the keys removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with _flock(os.path.join(self.cache_dir, "evict.lock")):
+            entries = self.entries()
+            total = sum(nbytes for _, _, nbytes in entries)
+            for key, _, nbytes in entries:
+                if total <= max_bytes:
+                    break
+                with self.lock_nowait(key) as locked:
+                    if not locked:
+                        continue
+                    shutil.rmtree(self._entry(key), ignore_errors=True)
+                    # Still held, so processes waiting for it open a new lock file
+                    os.remove(self._lock_path(key))
+                total -= nbytes
+                removed.append(key)
+        return removed
+
+
+def cached_conversion(
+    cache_dir: str,
+    max_bytes: int,
+    command: str,
+    fitsfiles: Sequence[str],
+    options: dict,
+    outfile: str,
+    convert,
+    products,
+):
+    """Run ``convert()`` unless the cache in ``cache_dir`` holds its products already.
+
+    ``convert()`` performs the conversion and returns ``(outfiles, result)``,
+    the outputs written and a JSON-serializable result;
+    ``products(outfiles)`` lists every file written, see
+    ``conversion_products``. Returns ``(outfiles, result)``, from the cache
+    or from ``convert``.
+    """
+    cache = ConversionCache(cache_dir, max_bytes)
+    key = cache.key(command, fitsfiles, options)
+    with cache.lock(key):
+        hit = cache.fetch(key, outfile)
+        if hit is not None:
+            return hit
+        outfiles, result = convert()
+        # Inputs modified during the conversion would be cached under a stale key
+        if cache.key(command, fitsfiles, options) == key:
+            cache.store(key, outfile, products(outfiles), outfiles, result)
+    return outfiles, result
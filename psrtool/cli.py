@@ -2,10 +2,152 @@
 
 import argparse
 import glob
+import sys
+from contextlib import contextmanager
 from pathlib import Path
 
-from psrtool.combinefits import combinefits
-from psrtool.fits2fil import fits2fil, fil2fits
+# The converters import numpy and astropy, so each command imports its own
+# after parsing its arguments; --help and argument errors stay fast.
+from psrtool.options import (
+    CLIP_POLICIES,
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_MAX_BYTES,
+    GAP_POLICIES,
+    LAYOUTS,
+    NBITS_OUT,
+    RFI_FILLS,
+)
+from psrtool.profiling import Profiler
+
+
+def _expand_patterns(patterns: list[str]) -> list[str]:
+    """Expand glob patterns, keeping patterns without matches as literal paths."""
+    expanded_files: list[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        expanded_files.extend(matches if matches else [pattern])
+    return expanded_files
+
+
+def _add_selection_arguments(parser: argparse.ArgumentParser) -> None:
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument(
+        "--start",
+        type=float,
+        default=None,
+        help="Start of the time window to convert, in seconds from the start of the data.",
+    )
+    start.add_argument(
+        "--start-mjd",
+        type=float,
+        default=None,
+        help="Start of the time window to convert, as an MJD.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Length of the time window in seconds (default: to the end of the data).",
+    )
+    parser.add_argument(
+        "--fmin",
+        type=float,
+        default=None,
+        help="Lowest channel frequency to convert, in MHz.",
+    )
+    parser.add_argument(
+        "--fmax",
+        type=float,
+        default=None,
+        help="Highest channel frequency to convert, in MHz.",
+    )
+
+
+def _add_rfi_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--rfi-sigma",
+        type=float,
+        default=None,
+        help="Mask channels and time samples of each chunk that are outliers by this many robust "
+        "standard deviations, before downsampling.",
+    )
+    parser.add_argument(
+        "--rfi-mask",
+        default=None,
+        help="Text file listing input channel numbers (from 0) to mask in every chunk.",
+    )
+    parser.add_argument(
+        "--rfi-fill",
+        choices=RFI_FILLS,
+        default="mean",
+        help="Replace masked samples with the chunk's clean channel means (the median of them in masked channels) "
+        "or with zeros.",
+    )
+
+
+def _add_layout_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        default="time",
+        help="Write time-major SIGPROC spectra, or channel-major .npy blocks for dedispersion.",
+    )
+    parser.add_argument(
+        "--block-length",
+        type=int,
+        default=8192,
+        help="Time samples per block of channel-major output.",
+    )
+
+
+def _add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_DIR,
+        default=None,
+        metavar="DIR",
+        help="Reuse earlier conversions of the same inputs with the same options from a conversion "
+        f"cache, e.g. a directory shared between pipelines (default DIR: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=DEFAULT_CACHE_MAX_BYTES / 1024**3,
+        help="Size cap of the conversion cache in GiB; least recently used conversions are evicted.",
+    )
+
+
+def _cache_max_bytes(args: argparse.Namespace) -> int:
+    return int(args.cache_max_gb * 1024**3)
+
+
+def _add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall time, bytes and memory growth per stage and per file, and the process peak memory, to stderr.",
+    )
+    parser.add_argument(
+        "--stats-json",
+        default=None,
+        help="Write the per-stage statistics to this JSON file.",
+    )
+
+
+@contextmanager
+def _profile(args: argparse.Namespace, command: str):
+    """Profile the enclosed run if ``--profile`` or ``--stats-json`` was given."""
+    if not (args.profile or args.stats_json):
+        yield
+        return
+    profiler = Profiler(command)
+    with profiler:
+        yield
+    if args.profile:
+        print(profiler.format_report(), file=sys.stderr)
+    if args.stats_json:
+        profiler.write_json(args.stats_json)
 
 
 def combinefitscli():
@@ -37,20 +179,182 @@ def combinefitscli():
         default=1,
         help="Time sample downsampling factor.",
     )
+    parser.add_argument(
+        "-n",
+        "--nsubint-per-chunk",
+        type=int,
+        default=16,
+        help="Number of subints read per chunk; bounds peak memory.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of downsampling worker threads; 0 disables read/write overlap.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="Maximum number of chunks buffered between reading and writing.",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="JSON header index to reuse and update between runs.",
+    )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=None,
+        help="Number of threads reading input headers.",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes extracting input files in parallel.",
+    )
+    parser.add_argument(
+        "--gap-policy",
+        choices=GAP_POLICIES,
+        default="error",
+        help="How to handle gaps between files: fail, fill with zeros or the "
+        "channel median, or split into several outputs.",
+    )
+    parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="Pack 1, 2 and 4-bit input back to its original NBITS instead of 8 bits.",
+    )
+    parser.add_argument(
+        "--apply-scales",
+        action="store_true",
+        help="Apply DAT_SCL, DAT_OFFS and DAT_WTS; writes 32-bit floats unless --requantize is given.",
+    )
+    parser.add_argument(
+        "--requantize",
+        choices=CLIP_POLICIES,
+        default=None,
+        help="Round scaled data back to the input NBITS, saturating or zeroing out-of-range samples.",
+    )
+    parser.add_argument(
+        "--nbits-out",
+        type=int,
+        choices=NBITS_OUT,
+        default=None,
+        help="Output NBITS: 32 keeps averaged values as floats; fewer bits requantize each chunk "
+        "with its channel statistics.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep polling the input patterns (or directories) and append each new file's spectra "
+        "to the output as it is completed; restarts resume the existing output.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between polls for new files with --follow.",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=10.0,
+        help="Seconds a file must be unmodified before --follow reads it.",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="With --follow, stop once no new file has appeared for this many seconds.",
+    )
+    _add_selection_arguments(parser)
+    _add_rfi_arguments(parser)
+    _add_layout_arguments(parser)
+    _add_cache_arguments(parser)
+    _add_profile_arguments(parser)
 
     args = parser.parse_args()
+    if args.requantize and not args.apply_scales:
+        parser.error("--requantize requires --apply-scales")
 
-    expanded_files: list[str] = []
-    for pattern in args.fitsfiles:
-        matches = glob.glob(pattern)
-        expanded_files.extend(matches if matches else [pattern])
+    if args.follow:
+        unsupported = (
+            args.workers != 1
+            or args.cache is not None
+            or args.gap_policy == "split"
+            or args.layout != "time"
+            or args.rfi_sigma is not None
+            or args.rfi_mask is not None
+            or any(value is not None for value in (args.start, args.start_mjd, args.duration, args.fmin, args.fmax))
+        )
+        if unsupported:
+            parser.error(
+                "--follow cannot be combined with --workers, --cache, --gap-policy split, --layout channel, "
+                "RFI masking or a time or frequency selection"
+            )
+        from psrtool.combinefits import follow_combinefits, format_combine_report
 
-    combinefits(
-        expanded_files,
-        args.outfile,
-        dchan_factor=args.dchan_factor,
-        dt_factor=args.dt_factor,
-    )
+        with _profile(args, "combinefits --follow"):
+            result = follow_combinefits(
+                args.fitsfiles,
+                args.outfile,
+                dchan_factor=args.dchan_factor,
+                dt_factor=args.dt_factor,
+                nsubint_per_chunk=args.nsubint_per_chunk,
+                threads=args.threads,
+                prefetch=args.prefetch,
+                gap_policy=args.gap_policy,
+                repack=args.repack,
+                apply_scales=args.apply_scales,
+                requantize=args.requantize,
+                nbits_out=args.nbits_out,
+                poll_interval=args.poll_interval,
+                settle=args.settle,
+                idle_timeout=args.idle_timeout,
+                index_path=args.index,
+            )
+        if result.gaps:
+            print(format_combine_report(result))
+        return
+
+    from psrtool.combinefits import combinefits, format_combine_report
+
+    with _profile(args, "combinefits"):
+        result = combinefits(
+            _expand_patterns(args.fitsfiles),
+            args.outfile,
+            dchan_factor=args.dchan_factor,
+            dt_factor=args.dt_factor,
+            nsubint_per_chunk=args.nsubint_per_chunk,
+            threads=args.threads,
+            prefetch=args.prefetch,
+            index_path=args.index,
+            scan_workers=args.scan_workers,
+            gap_policy=args.gap_policy,
+            repack=args.repack,
+            apply_scales=args.apply_scales,
+            requantize=args.requantize,
+            workers=args.workers,
+            nbits_out=args.nbits_out,
+            start=args.start,
+            start_mjd=args.start_mjd,
+            duration=args.duration,
+            fmin=args.fmin,
+            fmax=args.fmax,
+            rfi_sigma=args.rfi_sigma,
+            rfi_mask=args.rfi_mask,
+            rfi_fill=args.rfi_fill,
+            layout=args.layout,
+            block_length=args.block_length,
+            cache_dir=args.cache,
+            cache_max_bytes=_cache_max_bytes(args),
+        )
+    if result.gaps:
+        print(format_combine_report(result))
 
 
 def fits2filcli():
@@ -59,13 +363,55 @@ def fits2filcli():
     )
     parser.add_argument(
         "fitsfile",
-        help="Input PSRFITS file.",
+        nargs="+",
+        help="Input PSRFITS file, or files and glob patterns with --batch.",
     )
     parser.add_argument(
         "-o",
         "--outfile",
         required=True,
-        help="Output filterbank file name.",
+        help="Output filterbank file name, or output directory with --batch.",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Convert every input file into the output directory in parallel.",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes in batch mode (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="In batch mode, reconvert files whose output is already complete.",
+    )
+    parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="Pack 1, 2 and 4-bit input back to its original NBITS instead of 8 bits.",
+    )
+    parser.add_argument(
+        "--apply-scales",
+        action="store_true",
+        help="Apply DAT_SCL, DAT_OFFS and DAT_WTS; writes 32-bit floats unless --requantize is given.",
+    )
+    parser.add_argument(
+        "--requantize",
+        choices=CLIP_POLICIES,
+        default=None,
+        help="Round scaled data back to the input NBITS, saturating or zeroing out-of-range samples.",
+    )
+    parser.add_argument(
+        "--nbits-out",
+        type=int,
+        choices=NBITS_OUT,
+        default=None,
+        help="Output NBITS: 32 keeps averaged values as floats; fewer bits requantize each chunk "
+        "with its channel statistics.",
     )
     parser.add_argument(
         "-c",
@@ -81,15 +427,101 @@ def fits2filcli():
         default=1,
         help="Time sample downsampling factor.",
     )
+    parser.add_argument(
+        "-n",
+        "--nsubint-per-chunk",
+        type=int,
+        default=16,
+        help="Number of subints read per chunk; bounds peak memory.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of downsampling worker threads; 0 disables read/write overlap.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="Maximum number of chunks buffered between reading and writing.",
+    )
+    _add_selection_arguments(parser)
+    _add_rfi_arguments(parser)
+    _add_layout_arguments(parser)
+    _add_cache_arguments(parser)
+    _add_profile_arguments(parser)
 
     args = parser.parse_args()
+    if args.requantize and not args.apply_scales:
+        parser.error("--requantize requires --apply-scales")
 
-    fits2fil(
-        args.fitsfile,
-        args.outfile,
-        dchan_factor=args.dchan_factor,
-        dt_factor=args.dt_factor,
-    )
+    selection = (args.start, args.start_mjd, args.duration, args.fmin, args.fmax)
+    if args.batch and any(value is not None for value in selection):
+        parser.error("--start, --start-mjd, --duration, --fmin and --fmax cannot be used with --batch")
+    if args.batch and args.layout != "time":
+        parser.error("--layout channel cannot be used with --batch")
+
+    if args.batch:
+        from psrtool.batch import batch_fits2fil, format_batch_report
+
+        # Files are converted in worker processes, so only the total is profiled
+        with _profile(args, "fits2fil --batch"):
+            results = batch_fits2fil(
+                _expand_patterns(args.fitsfile),
+                args.outfile,
+                dchan_factor=args.dchan_factor,
+                dt_factor=args.dt_factor,
+                workers=args.workers,
+                nsubint_per_chunk=args.nsubint_per_chunk,
+                threads=args.threads,
+                overwrite=args.overwrite,
+                repack=args.repack,
+                apply_scales=args.apply_scales,
+                requantize=args.requantize,
+                nbits_out=args.nbits_out,
+                rfi_sigma=args.rfi_sigma,
+                rfi_mask=args.rfi_mask,
+                rfi_fill=args.rfi_fill,
+                cache_dir=args.cache,
+                cache_max_bytes=_cache_max_bytes(args),
+            )
+        print(format_batch_report(results))
+        if any(result.status == "failed" for result in results):
+            sys.exit(1)
+        return
+
+    if len(args.fitsfile) != 1:
+        parser.error("exactly one input file is required without --batch")
+
+    from psrtool.fits2fil import fits2fil
+
+    with _profile(args, "fits2fil"):
+        fits2fil(
+            args.fitsfile[0],
+            args.outfile,
+            dchan_factor=args.dchan_factor,
+            dt_factor=args.dt_factor,
+            nsubint_per_chunk=args.nsubint_per_chunk,
+            threads=args.threads,
+            prefetch=args.prefetch,
+            repack=args.repack,
+            apply_scales=args.apply_scales,
+            requantize=args.requantize,
+            nbits_out=args.nbits_out,
+            start=args.start,
+            start_mjd=args.start_mjd,
+            duration=args.duration,
+            fmin=args.fmin,
+            fmax=args.fmax,
+            rfi_sigma=args.rfi_sigma,
+            rfi_mask=args.rfi_mask,
+            rfi_fill=args.rfi_fill,
+            layout=args.layout,
+            block_length=args.block_length,
+            cache_dir=args.cache,
+            cache_max_bytes=_cache_max_bytes(args),
+        )
 
 
 def fil2fitscli():
@@ -106,10 +538,110 @@ def fil2fitscli():
         required=True,
         help="Output PSRFITS file name.",
     )
+    parser.add_argument(
+        "-b",
+        "--nsblk",
+        type=int,
+        default=1024,
+        help="Number of time samples per output subint.",
+    )
+    parser.add_argument(
+        "-n",
+        "--nsubint-per-chunk",
+        type=int,
+        default=16,
+        help="Number of subints converted per chunk; bounds peak memory.",
+    )
+    _add_profile_arguments(parser)
 
     args = parser.parse_args()
 
-    fil2fits(
-        args.filfile,
-        args.outfile,
+    from psrtool.fits2fil import fil2fits
+
+    with _profile(args, "fil2fits"):
+        fil2fits(
+            args.filfile,
+            args.outfile,
+            nsblk=args.nsblk,
+            nsubint_per_chunk=args.nsubint_per_chunk,
+        )
+
+
+def fildecimatecli():
+    parser = argparse.ArgumentParser(
+        description="Downsample a filterbank (.fil) file into a new filterbank file."
     )
+    parser.add_argument(
+        "filfile",
+        help="Input filterbank file.",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        required=True,
+        help="Output filterbank file name.",
+    )
+    parser.add_argument(
+        "-c",
+        "--dchan-factor",
+        type=int,
+        default=1,
+        help="Frequency channel downsampling factor.",
+    )
+    parser.add_argument(
+        "-t",
+        "--dt-factor",
+        type=int,
+        default=1,
+        help="Time sample downsampling factor.",
+    )
+    parser.add_argument(
+        "-n",
+        "--nspectra-per-chunk",
+        type=int,
+        default=16384,
+        help="Number of input spectra read per chunk; bounds peak memory.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of downsampling worker threads; 0 disables read/write overlap.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="Maximum number of chunks buffered between reading and writing.",
+    )
+    parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="Pack 1, 2 and 4-bit input back to its original NBITS instead of 8 bits.",
+    )
+    parser.add_argument(
+        "--nbits-out",
+        type=int,
+        choices=NBITS_OUT,
+        default=None,
+        help="Output NBITS: 32 keeps averaged values as floats; fewer bits requantize each chunk "
+        "with its channel statistics.",
+    )
+    _add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    from psrtool.fits2fil import fildecimate
+
+    with _profile(args, "fildecimate"):
+        fildecimate(
+            args.filfile,
+            args.outfile,
+            dchan_factor=args.dchan_factor,
+            dt_factor=args.dt_factor,
+            nspectra_per_chunk=args.nspectra_per_chunk,
+            threads=args.threads,
+            prefetch=args.prefetch,
+            repack=args.repack,
+            nbits_out=args.nbits_out,
+        )
@@ -1,20 +1,251 @@
-
+import glob
+import os
+import threading
 import time
-import your
 import numpy as np
 
-from typing import Optional
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from typing import NamedTuple, Optional, Sequence, Union
 from astropy.io import fits
 from tqdm import tqdm
-from your.formats.filwriter import make_sigproc_object
 
 
-from .psrfits import read_fits_header, get_header_time_info, is_time_contiguous, get_stokesi_data, downsample_data
+from .index import FitsIndex, FitsMeta, check_compatible, scan_fits_headers, is_meta_contiguous, seconds_between
+from .bits import pack_bits, unpack_bits
+from .psrfits import (
+    CLIP_POLICIES,
+    iter_pol_chunks,
+    align_chunks,
+    mjd_to_seconds,
+    sample_range,
+    channel_range,
+)
+from .rfi import make_rfi_masker, rfi_mask_path
+from .blocked import BlockedSpectra, break_link, create_output, open_output, replace_output
+from .pipeline import conversion_kwargs, run_pipeline, stokesi_downsample_chunk
+from .sigproc import Filterbank, encode_header, make_header, spectrum_bytes
+from .options import DEFAULT_CACHE_MAX_BYTES, GAP_POLICIES
+from .profiling import Profiler, is_active, merge, profiled, stage
+
+
+class Gap(NamedTuple):
+    """Discontinuity between two consecutive input files.
+
+    ``seconds`` is positive for a gap and negative for an overlap. ``nsamples``
+    is the number of output samples filled in, or of input samples dropped
+    from the start of ``after`` for an overlap.
+    """
+
+    before: str
+    after: str
+    seconds: float
+    nsamples: int
+
+
+class CombineResult(NamedTuple):
+    """Output files written by ``combinefits`` and the discontinuities found."""
+
+    outfiles: list[str]
+    gaps: list[Gap]
+
+
+class _Fill(NamedTuple):
+    """Pipeline marker for ``nsamples`` output spectra of gap fill from spectrum ``offset``."""
+
+    offset: int
+    nsamples: int
+
+
+class _Part(NamedTuple):
+    """Files written to one output, with the input samples to skip and output samples to fill before each.
+
+    Each file is read up to sample ``stop``, which is short of its end only
+    for the last file of a time window.
+    """
+
+    metas: list[FitsMeta]
+    skip: list[int]
+    fill: list[int]
+    stop: list[int]
+
+
+def _plan_parts(
+    metas: list[FitsMeta], gap_policy: str, dt_factor: int, first: int = 0, stop: Optional[int] = None
+) -> tuple[list[_Part], list[Gap]]:
+    """Group time-ordered files into outputs and work out the gap fills and overlap trims.
+
+    For a time window, ``first`` samples are dropped from the start of the
+    first file and the last file is read up to sample ``stop``.
+    """
+    stops = [meta.nsamples for meta in metas]
+    if stop is not None:
+        stops[-1] = stop
+    parts = [_Part([metas[0]], [first], [0], [stops[0]])]
+    gaps: list[Gap] = []
+    part_start = metas[0]
+    # Seconds from the start of part_start to the first output sample
+    part_offset = first * metas[0].tbin
+    written = max(stops[0] - first, 0) // dt_factor
+    for prev, meta, meta_stop in zip(metas[:-1], metas[1:], stops[1:]):
+        seconds = seconds_between(prev, meta) - prev.duration
+        nsamples = round(seconds / meta.tbin)
+        if gap_policy == "error":
+            if not is_meta_contiguous(prev, meta):
+                raise ValueError(f"Files {prev.path} and {meta.path} are not time contiguous.")
+            nsamples = 0
+        skip = fill = 0
+        if nsamples < 0:
+            skip = -nsamples
+            gaps.append(Gap(prev.path, meta.path, seconds, skip))
+        elif nsamples > 0 and gap_policy == "split":
+            gaps.append(Gap(prev.path, meta.path, seconds, 0))
+            parts.append(_Part([meta], [0], [0], [meta_stop]))
+            part_start = meta
+            part_offset = 0.0
+            written = meta_stop // dt_factor
+            continue
+        elif nsamples > 0:
+            # Fill up to where this file starts on the output time grid, which
+            # also absorbs samples dropped at the ends of previous files.
+            expected = round((seconds_between(part_start, meta) - part_offset) / (meta.tbin * dt_factor))
+            fill = max(expected - written, 0)
+            gaps.append(Gap(prev.path, meta.path, seconds, fill))
+        parts[-1].metas.append(meta)
+        parts[-1].skip.append(skip)
+        parts[-1].fill.append(fill)
+        parts[-1].stop.append(meta_stop)
+        written += fill + max(meta_stop - skip, 0) // dt_factor
+    return parts, gaps
+
+
+def _window_files(
+    metas: list[FitsMeta], start: Optional[float], start_mjd: Optional[float], duration: Optional[float]
+) -> tuple[list[FitsMeta], int, int]:
+    """Keep the time-ordered files overlapping a time window, using only their headers.
+
+    ``start`` is counted from the start of the first file. Returns the kept
+    files, the first sample of the window in the first of them and the
+    sample after its end in the last.
+    """
+    ref = metas[0]
+    if start_mjd is not None:
+        start = mjd_to_seconds(start_mjd, ref.stt_imjd, ref.stt_smjd, ref.stt_offs)
+    kept = []
+    for meta in metas:
+        first, stop = sample_range(meta.nsamples, meta.tbin, start, duration, offset=seconds_between(ref, meta))
+        if stop > first:
+            kept.append((meta, first, stop))
+    if not kept:
+        raise ValueError("No input file overlaps the selected time window")
+    return [meta for meta, _, _ in kept], kept[0][1], kept[-1][2]
+
+
+class _GapFiller:
+    """Fill gaps in a preallocated output for ``_Fill`` markers.
+
+    Processed chunks are already in place in ``out``; the most recent one is
+    kept to fill the next gap with its channel median. The output starts out
+    zeroed, so zero fill needs no writes at all.
+    """
+
+    def __init__(self, out: Union[np.ndarray, BlockedSpectra], gap_policy: str, nbits: int = 8) -> None:
+        self.out = out
+        self.gap_policy = gap_policy
+        self.nbits = nbits
+        self.last: Optional[np.ndarray] = None
+
+    def __call__(self, item) -> None:
+        if not isinstance(item, _Fill):
+            self.last = item
+            return
+        if self.last is None or self.gap_policy != "median":
+            return
+        last = self.last if self.nbits >= 8 else unpack_bits(self.last, self.nbits, bitorder="little")
+        with stage("fill", item.nsamples * last[0].nbytes):
+            # Running channel median of the most recently written chunk
+            value = np.median(last, axis=0).astype(last.dtype)
+            if self.nbits < 8:
+                value = pack_bits(value, self.nbits, bitorder="little")
+            self.out[item.offset : item.offset + item.nsamples] = value
+
+
+def _process_chunk(chunk, **kwargs):
+    if isinstance(chunk, _Fill):
+        return chunk
+    return stokesi_downsample_chunk(chunk, **kwargs)
+
+
+def _part_outfile(outfile: str, index: int, nparts: int) -> str:
+    if nparts == 1:
+        return outfile
+    stem, ext = os.path.splitext(outfile)
+    return f"{stem}_{index:03d}{ext}"
 
 
-def combinefits(fitsfiles: list[str], outfile: str, dchan_factor: int = 1, dt_factor: int = 1) -> None:
+def format_combine_report(result: CombineResult) -> str:
+    """Summarise the gaps and overlaps handled by ``combinefits``."""
+    gaps = [gap for gap in result.gaps if gap.seconds > 0]
+    overlaps = [gap for gap in result.gaps if gap.seconds < 0]
+    lines = [
+        f"{len(gaps)} gap(s) totalling {sum(gap.seconds for gap in gaps):.6f} s, "
+        f"{len(overlaps)} overlap(s) totalling {-sum(gap.seconds for gap in overlaps):.6f} s"
+    ]
+    for gap in result.gaps:
+        kind = "gap" if gap.seconds > 0 else "overlap"
+        lines.append(f"{kind:>8} {abs(gap.seconds):12.6f} s  {gap.nsamples:>10} samples  {gap.before} -> {gap.after}")
+    lines.extend(f"wrote {outfile}" for outfile in result.outfiles)
+    return "\n".join(lines)
+
+
+@profiled("combinefits")
+def combinefits(
+    fitsfiles: list[str],
+    outfile: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    nsubint_per_chunk: int = 16,
+    threads: int = 1,
+    prefetch: int = 2,
+    index_path: Optional[str] = None,
+    scan_workers: Optional[int] = None,
+    gap_policy: str = "error",
+    repack: bool = False,
+    apply_scales: bool = False,
+    requantize: Optional[str] = None,
+    workers: int = 1,
+    start: Optional[float] = None,
+    start_mjd: Optional[float] = None,
+    duration: Optional[float] = None,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+    nbits_out: Optional[int] = None,
+    rfi_sigma: Optional[float] = None,
+    rfi_mask: Optional[Union[str, Sequence[int]]] = None,
+    rfi_fill: str = "mean",
+    layout: str = "time",
+    block_length: int = 8192,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+) -> CombineResult:
     """Combine multiple PSRFITS files into a single PSRFITS file.
 
+    Files are ordered by their ``STT_IMJD/STT_SMJD/STT_OFFS`` start time.
+    How discontinuities between consecutive files are handled depends on
+    ``gap_policy``: ``"error"`` raises ``ValueError``; ``"zero"`` and
+    ``"median"`` fill gaps with zeros or with the channel median of the
+    preceding chunk; ``"split"`` starts a new output file after each gap,
+    named ``<stem>_000<ext>``, ``<stem>_001<ext>`` and so on. With the last
+    three policies, samples of a file that overlap the previous one are
+    dropped.
+
+    The data are streamed: each file is read ``nsubint_per_chunk`` subints at
+    a time and downsampled into its place in the preallocated, memory-mapped
+    output, so peak memory is bounded by the chunk size rather than the total
+    observation length. Reading and downsampling are overlapped by
+    ``run_pipeline``.
+
     Parameters
     ----------
     fitsfiles : list[str]
@@ -25,49 +256,630 @@ def combinefits(fitsfiles: list[str], outfile: str, dchan_factor: int = 1, dt_fa
         Factor by which to downsample frequency channels.
     dt_factor : int
         Factor by which to downsample time samples.
+    nsubint_per_chunk : int
+        Number of subints read from an input file per chunk.
+    threads : int
+        Number of downsampling worker threads; 0 runs every stage in series.
+    prefetch : int
+        Maximum number of chunks queued between reading and writing.
+    index_path : Optional[str]
+        JSON header index (see ``psrtool.index.FitsIndex``) to reuse and
+        update, so repeated runs over the same files skip header parsing.
+    scan_workers : Optional[int]
+        Number of threads reading headers; 1 reads them in series.
+    gap_policy : str
+        One of ``"error"``, ``"zero"``, ``"median"`` or ``"split"``.
+    repack : bool
+        Pack 1, 2 and 4-bit input back to its original NBITS instead of
+        writing 8-bit samples.
+    apply_scales : bool
+        Apply each subint's DAT_SCL, DAT_OFFS and DAT_WTS, writing 32-bit
+        float samples unless ``requantize`` is given.
+    requantize : Optional[str]
+        Clipping policy (``"saturate"`` or ``"zero"``) used to round scaled
+        samples back to the input NBITS.
+    workers : int
+        Number of processes extracting input files in parallel, each into
+        its precomputed region of the output; 1 extracts them in series in
+        this process. The output is identical either way.
+    start, start_mjd : Optional[float]
+        Start of the time window to convert, in seconds from the start of
+        the earliest file or as an MJD. Files outside the window are never
+        opened for their data.
+    duration : Optional[float]
+        Length of the time window in seconds; to the end of the data if None.
+    fmin, fmax : Optional[float]
+        Frequency range in MHz of the channels to convert.
+    nbits_out : Optional[int]
+        Output NBITS; see ``psrtool.fits2fil.fits2fil``. Each chunk is
+        requantized with its own channel statistics.
+    rfi_sigma, rfi_mask, rfi_fill
+        RFI-mask each chunk before it is downsampled; see
+        ``psrtool.fits2fil.fits2fil``. Every output gets its own
+        ``<stem>.rfimask.npz`` sidecar; ``rfi_mask`` counts channels of the
+        input files.
+    layout : str
+        ``"time"`` for SIGPROC filterbank output or ``"channel"`` for
+        channel-major ``.npy`` blocks; see ``psrtool.fits2fil.fits2fil``.
+    block_length : int
+        Time samples per block of channel-major output.
+    cache_dir : Optional[str]
+        Conversion cache directory; a combination of the same files with
+        the same options is linked from it instead of being redone. See
+        ``psrtool.fits2fil.fits2fil``.
+    cache_max_bytes : int
+        Size cap of the conversion cache.
+
+    Returns
+    -------
+    CombineResult
+        Output files written and the gaps and overlaps between inputs.
     """
+    if nsubint_per_chunk < 1:
+        raise ValueError("nsubint_per_chunk must be >= 1")
+    if gap_policy not in GAP_POLICIES:
+        raise ValueError(f"gap_policy must be one of {', '.join(GAP_POLICIES)}")
+    if requantize is not None and requantize not in CLIP_POLICIES:
+        raise ValueError(f"requantize must be one of {', '.join(CLIP_POLICIES)}")
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    if start is not None and start_mjd is not None:
+        raise ValueError("Give at most one of start and start_mjd")
+
+    if cache_dir is not None:
+        options = dict(
+            dchan_factor=dchan_factor,
+            dt_factor=dt_factor,
+            nsubint_per_chunk=nsubint_per_chunk,
+            gap_policy=gap_policy,
+            repack=repack,
+            apply_scales=apply_scales,
+            requantize=requantize,
+            start=start,
+            start_mjd=start_mjd,
+            duration=duration,
+            fmin=fmin,
+            fmax=fmax,
+            nbits_out=nbits_out,
+            rfi_sigma=rfi_sigma,
+            rfi_mask=rfi_mask,
+            rfi_fill=rfi_fill,
+            layout=layout,
+            block_length=block_length,
+        )
+
+        def convert():
+            result = combinefits(
+                fitsfiles,
+                outfile,
+                threads=threads,
+                prefetch=prefetch,
+                index_path=index_path,
+                scan_workers=scan_workers,
+                workers=workers,
+                **options,
+            )
+            return result.outfiles, {"gaps": [list(gap) for gap in result.gaps]}
+
+        from .cache import cached_conversion, conversion_products
+
+        masked = rfi_sigma is not None or rfi_mask is not None
+        outfiles, result = cached_conversion(
+            cache_dir, cache_max_bytes, "combinefits", fitsfiles, options, outfile, convert,
+            partial(conversion_products, layout=layout, rfi=masked),
+        )
+        return CombineResult(outfiles, [Gap(*gap) for gap in result["gaps"]])
+
+    # Every file's headers are read once, up front; nothing below reopens them
+    with stage("scan_headers"):
+        metas = scan_fits_headers(fitsfiles, workers=scan_workers, index_path=index_path)
+    metas.sort(key=lambda meta: (meta.stt_imjd, meta.stt_smjd, meta.stt_offs, meta.path))
+    check_compatible(metas)
+    first, stop = 0, None
+    if start is not None or start_mjd is not None or duration is not None:
+        metas, first, stop = _window_files(metas, start, start_mjd, duration)
+    parts, gaps = _plan_parts(metas, gap_policy, dt_factor, first, stop)
+
+    outfiles = []
+    for ipart, part in enumerate(parts):
+        partfile = _part_outfile(outfile, ipart, len(parts))
+        outfiles.append(partfile)
+        _combine_part(
+            part,
+            partfile,
+            dchan_factor,
+            dt_factor,
+            nsubint_per_chunk,
+            threads,
+            prefetch,
+            gap_policy,
+            repack,
+            apply_scales,
+            requantize,
+            workers,
+            fmin,
+            fmax,
+            nbits_out,
+            rfi_sigma,
+            rfi_mask,
+            rfi_fill,
+            layout,
+            block_length,
+        )
+    return CombineResult(outfiles, gaps)
 
-    sorted_files = sorted(fitsfiles)
-    combined_data = []
-    for i, fitsfile in enumerate(sorted_files):
-        if i > 0:
-            if not is_time_contiguous(sorted_files[i - 1], fitsfile):
-                raise ValueError(f"Files {sorted_files[i - 1]} and {fitsfile} are not time contiguous.")
-
-    for fitsfile in tqdm(sorted_files, desc="Combining PSRFITS files"):
-        data = get_stokesi_data(fitsfile)
-        if dchan_factor > 1 or dt_factor > 1:
-            data = downsample_data(data, dchan_factor=dchan_factor, dt_factor=dt_factor)
-        combined_data.append(data)
-    
-    combined_data_array = np.vstack(combined_data)
-
-    # Write combined data to new PSRFITS file
-    baseheader0, baseheader1 = read_fits_header(sorted_files[0])
-    ntime, nchan = combined_data_array.shape
-    nbit = baseheader1["NBITS"]
-    bw = baseheader0["OBSBW"]
-    centerfreq = baseheader0["OBSFREQ"]
-    foff = baseheader1["CHAN_BW"] * dchan_factor #type: ignore
-    fch1 = centerfreq - (bw / 2) if foff > 0 else centerfreq + (bw / 2)  #type: ignore
-    tsamp = baseheader1["TBIN"] * dt_factor  #type: ignore
-    ra_deg, dec_deg = baseheader0["RA"], baseheader0["DEC"]
-    mjd_start = baseheader0["STT_IMJD"] + baseheader0["STT_SMJD"] / 86400.0 + baseheader0["STT_OFFS"] / 86400.0  #type: ignore
-
-    sig = make_sigproc_object(
+
+def _part_header(
+    part: _Part,
+    outfile: str,
+    dchan_factor: int,
+    dt_factor: int,
+    repack: bool,
+    apply_scales: bool,
+    requantize: Optional[str],
+    nbits_out: Optional[int],
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+) -> tuple[dict, tuple[int, int], int, dict]:
+    """Build the filterbank header of one output part.
+
+    Returns the header, the range of input channels converted, the output
+    NBITS and the ``stokesi_downsample_chunk`` arguments of the conversion.
+    """
+    base = part.metas[0]
+    bw = base.obsbw
+    centerfreq = base.obsfreq
+    foff = base.chan_bw * dchan_factor
+    fch1 = centerfreq - (bw / 2) if foff > 0 else centerfreq + (bw / 2)
+    channels = channel_range(fch1, base.chan_bw, base.nchan, fmin, fmax)
+    fch1 += channels[0] * base.chan_bw
+    nchan = (channels[1] - channels[0]) // dchan_factor
+    nbit, conversion = conversion_kwargs(base.nbits, repack, apply_scales, requantize, nbits_out)
+    if nbit < 8 and (nchan * nbit) % 8:
+        raise ValueError(f"Cannot pack {nchan} channels of {nbit}-bit samples into whole bytes")
+    tsamp = base.tbin * dt_factor
+    # Only the first file of a part can be trimmed, by a time window
+    mjd_start = base.start_mjd + part.skip[0] * base.tbin / 86400.0
+
+    header = make_header(
         rawdatafile=outfile,
-        source_name=baseheader0["SRC_NAME"], #type: ignore
+        source_name=base.src_name,
         nchans=nchan,
         foff=foff,
         fch1=fch1,
         tsamp=tsamp,
         tstart=mjd_start,
-        nbits=nbit, #type: ignore
+        nbits=nbit,
         nifs=1,
     )
-    sig.write_header(outfile)
-    sig.append_spectra(combined_data_array, outfile)
-    # print(f"[OK] Combined PSRFITS written to {outfile}")
+    return header, channels, nbit, conversion
+
+
+def _combine_part(
+    part: _Part,
+    outfile: str,
+    dchan_factor: int,
+    dt_factor: int,
+    nsubint_per_chunk: int,
+    threads: int,
+    prefetch: int,
+    gap_policy: str,
+    repack: bool,
+    apply_scales: bool,
+    requantize: Optional[str],
+    workers: int,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+    nbits_out: Optional[int] = None,
+    rfi_sigma: Optional[float] = None,
+    rfi_mask: Optional[Union[str, Sequence[int]]] = None,
+    rfi_fill: str = "mean",
+    layout: str = "time",
+    block_length: int = 8192,
+) -> None:
+    """Write the files of one output part, with their fills and trims."""
+    base = part.metas[0]
+    header, channels, nbit, conversion = _part_header(
+        part, outfile, dchan_factor, dt_factor, repack, apply_scales, requantize, nbits_out, fmin, fmax
+    )
+    # Output offset of each file's first spectrum, after the fill before it
+    offsets = []
+    nspectra = 0
+    for skip, fill, stop in zip(part.skip, part.fill, part.stop):
+        nspectra += fill
+        offsets.append(nspectra)
+        nspectra += max(stop - skip, 0) // dt_factor
+    rfi = make_rfi_masker(base.nchan, channels, nspectra * dt_factor, rfi_sigma, rfi_mask, rfi_fill)
+    process_kwargs = dict(dchan_factor=dchan_factor, dt_factor=dt_factor, rfi=rfi, **conversion)
+
+    def chunks():
+        for meta, skip, fill, stop, offset in tqdm(
+            list(zip(part.metas, part.skip, part.fill, part.stop, offsets)), desc="Combining PSRFITS files"
+        ):
+            if fill:
+                yield _Fill(offset - fill, fill)
+            yield from _file_chunks(
+                meta.path, skip, stop, offset, nsubint_per_chunk, apply_scales, dt_factor, channels
+            )
+
+    # Every chunk is downsampled straight into its place in the preallocated
+    # output, which is only moved into place once it is complete
+    partfile = outfile + ".part"
+    fil, out = create_output(partfile, header, nspectra, layout, block_length)
+    try:
+        if workers > 1:
+            _combine_parallel(
+                part, partfile, out, offsets, nsubint_per_chunk, apply_scales, channels, process_kwargs,
+                gap_policy, nbit, workers, threads, prefetch, layout,
+            )
+        else:
+            run_pipeline(
+                chunks(),
+                partial(_process_chunk, out=out, **process_kwargs),
+                _GapFiller(out, gap_policy, nbit),
+                threads=threads,
+                prefetch=prefetch,
+            )
+    finally:
+        with stage("flush", file=outfile):
+            fil.close()
+    replace_output(partfile, outfile, layout)
+    if rfi is not None:
+        rfi.save(
+            rfi_mask_path(outfile),
+            fch1=header["fch1"],
+            chan_bw=base.chan_bw,
+            tsamp=base.tbin,
+            tstart=header["tstart"],
+        )
+
+
+def _file_chunks(
+    path: str,
+    skip: int,
+    stop: int,
+    offset: int,
+    nsubint_per_chunk: int,
+    apply_scales: bool,
+    dt_factor: int,
+    channels: Optional[tuple[int, int]] = None,
+):
+    """Yield the aligned chunks of samples ``[skip, stop)`` of one input file, indexed by their place in the output.
+
+    Chunks are aligned per file: a partial ``dt_factor`` block at the end of a
+    file is dropped rather than merged with the next file.
+    """
+    file_chunks = iter_pol_chunks(path, nsubint_per_chunk, apply_scales, (min(skip, stop), stop), channels)
+    for start, block in align_chunks(file_chunks, dt_factor):
+        yield offset * dt_factor + start, block
+
+
+def _extract_file(
+    partfile: str,
+    path: str,
+    skip: int,
+    stop: int,
+    offset: int,
+    nsubint_per_chunk: int,
+    apply_scales: bool,
+    channels: Optional[tuple[int, int]],
+    process_kwargs: dict,
+    threads: int,
+    prefetch: int,
+    profile: bool = False,
+    layout: str = "time",
+) -> tuple[Optional[tuple[int, int]], Optional[list[dict]], Optional[list]]:
+    """Downsample one input file into its region of a preallocated output.
+
+    Runs in a worker process. Returns the output rows of the file's last
+    chunk, from which the serial path would take a median gap fill, with
+    ``profile`` the stage records for the parent's profiler, and the chunk
+    flags of the RFI masker, if any.
+    """
+    dt_factor = process_kwargs["dt_factor"]
+    last = None
+
+    def chunks():
+        nonlocal last
+        for start, block in _file_chunks(
+            path, skip, stop, offset, nsubint_per_chunk, apply_scales, dt_factor, channels
+        ):
+            last = (start // dt_factor, (start + block.shape[0]) // dt_factor)
+            yield start, block
+
+    profiler = Profiler(report=False) if profile else None
+    with profiler or nullcontext():
+        fil, out = open_output(partfile, layout)
+        with fil:
+            run_pipeline(
+                chunks(),
+                partial(stokesi_downsample_chunk, out=out, **process_kwargs),
+                threads=threads,
+                prefetch=prefetch,
+            )
+    rfi = process_kwargs.get("rfi")
+    return last, profiler.summary()["stages"] if profiler else None, rfi.records() if rfi else None
+
+
+def _combine_parallel(
+    part: _Part,
+    partfile: str,
+    out: Union[np.ndarray, BlockedSpectra],
+    offsets: list[int],
+    nsubint_per_chunk: int,
+    apply_scales: bool,
+    channels: tuple[int, int],
+    process_kwargs: dict,
+    gap_policy: str,
+    nbit: int,
+    workers: int,
+    threads: int,
+    prefetch: int,
+    layout: str = "time",
+) -> None:
+    """Extract every file of a part in its own worker process, then fill the gaps.
+
+    Each worker maps the output file and writes its file's region directly,
+    so the result is byte-identical to the serial path.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _extract_file, partfile, meta.path, skip, stop, offset, nsubint_per_chunk, apply_scales, channels,
+                process_kwargs, threads, prefetch, is_active(), layout,
+            )
+            for meta, skip, stop, offset in zip(part.metas, part.skip, part.stop, offsets)
+        ]
+        for _ in tqdm(as_completed(futures), total=len(futures), desc="Combining PSRFITS files"):
+            pass
+        lasts = []
+        for future in futures:
+            last, stages, rfi_records = future.result()
+            merge(stages)
+            if process_kwargs.get("rfi") is not None:
+                process_kwargs["rfi"].merge(rfi_records)
+            lasts.append(last)
 
+    # Gap fills depend on the data before them, so they are written in order
+    filler = _GapFiller(out, gap_policy, nbit)
+    for fill, offset, last in zip(part.fill, offsets, lasts):
+        if fill:
+            filler(_Fill(offset - fill, fill))
+        if last is not None:
+            filler(out[last[0] : last[1]])
 
 
+def _follow_paths(patterns: list[str]) -> list[str]:
+    """Expand glob patterns and directories (meaning ``<dir>/*.fits``) into the files they match now."""
+    paths: set[str] = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.fits")
+        paths.update(glob.glob(pattern))
+    return sorted(paths)
+
+
+class _Follower:
+    """State of ``follow_combinefits`` between polls: the files seen and the spectra written."""
+
+    def __init__(self, outfile: str, settle: float, index_path: Optional[str], **options) -> None:
+        self.outfile = outfile
+        self.settle = settle
+        self.index = FitsIndex(index_path)
+        self.options = options
+        self.metas: dict[str, FitsMeta] = {}
+        self.appended: list[str] = []
+        self.gaps: list[Gap] = []
+        self.hdrbytes = 0
+        self.row_bytes = 0
+        self.nsblk = 1
+        # Spectra in the output; -1 until it is created or resumed
+        self.written = -1
+
+    def _ready(self, patterns: list[str]) -> list[FitsMeta]:
+        """Read the headers of new files that have not been modified for ``settle`` seconds."""
+        now = time.time()
+        new = []
+        for path in _follow_paths(patterns):
+            if path in self.metas:
+                continue
+            try:
+                if now - os.path.getmtime(path) < self.settle:
+                    continue
+                meta = self.index.get(path)
+            except Exception:
+                # A file still being written may not parse yet; try again next poll
+                continue
+            if meta.nsamples == 0:
+                continue
+            new.append(meta)
+        return new
+
+    def _open(self, header: dict) -> None:
+        """Start the output, or resume it from the number of whole spectra already in the file."""
+        header_bytes = encode_header(header)
+        self.row_bytes = spectrum_bytes(header)
+        self.hdrbytes = len(header_bytes)
+        if os.path.exists(self.outfile):
+            break_link(self.outfile)
+            with open(self.outfile, "rb") as f:
+                if f.read(len(header_bytes)) != header_bytes:
+                    raise ValueError(f"{self.outfile} was not written from these input files with these options")
+            self.written = (os.path.getsize(self.outfile) - self.hdrbytes) // self.row_bytes
+        else:
+            outdir = os.path.dirname(self.outfile)
+            if outdir:
+                os.makedirs(outdir, exist_ok=True)
+            with open(self.outfile, "wb") as f:
+                f.write(header_bytes)
+            self.written = 0
+
+    def _fill_value(self, nbit: int, nsamples: int) -> bytes:
+        """Bytes of ``nsamples`` spectra of gap fill after what has been written."""
+        if self.options["gap_policy"] != "median" or self.written == 0:
+            return bytes(nsamples * self.row_bytes)
+        nlast = max(1, self.options["nsubint_per_chunk"] * self.nsblk // self.options["dt_factor"])
+        with Filterbank(self.outfile) as fil:
+            last = fil.get_spectra(max(self.written - nlast, 0), nlast)
+            value = np.median(last, axis=0).astype(last.dtype)
+        if nbit < 8:
+            value = pack_bits(value, nbit, bitorder="little")
+        return value.tobytes() * nsamples
+
+    def poll(self, patterns: list[str]) -> bool:
+        """Append the spectra of newly completed files; return whether there were any."""
+        new = self._ready(patterns)
+        if not new:
+            return False
+        for meta in new:
+            self.metas[meta.path] = meta
+        metas = sorted(self.metas.values(), key=lambda meta: (meta.stt_imjd, meta.stt_smjd, meta.stt_offs, meta.path))
+        if [meta.path for meta in metas[: len(self.appended)]] != self.appended:
+            late = next(meta.path for meta in metas if meta.path not in self.appended)
+            raise ValueError(f"{late} starts before data already appended to {self.outfile}")
+        check_compatible(metas)
+        opts = self.options
+        dt_factor = opts["dt_factor"]
+        parts, self.gaps = _plan_parts(metas, opts["gap_policy"], dt_factor)
+        part = parts[0]
+        header, channels, nbit, conversion = _part_header(
+            part, self.outfile, opts["dchan_factor"], dt_factor, opts["repack"], opts["apply_scales"],
+            opts["requantize"], opts["nbits_out"],
+        )
+        if self.written < 0:
+            self._open(header)
+        self.nsblk = metas[0].nsblk
+        process_kwargs = dict(dchan_factor=opts["dchan_factor"], dt_factor=dt_factor, **conversion)
+
+        offset = 0
+        with open(self.outfile, "r+b") as f:
+            # Drop a partly written spectrum left by an interrupted run
+            f.truncate(self.hdrbytes + self.written * self.row_bytes)
+            f.seek(0, os.SEEK_END)
+            for meta, skip, fill, stop in zip(part.metas, part.skip, part.fill, part.stop):
+                offset += fill
+                end = offset + max(stop - skip, 0) // dt_factor
+                if end > self.written:
+                    if self.written < offset:
+                        with stage("fill", (offset - self.written) * self.row_bytes):
+                            f.write(self._fill_value(nbit, offset - self.written))
+                        self.written = offset
+                    # Resume a file an interrupted run only wrote part of
+                    first = skip + (self.written - offset) * dt_factor
+                    appended = []
+
+                    def append(block: np.ndarray) -> None:
+                        with stage("write", block.nbytes, self.outfile):
+                            f.write(block.tobytes())
+                        appended.append(block.shape[0])
+
+                    run_pipeline(
+                        _file_chunks(
+                            meta.path, first, stop, self.written, opts["nsubint_per_chunk"], opts["apply_scales"],
+                            dt_factor, channels,
+                        ),
+                        partial(stokesi_downsample_chunk, **process_kwargs),
+                        append,
+                        threads=opts["threads"],
+                        prefetch=opts["prefetch"],
+                    )
+                    f.flush()
+                    self.written += sum(appended)
+                if meta.path not in self.appended:
+                    self.appended.append(meta.path)
+                offset = end
+        self.index.save()
+        return True
+
+
+def follow_combinefits(
+    patterns: list[str],
+    outfile: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    nsubint_per_chunk: int = 16,
+    threads: int = 1,
+    prefetch: int = 2,
+    gap_policy: str = "error",
+    repack: bool = False,
+    apply_scales: bool = False,
+    requantize: Optional[str] = None,
+    nbits_out: Optional[int] = None,
+    poll_interval: float = 10.0,
+    settle: float = 10.0,
+    idle_timeout: Optional[float] = None,
+    index_path: Optional[str] = None,
+    stop: Optional[threading.Event] = None,
+) -> CombineResult:
+    """Combine PSRFITS files into a filterbank file as they appear, e.g. during an observation.
+
+    ``patterns`` (glob patterns, or directories meaning ``<dir>/*.fits``)
+    are polled every ``poll_interval`` seconds. A file counts as complete
+    once it has not been modified for ``settle`` seconds; each new file is
+    checked for contiguity against the files before it with the same
+    ``gap_policy`` rules as ``combinefits`` and its downsampled spectra are
+    appended to ``outfile`` without rereading the earlier files. The output
+    is the same as ``combinefits`` over the same files, except that a
+    ``"median"`` gap fill takes the median of the last ``nsubint_per_chunk``
+    subints' worth of spectra already written. A file that turns up
+    after later files have been appended raises ``ValueError``.
+
+    The output is only ever appended to, in order, so a run that was
+    interrupted can be restarted with the same arguments: the number of
+    spectra already written is recovered from the file size, a partly
+    written spectrum is dropped, and conversion resumes where it stopped.
+
+    Parameters
+    ----------
+    patterns : list[str]
+        Glob patterns or directories of the input files.
+    outfile : str
+        Output filterbank file path, created or resumed.
+    dchan_factor, dt_factor, nsubint_per_chunk, threads, prefetch
+        As for ``combinefits``.
+    gap_policy : str
+        ``"error"``, ``"zero"`` or ``"median"``; a growing output cannot be
+        split.
+    repack, apply_scales, requantize, nbits_out
+        As for ``combinefits``.
+    poll_interval : float
+        Seconds between polls for new files.
+    settle : float
+        Seconds a file must be unmodified before it is read.
+    idle_timeout : Optional[float]
+        Return once no new file has appeared for this many seconds; None
+        follows until ``stop`` is set (or the process is interrupted).
+    index_path : Optional[str]
+        JSON header index to reuse and update.
+    stop : Optional[threading.Event]
+        Event that ends following after the current poll.
+
+    Returns
+    -------
+    CombineResult
+        The output file and the gaps and overlaps between the inputs.
+    """
+    if nsubint_per_chunk < 1:
+        raise ValueError("nsubint_per_chunk must be >= 1")
+    if gap_policy not in GAP_POLICIES or gap_policy == "split":
+        raise ValueError("gap_policy must be one of error, zero, median when following")
+    if requantize is not None and requantize not in CLIP_POLICIES:
+        raise ValueError(f"requantize must be one of {', '.join(CLIP_POLICIES)}")
+
+    follower = _Follower(
+        outfile, settle, index_path, dchan_factor=dchan_factor, dt_factor=dt_factor,
+        nsubint_per_chunk=nsubint_per_chunk, threads=threads, prefetch=prefetch, gap_policy=gap_policy,
+        repack=repack, apply_scales=apply_scales, requantize=requantize, nbits_out=nbits_out,
+    )
+    last_new = time.monotonic()
+    while True:
+        if follower.poll(patterns):
+            last_new = time.monotonic()
+        elif idle_timeout is not None and time.monotonic() - last_new >= idle_timeout:
+            break
+        if stop is not None:
+            if stop.wait(poll_interval):
+                break
+        else:
+            time.sleep(poll_interval)
+    return CombineResult([outfile], follower.gaps)
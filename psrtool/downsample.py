@@ -0,0 +1,244 @@
+import numpy as np
+
+from typing import Optional
+
+
+def accumulator_dtype(dtype: np.dtype, count: int) -> np.dtype:
+    """Return the narrowest dtype that can hold a sum of ``count`` values.
+
+    Parameters
+    ----------
+    dtype : np.dtype
+        Dtype of the values being summed.
+    count : int
+        Number of values contributing to each sum.
+
+    Returns
+    -------
+    np.dtype
+        An integer dtype of the same signedness for integer input, or
+        float32 (or the input dtype, if wider) for floating point input.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.promote_types(dtype, np.float32)
+    if dtype.kind not in "ui":
+        raise TypeError(f"Unsupported dtype for downsampling: {dtype}")
+    info = np.iinfo(dtype)
+    for candidate in (np.dtype(f"{dtype.kind}{size}") for size in (2, 4, 8)):
+        cinfo = np.iinfo(candidate)
+        if candidate.itemsize >= dtype.itemsize and info.max * count <= cinfo.max and info.min * count >= cinfo.min:
+            return candidate
+    raise OverflowError(f"Cannot accumulate {count} values of {dtype} without overflow")
+
+
+def _is_exact(dtype: np.dtype, dchan_factor: int, dt_factor: int) -> bool:
+    """Whether integer accumulation reproduces the float64 two-stage mean.
+
+    The reference averages channels in float64, then time samples, then
+    truncates. When the channel mean is exact in binary floating point (a
+    power of two ``dchan_factor``) or only one stage runs, that equals
+    truncating the exact integer mean. Values too wide for any integer
+    accumulator, e.g. 64-bit, also take the reference path.
+    """
+    if np.dtype(dtype).kind not in "ui":
+        return False
+    try:
+        accumulator_dtype(dtype, dchan_factor * dt_factor)
+    except OverflowError:
+        return False
+    if dchan_factor == 1 or dt_factor == 1:
+        return True
+    return dchan_factor & (dchan_factor - 1) == 0
+
+
+def _reference_downsample(data: np.ndarray, dchan_factor: int, dt_factor: int) -> np.ndarray:
+    """Two-stage ``mean`` downsampling, used where it cannot be done exactly in integers."""
+    dtype = data.dtype
+    if dchan_factor > 1:
+        ntime, nchan = data.shape
+        nchan_ds = nchan // dchan_factor
+        data = data[:, :nchan_ds * dchan_factor].reshape(ntime, nchan_ds, dchan_factor).mean(axis=2)
+    if dt_factor > 1:
+        ntime, nchan = data.shape
+        ntime_ds = ntime // dt_factor
+        data = data[:ntime_ds * dt_factor, :].reshape(ntime_ds, dt_factor, nchan).mean(axis=1)
+    return data.astype(dtype)
+
+
+def _blocked_view(data: np.ndarray, dchan_factor: int, dt_factor: int) -> np.ndarray:
+    """View ``data`` as (ntime_ds, dt_factor, nchan_ds, dchan_factor) without copying."""
+    ntime, nchan = data.shape
+    ntime_ds = ntime // dt_factor
+    nchan_ds = nchan // dchan_factor
+    data = data[:ntime_ds * dt_factor].reshape(ntime_ds, dt_factor, nchan)
+    return data[:, :, :nchan_ds * dchan_factor].reshape(ntime_ds, dt_factor, nchan_ds, dchan_factor)
+
+
+def downsample(
+    data: np.ndarray,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    out: Optional[np.ndarray] = None,
+    acc: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Downsample data in frequency and time in a single pass.
+
+    Channels and time samples are summed together in the narrowest safe
+    accumulator (see ``accumulator_dtype``) and divided once, so uint8 data
+    is never promoted to float64. Trailing channels and samples that do not
+    fill a whole block are dropped. The result is identical to averaging
+    channels and then samples in float64 and casting back to the input
+    dtype, as ``psrtool.psrfits.downsample_data`` always has.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Input data array with shape (ntime, nchan).
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    out : Optional[np.ndarray]
+        Array of shape (ntime // dt_factor, nchan // dchan_factor) and the
+        input dtype to write the result into.
+    acc : Optional[np.ndarray]
+        Scratch array of the same shape as the output and the accumulator
+        dtype, reused between calls to avoid allocating it.
+
+    Returns
+    -------
+    np.ndarray
+        Downsampled data array (``out`` if given).
+    """
+    if dchan_factor < 1 or dt_factor < 1:
+        raise ValueError("dchan_factor and dt_factor must be >= 1")
+    ntime, nchan = data.shape
+    shape = (ntime // dt_factor, nchan // dchan_factor)
+    if out is not None and (out.shape != shape or out.dtype != data.dtype):
+        raise ValueError(f"out must have shape {shape} and dtype {data.dtype}")
+
+    if dchan_factor == 1 and dt_factor == 1:
+        if out is None:
+            return data.copy()
+        out[...] = data
+        return out
+
+    if not _is_exact(data.dtype, dchan_factor, dt_factor):
+        # Floating point data is averaged in its own precision, so the
+        # reference path does not promote it.
+        result = _reference_downsample(data, dchan_factor, dt_factor)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    count = dchan_factor * dt_factor
+    acc_dtype = accumulator_dtype(data.dtype, count)
+    if acc is None or acc.shape != shape or acc.dtype != acc_dtype:
+        acc = np.empty(shape, dtype=acc_dtype)
+    np.add.reduce(_blocked_view(data, dchan_factor, dt_factor), axis=(1, 3), dtype=acc_dtype, out=acc)
+    if out is None:
+        out = np.empty(shape, dtype=data.dtype)
+    if data.dtype.kind == "u":
+        np.floor_divide(acc, count, out=out, casting="unsafe")
+    else:
+        # Truncate towards zero, as the float -> int cast of the mean does
+        negative = acc < 0
+        np.abs(acc, out=acc)
+        np.floor_divide(acc, count, out=acc)
+        np.negative(acc, out=acc, where=negative)
+        np.copyto(out, acc, casting="unsafe")
+    return out
+
+
+class Downsampler:
+    """Streaming downsampler that is exact across chunk boundaries.
+
+    Time samples left over at the end of a chunk that do not fill a whole
+    ``dt_factor`` block are kept and prepended to the next chunk, so feeding
+    a stream chunk by chunk gives the same result as downsampling it in one
+    piece. The accumulator buffer is reused between chunks of equal size.
+
+    Parameters
+    ----------
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    """
+
+    def __init__(self, dchan_factor: int = 1, dt_factor: int = 1) -> None:
+        if dchan_factor < 1 or dt_factor < 1:
+            raise ValueError("dchan_factor and dt_factor must be >= 1")
+        self.dchan_factor = dchan_factor
+        self.dt_factor = dt_factor
+        self.tail: Optional[np.ndarray] = None
+        self._acc: Optional[np.ndarray] = None
+
+    def reset(self) -> None:
+        """Discard the carried-over samples, e.g. at the end of a file."""
+        self.tail = None
+
+    @property
+    def ntail(self) -> int:
+        """Number of input samples currently carried over."""
+        return 0 if self.tail is None else self.tail.shape[0]
+
+    def output_length(self, ntime: int) -> int:
+        """Number of output samples produced by the next ``ntime`` input samples."""
+        return (self.ntail + ntime) // self.dt_factor
+
+    def _scratch(self, shape: tuple[int, int], dtype: np.dtype) -> Optional[np.ndarray]:
+        """Return a reusable accumulator buffer, or None if none is needed."""
+        if (self.dchan_factor == 1 and self.dt_factor == 1) or not _is_exact(dtype, self.dchan_factor, self.dt_factor):
+            return None
+        acc_dtype = accumulator_dtype(dtype, self.dchan_factor * self.dt_factor)
+        if self._acc is None or self._acc.shape != shape or self._acc.dtype != acc_dtype:
+            self._acc = np.empty(shape, dtype=acc_dtype)
+        return self._acc
+
+    def process(self, block: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Downsample the next chunk of the stream.
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Next input chunk with shape (ntime, nchan).
+        out : Optional[np.ndarray]
+            Array of shape (output_length(ntime), nchan // dchan_factor) to
+            write the result into.
+
+        Returns
+        -------
+        np.ndarray
+            Downsampled samples completed by this chunk (``out`` if given).
+        """
+        ntime, nchan = block.shape
+        shape = (self.output_length(ntime), nchan // self.dchan_factor)
+        if out is None:
+            out = np.empty(shape, dtype=block.dtype)
+        elif out.shape != shape:
+            raise ValueError(f"out must have shape {shape}")
+
+        start = 0
+        row = 0
+        if self.ntail:
+            # Complete the carried-over block with the head of this chunk
+            need = self.dt_factor - self.ntail
+            if ntime < need:
+                self.tail = np.concatenate([self.tail, block])
+                return out
+            head = np.concatenate([self.tail, block[:need]])
+            downsample(head, self.dchan_factor, self.dt_factor, out=out[:1])
+            start = need
+            row = 1
+
+        nuse = (ntime - start) // self.dt_factor * self.dt_factor
+        if nuse:
+            body = block[start:start + nuse]
+            acc = self._scratch(out[row:].shape, block.dtype)
+            downsample(body, self.dchan_factor, self.dt_factor, out=out[row:], acc=acc)
+        rest = block[start + nuse:]
+        self.tail = rest.copy() if rest.shape[0] else None
+        return out
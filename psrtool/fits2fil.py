@@ -1,37 +1,173 @@
 import os
 import numpy as np
 
-from your import Your
-from your.formats.filwriter import make_sigproc_object
-from your.writer import Writer
+from functools import partial
+from typing import Optional, Sequence, Union
 
-from .psrfits import read_fits_header, get_stokesi_data, downsample_data
 
+from .psrfits import (
+    CLIP_POLICIES,
+    read_fits_header,
+    iter_pol_chunks,
+    align_chunks,
+    mjd_to_seconds,
+    sample_range,
+    channel_range,
+)
+from .rfi import make_rfi_masker, rfi_mask_path
+from .blocked import create_output, replace_output
+from .pipeline import conversion_kwargs, run_pipeline, stokesi_downsample_chunk
+from .fitswriter import PsrfitsWriter, split_mjd
+from .sigproc import Filterbank, create_filterbank, make_header, psrfits_samples, sigproc_to_sexagesimal
+from .options import DEFAULT_CACHE_MAX_BYTES
+from .profiling import profiled, stage
 
-def fits2fil(fitsfile: str, outfile: str, dchan_factor: int = 1, dt_factor: int = 1) -> None:
-    """Convert a PSRFITS file to a filterbank (.fil) file, optionally downsampling."""
+
+@profiled("fits2fil")
+def fits2fil(
+    fitsfile: str,
+    outfile: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    nsubint_per_chunk: int = 16,
+    threads: int = 1,
+    prefetch: int = 2,
+    repack: bool = False,
+    apply_scales: bool = False,
+    requantize: Optional[str] = None,
+    start: Optional[float] = None,
+    start_mjd: Optional[float] = None,
+    duration: Optional[float] = None,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+    nbits_out: Optional[int] = None,
+    rfi_sigma: Optional[float] = None,
+    rfi_mask: Optional[Union[str, Sequence[int]]] = None,
+    rfi_fill: str = "mean",
+    layout: str = "time",
+    block_length: int = 8192,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+) -> None:
+    """Convert a PSRFITS file to a filterbank (.fil) file, optionally downsampling.
+
+    The file is streamed ``nsubint_per_chunk`` subints at a time, so it may be
+    larger than the available memory, and each chunk is downsampled straight
+    into a preallocated, memory-mapped output file. Reading, downsampling and writing are
+    overlapped by ``run_pipeline`` with ``threads`` worker threads and up to
+    ``prefetch`` queued chunks; ``threads=0`` runs them in series.
+
+    1, 2 and 4-bit input is unpacked and written as 8-bit samples, or packed
+    back to its original NBITS if ``repack`` is set.
+
+    With ``apply_scales``, each subint's DAT_SCL, DAT_OFFS and DAT_WTS are
+    applied and the output is 32-bit float, unless ``requantize`` names a
+    clipping policy (see ``psrtool.psrfits.requantize``) to round the
+    samples back to the input NBITS with.
+
+    Only the ``duration`` seconds from ``start`` seconds into the file (or
+    from MJD ``start_mjd``) and the channels between ``fmin`` and ``fmax``
+    MHz are converted; subints outside the window are never read. The
+    header's ``tstart``, ``fch1`` and ``nchans`` describe the selection.
+
+    ``nbits_out`` sets the output NBITS: 32 averages in float32 and keeps
+    the fractional part of downsampled values, while fewer bits than the
+    data would otherwise have are reached by requantizing each chunk with
+    its channel means and standard deviations (see
+    ``psrtool.psrfits.requantize_block``) and packing the result.
+
+    With ``rfi_sigma`` or ``rfi_mask``, each chunk is RFI-masked at full
+    resolution before it is downsampled (see ``psrtool.rfi.RfiMasker``):
+    outlier channels and time samples beyond ``rfi_sigma`` robust standard
+    deviations, and the channels listed in ``rfi_mask``, are replaced
+    according to ``rfi_fill``. The flags are written next to the output as
+    ``<stem>.rfimask.npz``.
+
+    With ``layout="channel"``, the output is a channel-major ``.npy`` file
+    of ``block_length``-sample blocks (see ``psrtool.blocked.BlockedSpectra``)
+    instead of SIGPROC spectra; each chunk is transposed into place in
+    cache-sized tiles as it is written.
+
+    With ``cache_dir``, the conversion goes through the conversion cache in
+    that directory (see ``psrtool.cache.ConversionCache``): if the same
+    file was converted with the same options before, the cached output
+    and sidecars are hard linked to ``outfile`` instead, and a new
+    conversion is stored there, keeping at most ``cache_max_bytes``. The
+    header's ``rawdatafile`` then names the output the entry was made for.
+    """
     if dchan_factor < 1 or dt_factor < 1:
         raise ValueError("dchan_factor and dt_factor must be >= 1")
+    if nsubint_per_chunk < 1:
+        raise ValueError("nsubint_per_chunk must be >= 1")
+    if requantize is not None and requantize not in CLIP_POLICIES:
+        raise ValueError(f"requantize must be one of {', '.join(CLIP_POLICIES)}")
+    if start is not None and start_mjd is not None:
+        raise ValueError("Give at most one of start and start_mjd")
 
     outdir = os.path.dirname(outfile)
     if outdir:
         os.makedirs(outdir, exist_ok=True)
 
+    if cache_dir is not None:
+        options = dict(
+            dchan_factor=dchan_factor,
+            dt_factor=dt_factor,
+            nsubint_per_chunk=nsubint_per_chunk,
+            repack=repack,
+            apply_scales=apply_scales,
+            requantize=requantize,
+            start=start,
+            start_mjd=start_mjd,
+            duration=duration,
+            fmin=fmin,
+            fmax=fmax,
+            nbits_out=nbits_out,
+            rfi_sigma=rfi_sigma,
+            rfi_mask=rfi_mask,
+            rfi_fill=rfi_fill,
+            layout=layout,
+            block_length=block_length,
+        )
+
+        def convert():
+            fits2fil(fitsfile, outfile, threads=threads, prefetch=prefetch, **options)
+            return [outfile], {}
+
+        from .cache import cached_conversion, conversion_products
+
+        masked = rfi_sigma is not None or rfi_mask is not None
+        cached_conversion(
+            cache_dir, cache_max_bytes, "fits2fil", [fitsfile], options, outfile, convert,
+            partial(conversion_products, layout=layout, rfi=masked),
+        )
+        return
+
     header0, header1 = read_fits_header(fitsfile)
-    bw = header0["OBSBW"]
+    bw = abs(header0["OBSBW"])  # type: ignore
     centerfreq = header0["OBSFREQ"]
     foff = header1["CHAN_BW"] * dchan_factor  # type: ignore
     fch1 = centerfreq - (bw / 2) if foff > 0 else centerfreq + (bw / 2) # type: ignore
     tsamp = header1["TBIN"] * dt_factor  # type: ignore
-    nchan = int(header1["NCHAN"]) // dchan_factor # type: ignore
-    nbit = int(header1["NBITS"]) # type: ignore
+    channels = channel_range(fch1, header1["CHAN_BW"], int(header1["NCHAN"]), fmin, fmax)  # type: ignore
+    fch1 += channels[0] * header1["CHAN_BW"]  # type: ignore
+    nchan = (channels[1] - channels[0]) // dchan_factor
+    nbit_in = int(header1["NBITS"])  # type: ignore
+    nbit, process_kwargs = conversion_kwargs(nbit_in, repack, apply_scales, requantize, nbits_out)
+    if nbit < 8 and (nchan * nbit) % 8:
+        raise ValueError(f"Cannot pack {nchan} channels of {nbit}-bit samples into whole bytes")
     mjd_start = (
         header0["STT_IMJD"]  # type: ignore
         + header0["STT_SMJD"] / 86400.0  # type: ignore
         + header0["STT_OFFS"] / 86400.0  # type: ignore
     )
+    if start_mjd is not None:
+        start = mjd_to_seconds(start_mjd, header0["STT_IMJD"], header0["STT_SMJD"], header0["STT_OFFS"])  # type: ignore
+    samples = sample_range(int(header1["NAXIS2"]) * int(header1["NSBLK"]), header1["TBIN"], start, duration)  # type: ignore
+    if samples[1] - samples[0] < dt_factor:
+        raise ValueError(f"No complete samples of {fitsfile} in the selected time window")
+    mjd_start += samples[0] * header1["TBIN"] / 86400.0  # type: ignore
 
-    sig = make_sigproc_object(
+    header = make_header(
         rawdatafile=outfile,
         source_name=header0["SRC_NAME"], # type: ignore
         nchans=nchan,
@@ -42,19 +178,50 @@ def fits2fil(fitsfile: str, outfile: str, dchan_factor: int = 1, dt_factor: int
         nbits=nbit,
         nifs=1,
     )
-    sig.write_header(outfile)
+    nspectra = (samples[1] - samples[0]) // dt_factor
+    rfi = make_rfi_masker(
+        int(header1["NCHAN"]), channels, nspectra * dt_factor, rfi_sigma, rfi_mask, rfi_fill  # type: ignore
+    )
 
-    data = get_stokesi_data(fitsfile)
-    if dchan_factor > 1 or dt_factor > 1:
-        data = downsample_data(data, dchan_factor=dchan_factor, dt_factor=dt_factor)
+    # Chunks are downsampled straight into the preallocated output, which is
+    # only moved into place once it is complete
+    partfile = outfile + ".part"
+    fil, out = create_output(partfile, header, nspectra, layout, block_length)
+    try:
+        run_pipeline(
+            align_chunks(iter_pol_chunks(fitsfile, nsubint_per_chunk, apply_scales, samples, channels), dt_factor),
+            partial(
+                stokesi_downsample_chunk,
+                dchan_factor=dchan_factor,
+                dt_factor=dt_factor,
+                out=out,
+                rfi=rfi,
+                **process_kwargs,
+            ),
+            threads=threads,
+            prefetch=prefetch,
+        )
+    finally:
+        with stage("flush", file=outfile):
+            fil.close()
+    replace_output(partfile, outfile, layout)
+    if rfi is not None:
+        rfi.save(rfi_mask_path(outfile), fch1=fch1, chan_bw=header1["CHAN_BW"], tsamp=header1["TBIN"], tstart=mjd_start)
 
-    sig.append_spectra(data, outfile)
 
+@profiled("fil2fits")
+def fil2fits(filfile: str, outfile: str, nsblk: int = 1024, nsubint_per_chunk: int = 16) -> None:
+    """Convert filterbank file to a PSRFITS file.
 
-def fil2fits(filfile: str, outfile: str) -> None:
-    """Convert filterbank file to a PSRFITS file."""
+    The filterbank is memory-mapped and read ``nsubint_per_chunk * nsblk``
+    spectra at a time, and written as SUBINT rows of ``nsblk`` samples by ``PsrfitsWriter``, so
+    peak memory is bounded by the chunk size. A partial last subint is padded
+    with zeros. Unsigned 16-bit samples are offset by -32768 into PSRFITS's
+    signed ones, which ``fits2fil`` undoes.
+    """
+    if nsblk < 1 or nsubint_per_chunk < 1:
+        raise ValueError("nsblk and nsubint_per_chunk must be >= 1")
 
-    y = Your(filfile)
     outdir, filename = os.path.split(outfile)
     outdir = outdir.rstrip("/") or "."
     os.makedirs(outdir, exist_ok=True)
@@ -63,6 +230,148 @@ def fil2fits(filfile: str, outfile: str) -> None:
     if not outname:
         outname = os.path.splitext(os.path.basename(filfile))[0]
 
-    npsub = getattr(y, "native_nspectra", None) or y.your_header.nspectra
-    writer = Writer(your_object=y, outdir=outdir, outname=outname, nsamp=npsub)
-    writer.to_fits(npsub=1024)
+    with Filterbank(filfile) as fil:
+        nchan = fil.nchans
+        foff = fil.foff
+        stt_imjd, stt_smjd, stt_offs = split_mjd(fil.tstart)
+        with PsrfitsWriter(
+            os.path.join(outdir, outname + ".fits"),
+            nchan=nchan,
+            nsblk=nsblk,
+            tbin=fil.tsamp,
+            # fch1 is the band edge OBSFREQ -/+ OBSBW / 2 for an ascending/descending
+            # band, as fits2fil assumes when converting back
+            obsfreq=fil.fch1 + nchan * foff / 2,
+            obsbw=abs(nchan * foff),
+            chan_bw=foff,
+            nbits=fil.nbits,
+            stt_imjd=stt_imjd,
+            stt_smjd=stt_smjd,
+            stt_offs=stt_offs,
+            src_name=fil.source_name,
+            ra=sigproc_to_sexagesimal(fil.header.get("src_raj")),
+            dec=sigproc_to_sexagesimal(fil.header.get("src_dej"), sign=True),
+            dat_freq=fil.fch1 + np.arange(nchan) * foff,
+        ) as writer:
+            chunk = nsblk * nsubint_per_chunk
+            for start in range(0, fil.nspectra, chunk):
+                with stage("read", fil.data[start : start + chunk].nbytes, filfile):
+                    spectra = fil.get_spectra(start, chunk)
+                with stage("write", spectra.nbytes, writer.fitsfile):
+                    # 16-bit PSRFITS samples are signed
+                    writer.write_spectra(psrfits_samples(spectra))
+
+
+def _iter_fil_chunks(fil: Filterbank, nspectra_per_chunk: int, nspectra: int):
+    """Yield (start, block) chunks of the first ``nspectra`` spectra as (nsamp, 1, nchans) blocks."""
+    for start in range(0, nspectra, nspectra_per_chunk):
+        stop = min(start + nspectra_per_chunk, nspectra)
+        # The data are memory-mapped, so the disk is read while they are copied
+        with stage("read", fil.data[start:stop].nbytes, fil.filfile):
+            block = fil.get_spectra(start, stop - start)
+            if fil.nbits >= 8:
+                block = np.array(block)
+        yield start, block[:, np.newaxis, :]
+
+
+@profiled("fildecimate")
+def fildecimate(
+    filfile: str,
+    outfile: str,
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    nspectra_per_chunk: int = 16384,
+    threads: int = 1,
+    prefetch: int = 2,
+    repack: bool = False,
+    nbits_out: Optional[int] = None,
+) -> None:
+    """Downsample a filterbank file into a new filterbank file.
+
+    The input is streamed ``nspectra_per_chunk`` spectra at a time through
+    the same downsampling as ``fits2fil``, into a preallocated,
+    memory-mapped output, so peak memory is bounded by the chunk size
+    whatever the file size. Reading, downsampling and writing are overlapped
+    by ``run_pipeline`` with ``threads`` worker threads and up to
+    ``prefetch`` queued chunks; ``threads=0`` runs them in series.
+    Decimating the output of ``fits2fil`` gives the same data as converting
+    with the combined factors directly; 16-bit samples are averaged as the
+    unsigned values SIGPROC files hold, which ``fits2fil`` offsets signed
+    PSRFITS samples to before averaging.
+
+    The header is copied with ``nchans``, ``foff`` and ``tsamp`` (and
+    ``nbits``) updated; ``fch1`` and ``tstart`` are kept. A trailing
+    remainder of fewer than ``dt_factor`` spectra is dropped.
+
+    Parameters
+    ----------
+    filfile : str
+        Input filterbank file with a single IF.
+    outfile : str
+        Output filterbank file path.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    nspectra_per_chunk : int
+        Number of input spectra per chunk, rounded down to a multiple of
+        ``dt_factor``.
+    threads : int
+        Number of downsampling worker threads; 0 runs every stage in series.
+    prefetch : int
+        Maximum number of chunks queued between reading and writing.
+    repack : bool
+        Pack 1, 2 and 4-bit input back to its original NBITS instead of
+        writing 8-bit samples.
+    nbits_out : Optional[int]
+        Output NBITS; see ``fits2fil``.
+    """
+    if dchan_factor < 1 or dt_factor < 1:
+        raise ValueError("dchan_factor and dt_factor must be >= 1")
+    if nspectra_per_chunk < 1:
+        raise ValueError("nspectra_per_chunk must be >= 1")
+
+    outdir = os.path.dirname(outfile)
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+
+    with Filterbank(filfile) as fil:
+        if fil.nifs != 1:
+            raise ValueError(f"{filfile} has {fil.nifs} IFs; only single-IF filterbanks can be decimated")
+        nchan = fil.nchans // dchan_factor
+        if nchan < 1:
+            raise ValueError(f"Cannot downsample {fil.nchans} channels by {dchan_factor}")
+        nbit, process_kwargs = conversion_kwargs(fil.nbits, repack, nbits_out=nbits_out)
+        if nbit < 8 and (nchan * nbit) % 8:
+            raise ValueError(f"Cannot pack {nchan} channels of {nbit}-bit samples into whole bytes")
+        nspectra = fil.nspectra // dt_factor
+        header = dict(
+            fil.header,
+            rawdatafile=outfile,
+            nchans=nchan,
+            foff=fil.foff * dchan_factor,
+            tsamp=fil.tsamp * dt_factor,
+            nbits=nbit,
+        )
+        if "nsamples" in header:
+            header["nsamples"] = nspectra
+
+        partfile = outfile + ".part"
+        out = create_filterbank(partfile, header, nspectra)
+        try:
+            run_pipeline(
+                _iter_fil_chunks(fil, max(nspectra_per_chunk // dt_factor, 1) * dt_factor, nspectra * dt_factor),
+                partial(
+                    stokesi_downsample_chunk,
+                    dchan_factor=dchan_factor,
+                    dt_factor=dt_factor,
+                    out=out.data,
+                    **process_kwargs,
+                ),
+                threads=threads,
+                prefetch=prefetch,
+            )
+        finally:
+            with stage("flush", file=outfile):
+                out.close()
+    os.replace(partfile, outfile)
@@ -0,0 +1,302 @@
+import numpy as np
+
+from datetime import datetime, timezone
+from typing import Optional
+from astropy.io import fits
+from astropy.time import Time
+
+from .bits import pack_bits
+
+
+# FITS blocks are 2880 bytes; headers are padded with spaces, data with zeros
+_BLOCK = 2880
+
+# DATA column formats by NBITS for byte-sized and larger samples
+DATA_FORMATS = {8: ("B", np.uint8), 16: ("I", np.int16), 32: ("E", np.float32)}
+
+_POL_TYPES = {1: "AA+BB", 2: "AABB", 4: "AABBCRCI"}
+
+
+def split_mjd(mjd: float) -> tuple[int, int, float]:
+    """Split an MJD into the STT_IMJD, STT_SMJD and STT_OFFS header values."""
+    stt_imjd = int(mjd)
+    seconds = (mjd - stt_imjd) * 24 * 3600.0
+    stt_smjd = int(seconds)
+    return stt_imjd, stt_smjd, seconds - stt_smjd
+
+
+class PsrfitsWriter:
+    """Write a search-mode PSRFITS file one SUBINT row at a time.
+
+    The primary and SUBINT headers are written when the file is opened, rows
+    are appended as big-endian bytes as they arrive and ``close`` patches the
+    final row count into the SUBINT header, so memory use is bounded by the
+    rows being written rather than the length of the observation. Spectra
+    passed to ``write_spectra`` are buffered until a full subint of ``nsblk``
+    samples is available; a partial last subint is padded with zeros.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Output PSRFITS file path.
+    nchan : int
+        Number of frequency channels.
+    nsblk : int
+        Number of time samples per SUBINT row.
+    tbin : float
+        Sampling time in seconds.
+    obsfreq : float
+        Centre frequency in MHz.
+    obsbw : float
+        Bandwidth in MHz, written as its magnitude; negative for a
+        descending band unless ``chan_bw`` gives the direction.
+    nbits : int
+        Bits per sample: 1, 2, 4, 8, 16 or 32. Samples of fewer than 8 bits
+        are given unpacked and packed most significant bits first.
+    npol : int
+        Number of polarizations.
+    stt_imjd, stt_smjd, stt_offs : int, int, float
+        Start day, second and fractional second.
+    src_name : str
+        Source name.
+    ra, dec : str
+        Source position as ``hh:mm:ss.ssss`` and ``dd:mm:ss.ssss`` strings.
+    telescope : str
+        Telescope name.
+    dat_freq : Optional[np.ndarray]
+        Channel centre frequencies in MHz; by default ``nchan`` channels
+        evenly spread over ``obsbw`` around ``obsfreq``.
+    chan_bw : Optional[float]
+        Channel width in MHz, negative for a descending band; by default
+        ``obsbw / nchan``.
+    """
+
+    def __init__(
+        self,
+        fitsfile: str,
+        nchan: int,
+        nsblk: int,
+        tbin: float,
+        obsfreq: float,
+        obsbw: float,
+        nbits: int = 8,
+        npol: int = 1,
+        stt_imjd: int = 0,
+        stt_smjd: int = 0,
+        stt_offs: float = 0.0,
+        src_name: str = "",
+        ra: str = "00:00:00.0000",
+        dec: str = "+00:00:00.0000",
+        telescope: str = "Unknown",
+        dat_freq: Optional[np.ndarray] = None,
+        chan_bw: Optional[float] = None,
+    ) -> None:
+        if nbits not in (1, 2, 4) and nbits not in DATA_FORMATS:
+            raise ValueError(f"Unsupported NBITS value: {nbits}")
+        if nsblk < 1:
+            raise ValueError("nsblk must be >= 1")
+        if nbits < 8 and (nsblk * npol * nchan * nbits) % 8:
+            raise ValueError(f"Cannot pack a subint of {nchan} channels of {nbits}-bit samples into whole bytes")
+        self.fitsfile = fitsfile
+        self.nchan = nchan
+        self.nsblk = nsblk
+        self.npol = npol
+        self.nbits = nbits
+        self.tbin = tbin
+        self.nsubint = 0
+
+        if chan_bw is None:
+            chan_bw = obsbw / nchan
+        # OBSBW is positive, as readers (and fits2fil) expect; CHAN_BW carries the direction
+        obsbw = abs(obsbw)
+        if dat_freq is None:
+            dat_freq = obsfreq - chan_bw * nchan / 2 + chan_bw * (np.arange(nchan) + 0.5)
+        self._dat_freq = np.asarray(dat_freq, dtype=np.float32)
+
+        mjd = stt_imjd + (stt_smjd + stt_offs) / (24 * 3600.0)
+        header0 = fits.Header()
+        header0["HDRVER"] = ("6.1", "Header version")
+        header0["FITSTYPE"] = ("PSRFITS", "FITS definition for pulsar data files")
+        header0["DATE"] = (
+            datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+            "File creation date (YYYY-MM-DDThh:mm:ss UTC)",
+        )
+        header0["OBSERVER"] = ("Unknown", "Observer name(s)")
+        header0["PROJID"] = ("Unknown", "Project name")
+        header0["TELESCOP"] = (telescope, "Telescope name")
+        header0["FRONTEND"] = ("Unknown", "Rx and feed ID")
+        header0["NRCVR"] = (1, "Number of receiver polarisation channels")
+        header0["FD_POLN"] = ("LIN", "LIN or CIRC")
+        header0["BACKEND"] = ("psrtool", "Backend ID")
+        header0["OBS_MODE"] = ("SEARCH", "(PSR, CAL, SEARCH)")
+        header0["DATE-OBS"] = (
+            Time(mjd, format="mjd").isot.split(".")[0],
+            "Date of observation (YYYY-MM-DDThh:mm:ss UTC)",
+        )
+        header0["OBSFREQ"] = (obsfreq, "[MHz] Centre frequency for observation")
+        header0["OBSBW"] = (obsbw, "[MHz] Bandwidth for observation")
+        header0["OBSNCHAN"] = (nchan, "Number of frequency channels (original)")
+        header0["CHAN_DM"] = (0.0, "DM used to de-disperse each channel (pc/cm^3)")
+        header0["SRC_NAME"] = (src_name, "Source or scan ID")
+        header0["COORD_MD"] = ("J2000", "Coordinate mode (J2000, GAL, ECLIP, etc.)")
+        header0["EQUINOX"] = (2000.0, "Equinox of coords (e.g. 2000.0)")
+        header0["RA"] = (ra, "Right ascension (hh:mm:ss.ssss)")
+        header0["DEC"] = (dec, "Declination (-dd:mm:ss.sss)")
+        header0["BMAJ"] = (0.0, "[deg] Beam major axis length")
+        header0["BMIN"] = (0.0, "[deg] Beam minor axis length")
+        header0["BPA"] = (0.0, "[deg] Beam position angle")
+        header0["STT_CRD1"] = (ra, "Start coord 1 (hh:mm:ss.sss or ddd.ddd)")
+        header0["STT_CRD2"] = (dec, "Start coord 2 (-dd:mm:ss.sss or -dd.ddd)")
+        header0["TRK_MODE"] = ("TRACK", "Track mode (TRACK, SCANGC, SCANLAT)")
+        header0["STP_CRD1"] = (ra, "Stop coord 1 (hh:mm:ss.sss or ddd.ddd)")
+        header0["STP_CRD2"] = (dec, "Stop coord 2 (-dd:mm:ss.sss or -dd.ddd)")
+        header0["SCANLEN"] = (0.0, "[s] Requested scan length (E)")
+        header0["FD_MODE"] = ("FA", "Feed track mode - FA, CPA, SPA, TPA")
+        header0["CAL_MODE"] = ("OFF", "Cal mode (OFF, SYNC, EXT1, EXT2)")
+        header0["STT_IMJD"] = (stt_imjd, "Start MJD (UTC days) (J - long integer)")
+        header0["STT_SMJD"] = (stt_smjd, "[s] Start time (sec past UTC 00h) (J)")
+        header0["STT_OFFS"] = (stt_offs, "[s] Start time offset (D)")
+        header0["STT_LST"] = (0.0, "[s] Start LST (D)")
+
+        if nbits < 8:
+            row_bytes = nsblk * npol * nchan * nbits // 8
+            data_format = f"{row_bytes}B"
+            dim = f"({nchan * nbits // 8}, {npol}, {nsblk})"
+        else:
+            code, _ = DATA_FORMATS[nbits]
+            data_format = f"{nsblk * npol * nchan}{code}"
+            dim = f"({nchan}, {npol}, {nsblk})"
+        columns = [
+            fits.Column(name="TSUBINT", format="1D", unit="s"),
+            fits.Column(name="OFFS_SUB", format="1D", unit="s"),
+            fits.Column(name="LST_SUB", format="1D", unit="s"),
+            fits.Column(name="RA_SUB", format="1D", unit="deg"),
+            fits.Column(name="DEC_SUB", format="1D", unit="deg"),
+            fits.Column(name="GLON_SUB", format="1D", unit="deg"),
+            fits.Column(name="GLAT_SUB", format="1D", unit="deg"),
+            fits.Column(name="FD_ANG", format="1E", unit="deg"),
+            fits.Column(name="POS_ANG", format="1E", unit="deg"),
+            fits.Column(name="PAR_ANG", format="1E", unit="deg"),
+            fits.Column(name="TEL_AZ", format="1E", unit="deg"),
+            fits.Column(name="TEL_ZEN", format="1E", unit="deg"),
+            fits.Column(name="DAT_FREQ", format=f"{nchan}E", unit="MHz"),
+            fits.Column(name="DAT_WTS", format=f"{nchan}E"),
+            fits.Column(name="DAT_OFFS", format=f"{npol * nchan}E"),
+            fits.Column(name="DAT_SCL", format=f"{npol * nchan}E"),
+            fits.Column(name="DATA", format=data_format, dim=dim),
+        ]
+        subint = fits.BinTableHDU.from_columns(columns, nrows=0, name="SUBINT")
+        header1 = subint.header
+        header1["INT_TYPE"] = ("TIME", "Time axis (TIME, BINPHSPERI, BINLNGASC, etc)")
+        header1["INT_UNIT"] = ("SEC", "Unit of time axis (SEC, PHS (0-1), DEG)")
+        header1["SCALE"] = ("FluxDen", "Intensity units (FluxDen/RefFlux/Jansky)")
+        header1["NPOL"] = (npol, "Nr of polarisations")
+        header1["POL_TYPE"] = (_POL_TYPES.get(npol, "AABBCRCI"), "Polarisation identifier (e.g., AABBCRCI, AA+BB)")
+        header1["TBIN"] = (tbin, "[s] Time per bin or sample")
+        header1["NBIN"] = (1, "Nr of bins (PSR/CAL mode; else 1)")
+        header1["NBITS"] = (nbits, "Nr of bits/datum (SEARCH mode 'X' data, else 1)")
+        header1["NSUBOFFS"] = (0, "Subint offset (Contiguous SEARCH-mode files)")
+        header1["NCHAN"] = (nchan, "Number of channels/sub-bands in this file")
+        header1["CHAN_BW"] = (chan_bw, "[MHz] Channel/sub-band width")
+        header1["NCHNOFFS"] = (0, "Channel/sub-band offset for split files")
+        header1["NSBLK"] = (nsblk, "Samples/row (SEARCH mode, else 1)")
+
+        # FITS tables are big-endian; the row layout must match NAXIS1 exactly
+        self._row_dtype = subint.data.dtype.newbyteorder(">")
+        if self._row_dtype.itemsize != header1["NAXIS1"]:
+            raise RuntimeError("SUBINT row layout does not match NAXIS1")
+        self._header0 = fits.PrimaryHDU(header=header0).header
+        self._header1 = header1
+        self._pending: list[np.ndarray] = []
+        self._npending = 0
+
+        self._fp = open(fitsfile, "wb")
+        self._fp.write(self._header0.tostring().encode("ascii"))
+        self._data_offset = self._fp.tell() + len(header1.tostring())
+        self._fp.write(header1.tostring().encode("ascii"))
+
+    def __enter__(self) -> "PsrfitsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def write_subints(
+        self,
+        data: np.ndarray,
+        dat_scl: Optional[np.ndarray] = None,
+        dat_offs: Optional[np.ndarray] = None,
+        dat_wts: Optional[np.ndarray] = None,
+    ) -> None:
+        """Append whole SUBINT rows.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Samples with shape (nrows, nsblk, npol, nchan).
+        dat_scl, dat_offs : Optional[np.ndarray]
+            Per-row scales and offsets with shape (nrows, npol * nchan);
+            default to 1 and 0.
+        dat_wts : Optional[np.ndarray]
+            Per-row channel weights with shape (nrows, nchan); default to 1.
+        """
+        if self._npending:
+            raise RuntimeError("write_subints cannot follow a partial subint from write_spectra")
+        nrows = data.shape[0]
+        rows = np.zeros(nrows, dtype=self._row_dtype)
+        offs_sub = (self.nsubint + np.arange(nrows) + 0.5) * self.nsblk * self.tbin
+        rows["TSUBINT"] = self.nsblk * self.tbin
+        rows["OFFS_SUB"] = offs_sub
+        rows["DAT_FREQ"] = self._dat_freq
+        rows["DAT_WTS"] = 1 if dat_wts is None else dat_wts
+        rows["DAT_OFFS"] = 0 if dat_offs is None else dat_offs
+        rows["DAT_SCL"] = 1 if dat_scl is None else dat_scl
+        if self.nbits < 8:
+            packed = pack_bits(data.reshape(nrows, -1), self.nbits)
+            rows["DATA"] = packed.reshape(rows["DATA"].shape)
+        else:
+            rows["DATA"] = data.reshape(rows["DATA"].shape)
+        self._fp.write(rows.tobytes())
+        self.nsubint += nrows
+
+    def write_spectra(self, spectra: np.ndarray) -> None:
+        """Append total intensity spectra with shape (ntime, nchan).
+
+        Full subints are written immediately; the remainder is kept until more
+        spectra arrive or the writer is closed.
+        """
+        if self.npol != 1:
+            raise ValueError("write_spectra requires npol == 1")
+        if self._npending:
+            self._pending.append(spectra)
+            spectra = np.concatenate(self._pending)
+            self._pending = []
+            self._npending = 0
+        nfull = spectra.shape[0] // self.nsblk * self.nsblk
+        if nfull:
+            self.write_subints(spectra[:nfull].reshape(-1, self.nsblk, 1, self.nchan))
+        if nfull < spectra.shape[0]:
+            self._pending.append(spectra[nfull:].copy())
+            self._npending = spectra.shape[0] - nfull
+
+    def close(self) -> None:
+        """Flush any partial subint, pad the file and fix up the row count."""
+        if self._fp.closed:
+            return
+        if self._npending:
+            tail = np.concatenate(self._pending)
+            self._pending = []
+            self._npending = 0
+            padded = np.zeros((self.nsblk, self.nchan), dtype=tail.dtype)
+            padded[: tail.shape[0]] = tail
+            self.write_subints(padded.reshape(1, self.nsblk, 1, self.nchan))
+        ndata = self._fp.tell() - self._data_offset
+        self._fp.write(b"\0" * (-ndata % _BLOCK))
+
+        # Patch the row count and scan length now that they are known
+        self._header1["NAXIS2"] = self.nsubint
+        self._header0["SCANLEN"] = self.nsubint * self.nsblk * self.tbin
+        self._fp.seek(0)
+        self._fp.write(self._header0.tostring().encode("ascii"))
+        self._fp.write(self._header1.tostring().encode("ascii"))
+        self._fp.close()
@@ -0,0 +1,258 @@
+import json
+import os
+import threading
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from .psrfits import read_fits_header, get_header_time_info
+
+
+INDEX_VERSION = 1
+
+
+class FitsMeta(NamedTuple):
+    """Header metadata of one PSRFITS file, as stored in a ``FitsIndex``.
+
+    ``size`` and ``mtime_ns`` identify the version of the file the metadata
+    was read from. Times are MJD days except ``duration`` and ``tbin``,
+    which are in seconds.
+    """
+
+    path: str
+    size: int
+    mtime_ns: int
+    start_mjd: float
+    duration: float
+    stt_imjd: int
+    stt_smjd: int
+    stt_offs: float
+    nsubint: int
+    nsblk: int
+    nchan: int
+    npol: int
+    nbits: int
+    tbin: float
+    chan_bw: float
+    obsfreq: float
+    obsbw: float
+    src_name: str
+    ra: str
+    dec: str
+
+    @property
+    def end_mjd(self) -> float:
+        """MJD just after the last sample of the file."""
+        return self.start_mjd + self.duration / 86400.0
+
+    @property
+    def nsamples(self) -> int:
+        """Number of time samples in the file."""
+        return self.nsubint * self.nsblk
+
+
+def _stat(fitsfile: str) -> tuple[int, int]:
+    st = os.stat(fitsfile)
+    return st.st_size, st.st_mtime_ns
+
+
+def read_fits_meta(fitsfile: str) -> FitsMeta:
+    """Read the metadata of a PSRFITS file, parsing its headers once.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Path to the PSRFITS file.
+
+    Returns
+    -------
+    FitsMeta
+        Metadata of the file.
+    """
+    size, mtime_ns = _stat(fitsfile)
+    header0, header1 = read_fits_header(fitsfile)
+    start_mjd, duration = get_header_time_info(header0, header1)
+    return FitsMeta(
+        path=fitsfile,
+        size=size,
+        mtime_ns=mtime_ns,
+        start_mjd=float(start_mjd),
+        duration=float(duration),
+        stt_imjd=int(header0["STT_IMJD"]),  # type: ignore
+        stt_smjd=int(header0["STT_SMJD"]),  # type: ignore
+        stt_offs=float(header0["STT_OFFS"]),  # type: ignore
+        nsubint=int(header1["NAXIS2"]),  # type: ignore
+        nsblk=int(header1["NSBLK"]),  # type: ignore
+        nchan=int(header1["NCHAN"]),  # type: ignore
+        npol=int(header1["NPOL"]),  # type: ignore
+        nbits=int(header1["NBITS"]),  # type: ignore
+        tbin=float(header1["TBIN"]),  # type: ignore
+        chan_bw=float(header1["CHAN_BW"]),  # type: ignore
+        obsfreq=float(header0["OBSFREQ"]),  # type: ignore
+        obsbw=float(header0["OBSBW"]),  # type: ignore
+        src_name=str(header0["SRC_NAME"]),
+        ra=str(header0["RA"]),
+        dec=str(header0["DEC"]),
+    )
+
+
+def seconds_between(meta1: FitsMeta, meta2: FitsMeta) -> float:
+    """Seconds from the start of ``meta1`` to the start of ``meta2``.
+
+    Computed from the integer day and second parts of the start times, so it
+    keeps sub-microsecond precision that the MJD floats lose.
+    """
+    return (
+        (meta2.stt_imjd - meta1.stt_imjd) * 86400.0
+        + (meta2.stt_smjd - meta1.stt_smjd)
+        + (meta2.stt_offs - meta1.stt_offs)
+    )
+
+
+def is_meta_contiguous(meta1: FitsMeta, meta2: FitsMeta) -> bool:
+    """Check if two indexed PSRFITS files are contiguous in time.
+
+    Same test as ``psrtool.psrfits.is_time_contiguous``, without reading any
+    headers.
+    """
+    return bool(np.isclose(meta1.end_mjd, meta2.start_mjd, rtol=0.0, atol=1e-10))
+
+
+def check_compatible(metas: list[FitsMeta]) -> None:
+    """Raise ``ValueError`` unless the files share the channel and sampling setup of the first."""
+    base = metas[0]
+    for meta in metas[1:]:
+        for field in ("nchan", "nbits", "tbin", "chan_bw", "obsfreq", "obsbw"):
+            if getattr(meta, field) != getattr(base, field):
+                raise ValueError(f"Files {base.path} and {meta.path} differ in {field.upper()}.")
+
+
+class FitsIndex:
+    """Header metadata index for a collection of PSRFITS files.
+
+    Each file's headers are read at most once; later lookups are served from
+    memory and, if ``path`` is given, from a JSON index on disk that persists
+    between runs. An entry is reused only while the file's size and
+    modification time are unchanged.
+
+    Parameters
+    ----------
+    path : Optional[str]
+        Path of the on-disk index. It is loaded if it exists and written by
+        ``save``.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._entries: dict[str, FitsMeta] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        with open(path) as f:
+            try:
+                content = json.load(f)
+            except json.JSONDecodeError:
+                return
+        if content.get("version") != INDEX_VERSION:
+            return
+        for key, fields in content.get("files", {}).items():
+            try:
+                self._entries[key] = FitsMeta(**fields)
+            except TypeError:
+                continue
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, fitsfile: str) -> FitsMeta:
+        """Return the metadata of ``fitsfile``, reading its headers if the entry is stale.
+
+        Parameters
+        ----------
+        fitsfile : str
+            Path to the PSRFITS file.
+
+        Returns
+        -------
+        FitsMeta
+            Metadata of the file; ``path`` is the path as given.
+        """
+        key = os.path.abspath(fitsfile)
+        size, mtime_ns = _stat(fitsfile)
+        with self._lock:
+            meta = self._entries.get(key)
+        if meta is not None and meta.size == size and meta.mtime_ns == mtime_ns:
+            return meta._replace(path=fitsfile)
+        meta = read_fits_meta(fitsfile)
+        with self._lock:
+            self._entries[key] = meta._replace(path=key)
+            self._dirty = True
+        return meta
+
+    def scan(self, fitsfiles: list[str], workers: Optional[int] = None) -> list[FitsMeta]:
+        """Return the metadata of several files, reading stale entries in parallel.
+
+        Parameters
+        ----------
+        fitsfiles : list[str]
+            Paths to the PSRFITS files.
+        workers : Optional[int]
+            Number of threads reading headers; 1 reads them in series and
+            None lets ``ThreadPoolExecutor`` choose.
+
+        Returns
+        -------
+        list[FitsMeta]
+            Metadata in the same order as ``fitsfiles``.
+        """
+        if workers == 1 or len(fitsfiles) <= 1:
+            return [self.get(fitsfile) for fitsfile in fitsfiles]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.get, fitsfiles))
+
+    def save(self) -> None:
+        """Write the index to ``path`` if any entry changed since it was loaded."""
+        if self.path is None or not self._dirty:
+            return
+        outdir = os.path.dirname(self.path)
+        if outdir:
+            os.makedirs(outdir, exist_ok=True)
+        with self._lock:
+            content = {
+                "version": INDEX_VERSION,
+                "files": {key: meta._asdict() for key, meta in self._entries.items()},
+            }
+            self._dirty = False
+        tmpfile = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(content, f)
+        os.replace(tmpfile, self.path)
+
+
+def scan_fits_headers(
+    fitsfiles: list[str], workers: Optional[int] = None, index_path: Optional[str] = None
+) -> list[FitsMeta]:
+    """Read the metadata of many PSRFITS files, each file's headers at most once.
+
+    Parameters
+    ----------
+    fitsfiles : list[str]
+        Paths to the PSRFITS files.
+    workers : Optional[int]
+        Number of threads reading headers.
+    index_path : Optional[str]
+        On-disk index to reuse and update.
+
+    Returns
+    -------
+    list[FitsMeta]
+        Metadata in the same order as ``fitsfiles``.
+    """
+    index = FitsIndex(index_path)
+    metas = index.scan(fitsfiles, workers=workers)
+    index.save()
+    return metas
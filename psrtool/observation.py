@@ -0,0 +1,256 @@
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Union
+
+from .index import FitsMeta, check_compatible, is_meta_contiguous, scan_fits_headers
+from .profiling import stage
+from .psrfits import _check_npol, _map_subint_columns, _pol_rows, downsample_data, stokesi_downsample
+
+
+class CacheInfo(NamedTuple):
+    """Hits, misses and size of an ``Observation``'s subint cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class Observation:
+    """Contiguous PSRFITS files presented as one lazy (ntime, nchan) Stokes I array.
+
+    Only the headers are read up front (through ``psrtool.index``).
+    Indexing with ``obs[t0:t1, c0:c1]`` maps just the files and subint rows
+    overlapping the slice, sums the polarizations and downsamples on the
+    fly, and returns a new array. Decoded subints are kept in an LRU cache
+    of ``cache_size`` entries, so repeated reads of nearby windows, e.g. of
+    candidates, do not touch the files again.
+
+    With ``dchan_factor`` or ``dt_factor``, the array is the downsampled
+    observation: ``obs[a:b]`` equals
+    ``downsample_data(full[a * dt_factor:b * dt_factor], dchan_factor, dt_factor)``,
+    and downsampling blocks may span file boundaries.
+
+    Parameters
+    ----------
+    fitsfiles : list[str]
+        PSRFITS files of the observation, in any order. They must be
+        contiguous in time once sorted by start time.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    apply_scales : bool
+        Apply DAT_SCL, DAT_OFFS and DAT_WTS, giving float32 samples.
+    cache_size : int
+        Number of decoded subints to keep.
+    index_path : Optional[str]
+        JSON header index to reuse and update (see ``psrtool.index.FitsIndex``).
+    """
+
+    def __init__(
+        self,
+        fitsfiles: list[str],
+        dchan_factor: int = 1,
+        dt_factor: int = 1,
+        apply_scales: bool = False,
+        cache_size: int = 64,
+        index_path: Optional[str] = None,
+    ) -> None:
+        if dchan_factor < 1 or dt_factor < 1:
+            raise ValueError("dchan_factor and dt_factor must be >= 1")
+        if cache_size < 1:
+            raise ValueError("cache_size must be >= 1")
+        if not fitsfiles:
+            raise ValueError("An observation needs at least one file")
+        metas = scan_fits_headers(fitsfiles, index_path=index_path)
+        metas.sort(key=lambda meta: (meta.stt_imjd, meta.stt_smjd, meta.stt_offs, meta.path))
+        check_compatible(metas)
+        for prev, meta in zip(metas[:-1], metas[1:]):
+            if not is_meta_contiguous(prev, meta):
+                raise ValueError(f"Files {prev.path} and {meta.path} are not time contiguous.")
+        self.metas: list[FitsMeta] = metas
+        self.dchan_factor = dchan_factor
+        self.dt_factor = dt_factor
+        self.apply_scales = apply_scales
+        self.cache_size = cache_size
+        # First input sample of each file, and one past the last of the observation
+        self._starts = np.cumsum([0] + [meta.nsamples for meta in metas])
+        self._columns: dict[int, tuple] = {}
+        self._cache: "OrderedDict[tuple[int, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+        self._dtype: Optional[np.dtype] = None
+
+    def __enter__(self) -> "Observation":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def fitsfiles(self) -> list[str]:
+        """Paths of the files in time order."""
+        return [meta.path for meta in self.metas]
+
+    @property
+    def nchan(self) -> int:
+        return self.metas[0].nchan // self.dchan_factor
+
+    @property
+    def ntime(self) -> int:
+        return int(self._starts[-1]) // self.dt_factor
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.ntime, self.nchan)
+
+    @property
+    def tsamp(self) -> float:
+        return self.metas[0].tbin * self.dt_factor
+
+    @property
+    def tstart(self) -> float:
+        return self.metas[0].start_mjd
+
+    @property
+    def foff(self) -> float:
+        return self.metas[0].chan_bw * self.dchan_factor
+
+    @property
+    def fch1(self) -> float:
+        """Frequency of the first channel in MHz, as ``fits2fil`` writes it."""
+        base = self.metas[0]
+        return base.obsfreq - base.obsbw / 2 if base.chan_bw > 0 else base.obsfreq + base.obsbw / 2
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Sample dtype, known once the first subint has been decoded."""
+        if self._dtype is None:
+            self._subint(0, 0)
+        return self._dtype
+
+    def __len__(self) -> int:
+        return self.ntime
+
+    def cache_info(self) -> CacheInfo:
+        """Hits and misses of the subint cache so far."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.cache_size, len(self._cache))
+
+    def _file_columns(self, ifile: int) -> tuple:
+        """Map the SUBINT columns of one file on first use."""
+        with self._lock:
+            columns = self._columns.get(ifile)
+        if columns is None:
+            names = ("DATA", "DAT_SCL", "DAT_OFFS", "DAT_WTS") if self.apply_scales else ("DATA",)
+            header1, mapped = _map_subint_columns(self.metas[ifile].path, names)
+            columns = (_check_npol(header1), mapped)
+            with self._lock:
+                self._columns[ifile] = columns
+        return columns
+
+    def _subint(self, ifile: int, row: int) -> np.ndarray:
+        """Return the Stokes I samples of one subint, shape (nsblk, nchan), from the cache if possible."""
+        key = (ifile, row)
+        with self._lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return block
+            self._misses += 1
+        meta = self.metas[ifile]
+        npol, columns = self._file_columns(ifile)
+        data = columns["DATA"][row : row + 1]
+        scales = None
+        if self.apply_scales:
+            scales = tuple(columns[name][row : row + 1] for name in ("DAT_SCL", "DAT_OFFS", "DAT_WTS"))
+        with stage("read", data.nbytes, meta.path):
+            # Copied, so the cache never holds a view of the file
+            block = np.array(stokesi_downsample(_pol_rows(data, npol, meta.nchan, meta.nbits, scales)))
+        with self._lock:
+            self._dtype = block.dtype
+            self._cache[key] = block
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return block
+
+    def read(self, first: int, stop: int, chan_first: int = 0, chan_stop: Optional[int] = None) -> np.ndarray:
+        """Return input samples ``[first, stop)`` of channels ``[chan_first, chan_stop)``, before downsampling.
+
+        Parameters
+        ----------
+        first, stop : int
+            Range of full-resolution time samples.
+        chan_first, chan_stop : int, Optional[int]
+            Range of full-resolution channels; to the last channel if
+            ``chan_stop`` is None.
+
+        Returns
+        -------
+        np.ndarray
+            Stokes I samples with shape (stop - first, chan_stop - chan_first).
+        """
+        nsamples = int(self._starts[-1])
+        chan_stop = self.metas[0].nchan if chan_stop is None else chan_stop
+        if not (0 <= first <= stop <= nsamples and 0 <= chan_first <= chan_stop <= self.metas[0].nchan):
+            raise IndexError("Sample or channel range outside the observation")
+        if stop == first:
+            return np.empty((0, chan_stop - chan_first), dtype=self.dtype)
+        out = None
+        ifile = int(np.searchsorted(self._starts, first, side="right")) - 1
+        pos = first
+        while pos < stop:
+            meta = self.metas[ifile]
+            local = pos - int(self._starts[ifile])
+            row, offset = divmod(local, meta.nsblk)
+            count = min(meta.nsblk - offset, stop - pos)
+            block = self._subint(ifile, row)[offset : offset + count, chan_first:chan_stop]
+            if out is None:
+                out = np.empty((stop - first, chan_stop - chan_first), dtype=block.dtype)
+            out[pos - first : pos - first + count] = block
+            pos += count
+            if local + count == meta.nsamples:
+                ifile += 1
+        return out
+
+    def __getitem__(self, key: Union[int, slice, tuple]) -> np.ndarray:
+        """Return ``obs[t]``, ``obs[t0:t1]`` or ``obs[t0:t1, c0:c1]`` of the downsampled array."""
+        tkey, ckey = key if isinstance(key, tuple) else (key, slice(None))
+        tslice = _as_slice(tkey, self.ntime)
+        cslice = _as_slice(ckey, self.nchan)
+        t0, t1, tstep = tslice.indices(self.ntime)
+        c0, c1, cstep = cslice.indices(self.nchan)
+        t1, c1 = max(t0, t1), max(c0, c1)
+        if tstep < 1 or cstep < 1:
+            raise IndexError("Observation slices must have a positive step")
+        dt, dc = self.dt_factor, self.dchan_factor
+        block = self.read(t0 * dt, t1 * dt, c0 * dc, c1 * dc)
+        if dt > 1 or dc > 1:
+            with stage("downsample", block.nbytes):
+                block = downsample_data(block, dchan_factor=dc, dt_factor=dt)
+        block = block[::tstep, ::cstep]
+        if not isinstance(tkey, slice):
+            block = block[0]
+            return block if isinstance(ckey, slice) else block[0]
+        return block if isinstance(ckey, slice) else block[:, 0]
+
+    def close(self) -> None:
+        """Release the file mappings and the cache."""
+        with self._lock:
+            self._columns.clear()
+            self._cache.clear()
+
+
+def _as_slice(key: Union[int, slice], length: int) -> slice:
+    if isinstance(key, slice):
+        return key
+    index = int(key)
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError(f"Index {key} out of range for length {length}")
+    return slice(index, index + 1)
@@ -0,0 +1,31 @@
+"""Choices of string options shared by the converters and the CLI.
+
+Kept free of heavy imports so ``psrtool.cli`` can build its parsers without
+loading numpy or astropy.
+"""
+
+import os
+
+# Ways combinefits handles a gap between consecutive input files
+GAP_POLICIES = ("error", "zero", "median", "split")
+
+# Ways requantize handles samples outside the output range
+CLIP_POLICIES = ("saturate", "zero")
+
+# Output bit depths that can be requested with nbits_out
+NBITS_OUT = (1, 2, 4, 8, 16, 32)
+
+# Values RFI-masked samples are replaced with
+RFI_FILLS = ("mean", "zero")
+
+# Output layouts: time-major SIGPROC spectra or channel-major .npy blocks
+LAYOUTS = ("time", "channel")
+
+# Conversion cache used by --cache without a directory; PSRTOOL_CACHE_DIR
+# points every pipeline on a machine at one shared cache
+DEFAULT_CACHE_DIR = os.environ.get("PSRTOOL_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "psrtool"
+)
+
+# Default size cap of the conversion cache, in bytes
+DEFAULT_CACHE_MAX_BYTES = 100 * 1024**3
@@ -0,0 +1,279 @@
+import queue
+import threading
+import numpy as np
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+from .bits import pack_bits
+from .profiling import stage
+from .psrfits import NBITS_OUT, downsample_data, output_nbits, requantize, requantize_block, stokesi_downsample
+from .sigproc import sigproc_samples
+
+
+_DONE = object()
+
+
+def downsample_chunk(chunk: tuple[int, np.ndarray], dchan_factor: int = 1, dt_factor: int = 1) -> np.ndarray:
+    """Downsample the block of an aligned (start_sample, block) chunk.
+
+    Parameters
+    ----------
+    chunk : tuple[int, np.ndarray]
+        Chunk as yielded by ``align_chunks``.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+
+    Returns
+    -------
+    np.ndarray
+        Downsampled block.
+    """
+    _, block = chunk
+    if dchan_factor > 1 or dt_factor > 1:
+        block = downsample_data(block, dchan_factor=dchan_factor, dt_factor=dt_factor)
+    return block
+
+
+def stokesi_downsample_chunk(
+    chunk: tuple[int, np.ndarray],
+    dchan_factor: int = 1,
+    dt_factor: int = 1,
+    pack_nbits: Optional[int] = None,
+    requantize_nbits: Optional[int] = None,
+    clip_policy: str = "saturate",
+    out: Optional[np.ndarray] = None,
+    as_float: bool = False,
+    rescale_nbits: Optional[int] = None,
+    rfi: Optional[Callable[[int, np.ndarray], np.ndarray]] = None,
+) -> np.ndarray:
+    """Form downsampled Stokes I from an aligned (start_sample, polarization block) chunk.
+
+    Parameters
+    ----------
+    chunk : tuple[int, np.ndarray]
+        Chunk of ``iter_pol_chunks`` output, as yielded by ``align_chunks``.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    pack_nbits : Optional[int]
+        If 1, 2 or 4, pack the result into that many bits per sample in
+        SIGPROC bit order.
+    requantize_nbits : Optional[int]
+        If given, round (scaled) samples to this many bits with
+        ``requantize`` before packing.
+    clip_policy : str
+        Clipping policy passed to ``requantize`` or ``requantize_block``.
+    out : Optional[np.ndarray]
+        Output spectra, e.g. ``Filterbank.data`` of a preallocated file. The
+        result is written to the rows starting at ``start_sample // dt_factor``
+        and that region is returned. A ``psrtool.blocked.BlockedSpectra``
+        is written through its slice assignment, which transposes the
+        downsampled block into channel-major order.
+    as_float : bool
+        Convert integer samples to float32 before summing and averaging, so
+        the downsampled values keep their fractional part.
+    rescale_nbits : Optional[int]
+        If given, requantize the downsampled block to this many bits with
+        its own channel statistics (``requantize_block``) before packing.
+    rfi : Optional[Callable[[int, np.ndarray], np.ndarray]]
+        Called with the chunk's start sample and its full-resolution Stokes
+        I block, e.g. a ``psrtool.rfi.RfiMasker``; the block it returns is
+        downsampled instead.
+
+    Returns
+    -------
+    np.ndarray
+        Downsampled Stokes I block, or its packed bytes. Signed 16-bit
+        samples are offset to unsigned ones, as SIGPROC files hold them
+        (see ``psrtool.sigproc.sigproc_samples``).
+    """
+    start, block = chunk
+    if rescale_nbits is None and not as_float:
+        # Offset signed 16-bit samples before averaging, so decimating the
+        # output again (``fildecimate``) rounds as converting directly does
+        block = sigproc_samples(block)
+    if rfi is not None:
+        # Masked at full resolution, on the chunk that is about to be downsampled
+        block = rfi(start, stokesi_downsample(block))[:, np.newaxis, :]
+    if as_float and block.dtype.kind != "f":
+        block = block.astype(np.float32)
+    region = None
+    row, nrows = start // dt_factor, block.shape[0] // dt_factor
+    if out is not None and out.shape[0] < row + nrows:
+        raise ValueError("Chunk does not fit in the output")
+    if isinstance(out, np.ndarray):
+        region = out[row : row + nrows]
+    if (
+        region is not None
+        and requantize_nbits is None
+        and rescale_nbits is None
+        and (pack_nbits is None or pack_nbits >= 8)
+    ):
+        # Downsample straight into the output, without an intermediate block
+        return stokesi_downsample(block, dchan_factor=dchan_factor, dt_factor=dt_factor, out=region)
+    block = stokesi_downsample(block, dchan_factor=dchan_factor, dt_factor=dt_factor)
+    if requantize_nbits is not None:
+        with stage("requantize", block.nbytes):
+            block = requantize(block, requantize_nbits, clip_policy)
+    if rescale_nbits is not None:
+        with stage("requantize", block.nbytes):
+            block = requantize_block(block, rescale_nbits, clip_policy)
+    # 16-bit SIGPROC samples are unsigned
+    block = sigproc_samples(block)
+    if pack_nbits is not None and pack_nbits < 8:
+        with stage("pack", block.nbytes):
+            block = pack_bits(block, pack_nbits, bitorder="little")
+    if region is not None:
+        with stage("write", block.nbytes):
+            region[...] = block
+        return region
+    if out is not None:
+        out[row : row + nrows] = block
+    return block
+
+
+def conversion_kwargs(
+    nbits: int,
+    repack: bool = False,
+    apply_scales: bool = False,
+    requantize: Optional[str] = None,
+    nbits_out: Optional[int] = None,
+) -> tuple[int, dict]:
+    """Work out the output NBITS of a conversion and how each chunk gets there.
+
+    Parameters
+    ----------
+    nbits : int
+        NBITS of the input PSRFITS data.
+    repack, apply_scales, requantize
+        As for ``psrtool.fits2fil.fits2fil``.
+    nbits_out : Optional[int]
+        Requested output NBITS. 32 averages in float32 and writes floats;
+        fewer bits than the data would otherwise be written with are reached
+        with ``requantize_block``.
+
+    Returns
+    -------
+    tuple[int, dict]
+        Output NBITS and the keyword arguments of ``stokesi_downsample_chunk``
+        other than the downsampling factors and ``out``.
+    """
+    if nbits_out is not None and nbits_out not in NBITS_OUT:
+        raise ValueError(f"nbits_out must be one of {', '.join(map(str, NBITS_OUT))}")
+    if nbits_out == nbits and nbits < 8 and not apply_scales:
+        # Keeping the input's low bit depth is a repack, not a requantization
+        repack = True
+    native = output_nbits(nbits, repack, float_output=apply_scales and requantize is None)
+    kwargs: dict = dict(clip_policy=requantize or "saturate")
+    if nbits_out is None or nbits_out == native:
+        kwargs["requantize_nbits"] = nbits if apply_scales and requantize is not None else None
+    elif nbits_out == 32:
+        kwargs["as_float"] = True
+    elif nbits_out < native or native == 32:
+        kwargs["rescale_nbits"] = nbits_out
+    else:
+        raise ValueError(f"Cannot widen {native}-bit integer samples to {nbits_out} bits; use 32 for float output")
+    nbit = output_nbits(nbits, repack, float_output=apply_scales and requantize is None, nbits_out=nbits_out)
+    kwargs["pack_nbits"] = nbit
+    return nbit, kwargs
+
+
+def _discard(result: Any) -> None:
+    pass
+
+
+def run_pipeline(
+    chunks: Iterable[Any],
+    process: Callable[[Any], Any],
+    write: Optional[Callable[[Any], None]] = None,
+    threads: int = 1,
+    prefetch: int = 2,
+) -> None:
+    """Run a read -> process -> write pipeline over a stream of chunks.
+
+    With ``threads >= 1``, a reader thread pulls chunks from ``chunks`` (for a
+    memory-mapped PSRFITS file this is where the disk is read), ``threads``
+    worker threads run ``process`` on them, and the calling thread passes the
+    results to ``write`` in the original order. The stages are connected by a
+    queue holding at most ``prefetch`` chunks, which bounds memory use to
+    roughly ``prefetch + threads + 1`` chunks. With ``threads=0`` every stage
+    runs in series in the calling thread.
+
+    Parameters
+    ----------
+    chunks : Iterable[Any]
+        Input chunks, consumed in order.
+    process : Callable[[Any], Any]
+        Function applied to each chunk. It must not depend on the order in
+        which chunks are processed when ``threads > 1``.
+    write : Optional[Callable[[Any], None]]
+        Function called with each processed chunk, in input order; ``None``
+        when ``process`` stores its own results (e.g. into a memory map).
+    threads : int
+        Number of worker threads; 0 disables pipelining.
+    prefetch : int
+        Maximum number of chunks queued between the reader and the writer.
+    """
+    if threads < 0:
+        raise ValueError("threads must be >= 0")
+    if prefetch < 1:
+        raise ValueError("prefetch must be >= 1")
+
+    if write is None:
+        write = _discard
+
+    if threads == 0:
+        for chunk in chunks:
+            write(process(chunk))
+        return
+
+    pending: "queue.Queue[Any]" = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader(executor: ThreadPoolExecutor) -> None:
+        try:
+            for chunk in chunks:
+                if not put(executor.submit(process, chunk)):
+                    return
+        except BaseException as exc:  # re-raised in the calling thread
+            errors.append(exc)
+        put(_DONE)
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="psrtool-worker") as executor:
+        read_thread = threading.Thread(target=reader, args=(executor,), name="psrtool-reader", daemon=True)
+        read_thread.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is _DONE:
+                    break
+                future: Future = item
+                write(future.result())
+        finally:
+            stop.set()
+            # Drain the queue so a blocked reader can exit and queued work is dropped
+            while True:
+                try:
+                    leftover = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(leftover, Future):
+                    leftover.cancel()
+            read_thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,282 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+
+# Profiler collecting stage records, or None when profiling is off
+_active: Optional["Profiler"] = None
+
+# Callbacks given the summary of every profiled run
+_hooks: list[Callable[[dict], None]] = []
+
+_NULL = nullcontext()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where ``resource`` is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size of this process in MB, or None where ``/proc/self/statm`` is unavailable."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def _max(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    """``max`` of two optional values, ignoring None."""
+    if a is None:
+        return b
+    return a if b is None or a >= b else b
+
+
+def add_hook(callback: Callable[[dict], None]) -> None:
+    """Call ``callback`` with the summary of every profiled run from now on.
+
+    Registering a hook also profiles calls of ``fits2fil``, ``combinefits``
+    and ``fil2fits`` made without an explicit ``Profiler``, so a metrics
+    exporter sees every conversion.
+    """
+    _hooks.append(callback)
+
+
+def remove_hook(callback: Callable[[dict], None]) -> None:
+    """Stop calling a hook registered with ``add_hook``."""
+    _hooks.remove(callback)
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "nbytes", "file", "start", "rss")
+
+    def __init__(self, profiler: "Profiler", name: str, nbytes: int, file: Optional[str]) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+        self.file = file
+
+    def __enter__(self) -> "_Stage":
+        self.rss = rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.perf_counter() - self.start
+        rss = rss_mb()
+        growth = rss - self.rss if rss is not None and self.rss is not None else None
+        self.profiler.record(self.name, seconds, self.nbytes, self.file, rss, growth)
+
+
+def stage(name: str, nbytes: int = 0, file: Optional[str] = None):
+    """Context manager timing one stage of work, e.g. ``with stage("read", n, path):``.
+
+    When no ``Profiler`` is active this returns a shared no-op context, so
+    instrumented code costs one global lookup per call.
+
+    Parameters
+    ----------
+    name : str
+        Stage name, e.g. ``"read"`` or ``"downsample"``.
+    nbytes : int
+        Bytes processed by the stage.
+    file : Optional[str]
+        File the work belongs to, for a per-file breakdown.
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL
+    return _Stage(profiler, name, nbytes, file)
+
+
+class Profiler:
+    """Record wall time, bytes processed and memory per stage and per file.
+
+    Use as a context manager around a conversion; stages timed with
+    ``stage`` in any thread are accumulated while it is active. The resident
+    set size is sampled as each stage starts and ends: ``rss_delta_mb`` is
+    the largest growth over one call of the stage and ``rss_mb`` the highest
+    RSS it ended with, so the stage and file that need the memory stand out.
+    RSS is process-wide, so stages running at the same time in other threads
+    add to each other's growth. The summary also gives the process's peak
+    RSS so far, as reported by ``getrusage``.
+
+    Parameters
+    ----------
+    command : str
+        Name of the profiled run, e.g. the converter called.
+    hooks : Optional[list[Callable[[dict], None]]]
+        Callbacks given the ``summary`` when the profiler exits, in addition
+        to those registered with ``add_hook``.
+    report : bool
+        Call the hooks on exit. Profilers in worker processes, whose stages
+        are merged into the parent's, pass False.
+    """
+
+    def __init__(
+        self, command: str = "", hooks: Optional[list[Callable[[dict], None]]] = None, report: bool = True
+    ) -> None:
+        self.command = command
+        self.hooks = list(hooks or [])
+        self.report = report
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        # (stage, file) -> [calls, seconds, nbytes, rss_mb, rss_delta_mb]
+        self._stages: dict[tuple[str, Optional[str]], list] = {}
+        self._previous: Optional[Profiler] = None
+        self._start = 0.0
+
+    def __enter__(self) -> "Profiler":
+        global _active
+        self._previous = _active
+        _active = self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        global _active
+        self.seconds += time.perf_counter() - self._start
+        _active = self._previous
+        if not self.report:
+            return
+        summary = self.summary()
+        for hook in _hooks + self.hooks:
+            hook(summary)
+
+    def record(
+        self,
+        name: str,
+        seconds: float,
+        nbytes: int = 0,
+        file: Optional[str] = None,
+        rss_mb: Optional[float] = None,
+        rss_delta_mb: Optional[float] = None,
+    ) -> None:
+        """Add one timed call of a stage, with the RSS it ended with and its growth during the call."""
+        with self._lock:
+            entry = self._stages.setdefault((name, file), [0, 0.0, 0, None, None])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += nbytes
+            entry[3] = _max(entry[3], rss_mb)
+            entry[4] = _max(entry[4], rss_delta_mb)
+
+    def merge(self, stages: list[dict]) -> None:
+        """Add stage records from another profiler, e.g. one in a worker process."""
+        with self._lock:
+            for item in stages:
+                entry = self._stages.setdefault((item["stage"], item["file"]), [0, 0.0, 0, None, None])
+                entry[0] += item["calls"]
+                entry[1] += item["seconds"]
+                entry[2] += item["nbytes"]
+                entry[3] = _max(entry[3], item["rss_mb"])
+                entry[4] = _max(entry[4], item["rss_delta_mb"])
+
+    def summary(self) -> dict:
+        """Return the totals and per-stage, per-file records as a JSON-compatible dict."""
+        with self._lock:
+            stages = [
+                {
+                    "stage": name,
+                    "file": file,
+                    "calls": calls,
+                    "seconds": seconds,
+                    "nbytes": nbytes,
+                    "mb_per_s": nbytes / seconds / 1e6 if seconds > 0 else 0.0,
+                    "rss_mb": rss,
+                    "rss_delta_mb": rss_delta,
+                }
+                for (name, file), (calls, seconds, nbytes, rss, rss_delta) in self._stages.items()
+            ]
+        return {
+            "command": self.command,
+            "wall_seconds": self.seconds,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+        }
+
+    def write_json(self, path: str) -> None:
+        """Write ``summary`` to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def format_report(self) -> str:
+        """Format a per-stage table, then the per-file breakdown."""
+        summary = self.summary()
+        totals: dict[str, list] = {}
+        for item in summary["stages"]:
+            entry = totals.setdefault(item["stage"], [0, 0.0, 0, None])
+            entry[0] += item["calls"]
+            entry[1] += item["seconds"]
+            entry[2] += item["nbytes"]
+            entry[3] = _max(entry[3], item["rss_delta_mb"])
+        rss = summary["peak_rss_mb"]
+        lines = [
+            f"{summary['command'] or 'run'}: {summary['wall_seconds']:.3f} s wall, "
+            + (f"process peak RSS {rss:.1f} MB" if rss is not None else "process peak RSS unavailable"),
+            f"{'stage':<14} {'calls':>7} {'seconds':>9} {'MB':>10} {'MB/s':>9} {'+RSS MB':>9}",
+        ]
+        for name, (calls, seconds, nbytes, rss_delta) in totals.items():
+            rate = nbytes / seconds / 1e6 if seconds > 0 else 0.0
+            lines.append(
+                f"{name:<14} {calls:>7} {seconds:>9.3f} {nbytes / 1e6:>10.1f} {rate:>9.1f} {_format_mb(rss_delta):>9}"
+            )
+        per_file = [item for item in summary["stages"] if item["file"] is not None]
+        if per_file:
+            lines.append("per file:")
+            for item in per_file:
+                lines.append(
+                    f"{item['stage']:<14} {item['seconds']:>9.3f} s {item['nbytes'] / 1e6:>10.1f} MB "
+                    f"{_format_mb(item['rss_delta_mb']):>9} +RSS MB  {item['file']}"
+                )
+        return "\n".join(lines)
+
+
+def _format_mb(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def profiled(command: str):
+    """Decorate a converter so it runs under a ``Profiler`` when hooks are registered.
+
+    Does nothing if a profiler is already active (the caller is collecting
+    the stages) or no hook would receive the summary.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is not None or not _hooks:
+                return func(*args, **kwargs)
+            with Profiler(command):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def is_active() -> bool:
+    """Whether a ``Profiler`` is collecting stages."""
+    return _active is not None
+
+
+def merge(stages: Optional[list[dict]]) -> None:
+    """Add stage records from ``Profiler.summary`` to the active profiler, if any."""
+    profiler = _active
+    if profiler is not None and stages:
+        profiler.merge(stages)
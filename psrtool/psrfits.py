@@ -1,21 +1,29 @@
-import time
+import re
 import numpy as np
 
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from astropy.io import fits
 
+from .bits import unpack_bits
+from .downsample import Downsampler, accumulator_dtype, downsample
+from .options import CLIP_POLICIES, NBITS_OUT
+from .profiling import stage
 
-# def timeit(func):
-#     """Decorator to measure the execution time of a function."""
-#     def wrapper(*args, **kwargs):
-#         start_time = time.time()
-#         result = func(*args, **kwargs)
-#         end_time = time.time()
-#         print(f"Function {func.__name__} took {end_time - start_time:.4f} seconds")
-#         return result
-#     return wrapper
 
-# @timeit
+# Size of the row tiles Stokes I is formed in; small enough to stay in cache
+_TILE_BYTES = 1 << 20
+
+# Half-width, in standard deviations, of the range requantize_block maps onto
+# the output levels: about optimal for 2 bits, and wider as levels are added
+_REQUANT_NSIGMA = {1: 1.0, 2: 2.0, 4: 3.0, 8: 5.0, 16: 6.0}
+
+# Bytes per element of the binary table column types (X is counted in bits,
+# P and Q are array descriptors)
+_TFORM_SIZES = {"L": 1, "B": 1, "I": 2, "J": 4, "K": 8, "A": 1, "E": 4, "D": 8, "C": 8, "M": 16, "P": 8, "Q": 16}
+
+# Big-endian dtypes of the column types mapped by _map_subint_columns
+_TFORM_DTYPES = {"B": np.dtype("u1"), "I": np.dtype(">i2"), "J": np.dtype(">i4"), "E": np.dtype(">f4"), "D": np.dtype(">f8")}
+
 
 def read_fits_header(fitsfile: str) -> tuple[fits.Header, fits.Header]:
     """Read the header of a PSRFITS file.
@@ -81,13 +89,384 @@ def is_time_contiguous(fitsfile1: str, fitsfile2: str) -> bool:
     return bool(np.isclose(end_time_1, start_time_2, rtol=0.0, atol=1e-10))
 
 
-def get_stokesi_data(fitsfile: str) -> np.ndarray:
+def _check_npol(header1: fits.Header) -> int:
+    """Return NPOL from a SUBINT header, raising for unsupported values."""
+    npol = header1["NPOL"]
+    if npol < 1:  #type: ignore
+        raise ValueError(f"Unsupported NPOL value: {npol}, POL_TYPE: {header1['POL_TYPE']}")
+    return int(npol)  #type: ignore
+
+
+def _column_layout(header1: fits.Header) -> dict[str, tuple[int, int, str]]:
+    """Return the byte offset within a row, repeat count and type code of each column of a binary table."""
+    layout = {}
+    offset = 0
+    for i in range(1, int(header1["TFIELDS"]) + 1):  #type: ignore
+        match = re.match(r"\s*(\d*)([A-Z])", header1[f"TFORM{i}"])  #type: ignore
+        if match is None or match[2] not in _TFORM_SIZES and match[2] != "X":
+            raise ValueError(f"Unsupported TFORM{i} value: {header1[f'TFORM{i}']}")
+        repeat = int(match[1] or 1)
+        layout[str(header1[f"TTYPE{i}"])] = (offset, repeat, match[2])
+        offset += (repeat + 7) // 8 if match[2] == "X" else repeat * _TFORM_SIZES[match[2]]
+    if offset != header1["NAXIS1"]:
+        raise ValueError(f"Columns add up to {offset} bytes per row, but NAXIS1 is {header1['NAXIS1']}")
+    return layout
+
+
+def _map_subint_columns(fitsfile: str, names: tuple[str, ...] = ("DATA",)) -> tuple[fits.Header, dict[str, np.ndarray]]:
+    """Map columns of the SUBINT table straight from the file, without parsing its records.
+
+    The byte offset of each column within a row is worked out from the
+    TFORMn keywords, and the columns are returned as views of an
+    ``np.memmap`` of the raw table. DATA has shape (nsubint, NSBLK, NPOL,
+    nchan), or the packed bytes of each polarization for fewer than 8 bits,
+    so slicing out the polarizations used for Stokes I and copying them reads
+    only their byte ranges of each row. Other columns have shape
+    (nsubint, repeat).
+
+    Columns with TSCALn or TZEROn, or of types not in ``_TFORM_DTYPES``, are
+    read through astropy instead, which applies them.
+
+    Returns
+    -------
+    tuple[fits.Header, dict[str, np.ndarray]]
+        SUBINT header and the columns by name.
+    """
+    with fits.open(fitsfile, memmap=True) as hdul:
+        header1 = hdul[1].header  #type: ignore
+        data_offset = hdul.fileinfo(1)["datLoc"]  #type: ignore
+        layout = _column_layout(header1)
+        npol = _check_npol(header1)
+        nsblk, nchan, nbits = int(header1["NSBLK"]), int(header1["NCHAN"]), int(header1["NBITS"])  #type: ignore
+        nrows = int(header1["NAXIS2"])  #type: ignore
+
+        fields = {}
+        for name in names:
+            offset, repeat, code = layout[name]
+            index = list(layout).index(name) + 1
+            if code not in _TFORM_DTYPES or header1.get(f"TSCAL{index}", 1) != 1 or header1.get(f"TZERO{index}", 0) != 0:
+                fields = None
+                break
+            dtype = _TFORM_DTYPES[code]
+            if name == "DATA":
+                if nbits < 8 and code == "B" and (nchan * nbits) % 8 == 0:
+                    shape: tuple[int, ...] = (nsblk, npol, nchan * nbits // 8)
+                elif nbits == dtype.itemsize * 8:
+                    shape = (nsblk, npol, nchan)
+                else:
+                    fields = None
+                    break
+                if repeat != int(np.prod(shape)):
+                    raise ValueError(f"DATA has {repeat} elements per row, expected {int(np.prod(shape))}")
+            else:
+                shape = (repeat,)
+            fields[name] = (dtype, shape, offset)
+
+        if fields is None:
+            # Let astropy apply the column scaling; the arrays stay valid after closing
+            table = hdul[1].data  #type: ignore
+            return header1, {name: table[name] for name in names}
+
+    row_dtype = np.dtype({
+        "names": list(fields),
+        "formats": [(dtype, shape) for dtype, shape, _ in fields.values()],
+        "offsets": [offset for _, _, offset in fields.values()],
+        "itemsize": int(header1["NAXIS1"]),  #type: ignore
+    })
+    if nrows:
+        table = np.memmap(fitsfile, dtype=row_dtype, mode="r", offset=data_offset, shape=(nrows,))
+    else:
+        # An empty table cannot be mapped
+        table = np.zeros(0, dtype=row_dtype)
+    return header1, {name: table[name] for name in names}
+
+
+def _pol_rows(
+    rows: np.ndarray,
+    npol: int,
+    nchan: int,
+    nbits: int = 8,
+    scales: Optional[tuple[np.ndarray, ...]] = None,
+    channels: Optional[tuple[int, int]] = None,
+) -> np.ndarray:
+    """Copy the polarizations used for Stokes I out of raw DATA rows.
+
+    Returns an array of shape (ntime, min(npol, 2), nchan); further
+    polarizations are never copied or unpacked. Samples of fewer than 8
+    bits are unpacked to one uint8 per sample. If ``scales`` holds the
+    (DAT_SCL, DAT_OFFS, DAT_WTS) rows matching ``rows``, the samples are
+    converted to float32 as ``(data * DAT_SCL + DAT_OFFS) * DAT_WTS``.
+    ``channels`` restricts the result to the channels ``[first, stop)``;
+    only the bytes holding them are copied.
+    """
+    nkeep = min(npol, 2)
+    nrows = rows.shape[0]
+    c0, c1 = channels if channels is not None else (0, nchan)
+    if nbits < 8:
+        # Unpack the whole bytes spanning the channels, then trim to them
+        b0, b1 = c0 * nbits // 8, -(-c1 * nbits // 8)
+        rows = rows.reshape(nrows, -1, npol, nchan * nbits // 8)
+        rows = unpack_bits(rows[:, :, :nkeep, b0:b1], nbits)
+        first = c0 - b0 * 8 // nbits
+        if first or rows.shape[-1] != c1 - c0:
+            rows = rows[..., first : first + c1 - c0]
+    else:
+        rows = rows.reshape(nrows, -1, npol, nchan)[:, :, :nkeep, c0:c1]
+    if scales is not None:
+        scl, offs, wts = scales
+        # Broadcast the per-subint, per-channel columns over the NSBLK axis
+        scaled = rows.astype(np.float32)
+        scaled *= scl.reshape(nrows, 1, npol, nchan)[:, :, :nkeep, c0:c1]
+        scaled += offs.reshape(nrows, 1, npol, nchan)[:, :, :nkeep, c0:c1]
+        scaled *= wts.reshape(nrows, 1, 1, nchan)[..., c0:c1]
+        rows = scaled
+    return rows.reshape(-1, nkeep, c1 - c0)
+
+
+def mjd_to_seconds(mjd: float, stt_imjd: int, stt_smjd: int = 0, stt_offs: float = 0.0) -> float:
+    """Seconds from the start time ``STT_IMJD/STT_SMJD/STT_OFFS`` of a file to ``mjd``."""
+    return (mjd - stt_imjd) * 86400.0 - stt_smjd - stt_offs
+
+
+def sample_range(
+    nsamples: int, tbin: float, start: Optional[float] = None, duration: Optional[float] = None, offset: float = 0.0
+) -> tuple[int, int]:
+    """Return the samples ``[first, stop)`` of a file covering a time window.
+
+    The window runs from ``start`` for ``duration`` seconds (to the end of
+    the data if either is None); it starts at the sample containing
+    ``start`` and ends with the sample containing its end.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of time samples in the file.
+    tbin : float
+        Sampling time in seconds.
+    start, duration : Optional[float]
+        Start and length of the window in seconds.
+    offset : float
+        Seconds from the time ``start`` is counted from to the first sample
+        of the file, e.g. when windowing several files at once.
+
+    Returns
+    -------
+    tuple[int, int]
+        First sample and the sample after the last, both within
+        ``[0, nsamples]``; equal if the window misses the file.
+    """
+    # Times within a thousandth of a sample of a boundary count as on it, which
+    # absorbs rounding and the small misalignment allowed between contiguous files
+    eps = 1e-3
+    t0 = (start or 0.0) - offset
+    first = int(np.floor(t0 / tbin + eps))
+    stop = nsamples if duration is None else int(np.ceil((t0 + duration) / tbin - eps))
+    first = min(max(first, 0), nsamples)
+    return first, min(max(stop, first), nsamples)
+
+
+def channel_range(
+    fch1: float, chan_bw: float, nchan: int, fmin: Optional[float] = None, fmax: Optional[float] = None
+) -> tuple[int, int]:
+    """Return the channels ``[first, stop)`` whose frequencies lie within ``[fmin, fmax]`` MHz.
+
+    Channel ``i`` is at ``fch1 + i * chan_bw``, as in the SIGPROC headers
+    psrtool writes; ``chan_bw`` may be negative.
+
+    Raises
+    ------
+    ValueError
+        If no channel lies in the range.
+    """
+    freqs = fch1 + np.arange(nchan) * chan_bw
+    selected = np.ones(nchan, dtype=bool)
+    if fmin is not None:
+        selected &= freqs >= fmin
+    if fmax is not None:
+        selected &= freqs <= fmax
+    index = np.flatnonzero(selected)
+    if not index.size:
+        raise ValueError(f"No channels between {fmin} and {fmax} MHz")
+    return int(index[0]), int(index[-1]) + 1
+
+
+def requantize(data: np.ndarray, nbits: int, clip_policy: str = "saturate") -> np.ndarray:
+    """Round floating point samples back to an integer type of ``nbits`` bits.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Samples to requantize.
+    nbits : int
+        Target bits per sample: 1, 2, 4 or 8 give unsigned values in uint8,
+        16 gives int16 and 32 leaves float32 samples unchanged.
+    clip_policy : str
+        What to do with samples outside the representable range:
+        ``"saturate"`` clips them to the nearest limit, ``"zero"`` sets them
+        to zero.
+
+    Returns
+    -------
+    np.ndarray
+        Requantized samples.
+    """
+    if clip_policy not in CLIP_POLICIES:
+        raise ValueError(f"clip_policy must be one of {', '.join(CLIP_POLICIES)}")
+    if nbits == 32:
+        return data.astype(np.float32, copy=False)
+    if nbits == 16:
+        dtype, lo, hi = np.int16, -(1 << 15), (1 << 15) - 1
+    elif nbits in (1, 2, 4, 8):
+        dtype, lo, hi = np.uint8, 0, (1 << nbits) - 1
+    else:
+        raise ValueError(f"Unsupported NBITS value: {nbits}")
+    rounded = np.rint(data)
+    if clip_policy == "zero":
+        rounded[(rounded < lo) | (rounded > hi)] = 0
+    else:
+        np.clip(rounded, lo, hi, out=rounded)
+    return rounded.astype(dtype)
+
+
+def requantize_block(data: np.ndarray, nbits: int, clip_policy: str = "saturate") -> np.ndarray:
+    """Requantize a block of samples to ``nbits`` bits using its own channel statistics.
+
+    Each channel is shifted so that its mean over the block falls between
+    the two middle output levels, and scaled so that ``_REQUANT_NSIGMA[nbits]``
+    standard deviations either side of the mean span the output range.
+    For 1 bit this is a threshold at the channel mean.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Block with shape (ntime, nchan).
+    nbits : int
+        Output bits per sample: 1, 2, 4, 8 or 16.
+    clip_policy : str
+        ``"saturate"`` clips samples beyond the range to the nearest level,
+        ``"zero"`` sets them to zero.
+
+    Returns
+    -------
+    np.ndarray
+        Unsigned levels in uint8 (uint16 for 16 bits), ready for packing.
+    """
+    if clip_policy not in CLIP_POLICIES:
+        raise ValueError(f"clip_policy must be one of {', '.join(CLIP_POLICIES)}")
+    if nbits not in _REQUANT_NSIGMA:
+        raise ValueError(f"Unsupported NBITS value: {nbits}")
+    nlevels = 1 << nbits
+    mean = data.mean(axis=0, dtype=np.float64).astype(np.float32)
+    std = data.std(axis=0, dtype=np.float64).astype(np.float32)
+    # Constant channels go to the middle level
+    std[std == 0] = 1.0
+    scale = nlevels / (2 * _REQUANT_NSIGMA[nbits] * std)
+    levels = data - mean
+    levels *= scale
+    levels += nlevels // 2
+    np.floor(levels, out=levels)
+    if clip_policy == "zero":
+        levels[(levels < 0) | (levels >= nlevels)] = 0
+    else:
+        np.clip(levels, 0, nlevels - 1, out=levels)
+    return levels.astype(np.uint16 if nbits > 8 else np.uint8)
+
+
+def output_nbits(nbits: int, repack: bool = False, float_output: bool = False, nbits_out: Optional[int] = None) -> int:
+    """Return the NBITS of converted Stokes I data.
+
+    Samples of fewer than 8 bits are unpacked to 8 bits, unless ``repack``
+    asks for them to be packed back to their original size. Scaled data
+    that is not requantized (``float_output``) is written as 32-bit floats.
+    An explicit ``nbits_out`` overrides both.
+    """
+    if nbits_out is not None:
+        return nbits_out
+    if float_output:
+        return 32
+    return nbits if nbits >= 8 or repack else 8
+
+
+def _polsum(data: np.ndarray) -> np.ndarray:
+    """Stokes I of a (ntime, npol, nchan) block, in a dtype wide enough for the sum."""
+    dtype = data.dtype
+    if data.shape[1] == 1:
+        return data[:, 0, :]
+    if dtype.kind == "f":
+        stokesi = np.add(data[:, 0, :], data[:, 1, :])
+        stokesi /= 2
+        return stokesi
+    stokesi = np.add(data[:, 0, :], data[:, 1, :], dtype=accumulator_dtype(dtype, 2))
+    if dtype.kind == "i":
+        # Truncate negative odd sums towards zero, like the float cast does
+        stokesi += stokesi < 0
+    stokesi >>= 1
+    return stokesi
+
+
+def stokesi_downsample(
+    data: np.ndarray, dchan_factor: int = 1, dt_factor: int = 1, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Form Stokes I from polarization data and downsample it in one step.
+
+    For two or more polarizations Stokes I is the mean of the first two
+    (e.g., XX and YY), summed in a wider integer type so it cannot overflow
+    and truncated back to the input dtype. The data are processed in tiles
+    of rows that fit in cache, so only tile-sized temporaries are created
+    and nothing is promoted to float64.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Polarization data with shape (ntime, npol, nchan).
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    out : Optional[np.ndarray]
+        Array to write the result into, e.g. a region of a memory-mapped
+        output file; cast to its dtype if that differs from the input's.
+
+    Returns
+    -------
+    np.ndarray
+        Stokes I data with shape (ntime // dt_factor, nchan // dchan_factor)
+        and the input dtype, or ``out``.
+    """
+    ntime, npol, nchan = data.shape
+    if npol == 1 and dchan_factor == 1 and dt_factor == 1:
+        if out is None:
+            return data[:, 0, :]
+        with stage("write", out.nbytes):
+            np.copyto(out, data[:, 0, :], casting="unsafe")
+        return out
+    ntime_ds = ntime // dt_factor
+    if out is None:
+        out = np.empty((ntime_ds, nchan // dchan_factor), dtype=data.dtype)
+    rows_ds = max(1, _TILE_BYTES // (nchan * 2 * dt_factor))
+    for i0 in range(0, ntime_ds, rows_ds):
+        i1 = min(i0 + rows_ds, ntime_ds)
+        tile = data[i0 * dt_factor:i1 * dt_factor]
+        with stage("polsum", tile.nbytes):
+            stokesi = _polsum(tile)
+        if dchan_factor > 1 or dt_factor > 1:
+            with stage("downsample", stokesi.nbytes):
+                stokesi = downsample(stokesi, dchan_factor=dchan_factor, dt_factor=dt_factor)
+        with stage("write", out[i0:i1].nbytes):
+            np.copyto(out[i0:i1], stokesi, casting="unsafe")
+    return out
+
+
+def get_stokesi_data(fitsfile: str, apply_scales: bool = False) -> np.ndarray:
     """Extract Stokes I data from a PSRFITS file.
 
     Parameters
     ----------
     fitsfile : str
         Path to the PSRFITS file.
+    apply_scales : bool
+        Apply the DAT_SCL, DAT_OFFS and DAT_WTS columns, returning float32
+        data.
     
     Returns
     -------
@@ -96,25 +475,148 @@ def get_stokesi_data(fitsfile: str) -> np.ndarray:
 
     """
 
-    with fits.open(fitsfile, memmap=True) as hdul:
-        data = hdul[1].data  #type: ignore
-        # Assuming data has shape (nsubints, nchan, npol)
-        # Stokes I is usually the sum of the first two polarizations (e.g., XX + YY)    
-        header1 = hdul[1].header  #type: ignore
-        # print(f"NPOL: {header1['NPOL']}, POL_TYPE: {header1['POL_TYPE']}")
-        nchan = header1["NCHAN"]
-        dtype = data["DATA"].dtype
-        data = data["DATA"].reshape(-1, header1["NPOL"], nchan)
-        if header1["NPOL"] == 1:
-            # data_ = data["DATA"][:, :, 0, :, 0]
-            data_ = data[:, 0, :]  # shape (ntime, nchan)
-        elif header1["NPOL"] >= 2:
-            # data_ = ((data["DATA"][:, :, 0, :, 0] + data["DATA"][:, :, 1, :, 0]) / 2).astype(data["DATA"].dtype)
-            data_ = ((data[:, 0, :] + data[:, 1, :]) / 2).astype(dtype)
-        else:
-            raise ValueError(f"Unsupported NPOL value: {header1['NPOL']}, POL_TYPE: {header1['POL_TYPE']}")
-        
-        return data_.reshape(-1, nchan)  # shape (ntime, nchan)
+    names = ("DATA", "DAT_SCL", "DAT_OFFS", "DAT_WTS") if apply_scales else ("DATA",)
+    header1, columns = _map_subint_columns(fitsfile, names)
+    npol = _check_npol(header1)
+    scales = (columns["DAT_SCL"], columns["DAT_OFFS"], columns["DAT_WTS"]) if apply_scales else None
+    rows = _pol_rows(columns["DATA"], npol, header1["NCHAN"], header1["NBITS"], scales)
+    return stokesi_downsample(rows)  # shape (ntime, nchan)
+
+
+def get_stokesi_downsampled(
+    fitsfile: str, dchan_factor: int = 1, dt_factor: int = 1, nsubint_per_chunk: int = 16
+) -> np.ndarray:
+    """Extract downsampled Stokes I data from a PSRFITS file.
+
+    Equivalent to ``downsample_data(get_stokesi_data(fitsfile), ...)``, but the
+    full-resolution Stokes I array is never built: each chunk of subints is
+    polarization-summed and downsampled straight into the output.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Path to the PSRFITS file.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+    nsubint_per_chunk : int
+        Number of subints processed at a time.
+
+    Returns
+    -------
+    np.ndarray
+        Downsampled Stokes I data with shape (ntime, nchan); ntime is 0 if
+        the file holds fewer than ``dt_factor`` samples.
+    """
+    _, header1 = read_fits_header(fitsfile)
+    ntime = int(header1["NAXIS2"]) * int(header1["NSBLK"]) // dt_factor  #type: ignore
+    nchan = int(header1["NCHAN"]) // dchan_factor  #type: ignore
+    out = None
+    for start, block in align_chunks(iter_pol_chunks(fitsfile, nsubint_per_chunk), dt_factor):
+        block = stokesi_downsample(block, dchan_factor=dchan_factor, dt_factor=dt_factor)
+        if out is None:
+            out = np.empty((ntime, nchan), dtype=block.dtype)
+        out[start // dt_factor:start // dt_factor + block.shape[0]] = block
+    if out is None:
+        # Shorter than one dt_factor block, so cheap to read whole; gives the
+        # same empty (0, nchan) array as downsample_data
+        return downsample_data(get_stokesi_data(fitsfile), dchan_factor=dchan_factor, dt_factor=dt_factor)
+    return out
+
+
+def iter_pol_chunks(
+    fitsfile: str,
+    nsubint_per_chunk: int = 16,
+    apply_scales: bool = False,
+    samples: Optional[tuple[int, int]] = None,
+    channels: Optional[tuple[int, int]] = None,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Iterate over the polarizations needed for Stokes I in blocks of subints.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Path to the PSRFITS file.
+    nsubint_per_chunk : int
+        Number of subints per yielded block.
+    apply_scales : bool
+        Apply each subint's DAT_SCL, DAT_OFFS and DAT_WTS to its samples,
+        yielding float32 blocks.
+    samples : Optional[tuple[int, int]]
+        Time samples ``[first, stop)`` to read, e.g. from ``sample_range``;
+        subints outside them are never touched.
+    channels : Optional[tuple[int, int]]
+        Channels ``[first, stop)`` to read, e.g. from ``channel_range``.
+
+    Yields
+    ------
+    tuple[int, np.ndarray]
+        Index of the first time sample of the block within the selected
+        samples, and the block with shape
+        (nsubint_per_chunk * NSBLK, min(NPOL, 2), nchan), ready for
+        ``stokesi_downsample``. The first and last blocks may be shorter.
+        Samples of fewer than 8 bits are unpacked to uint8.
+    """
+    if nsubint_per_chunk < 1:
+        raise ValueError("nsubint_per_chunk must be >= 1")
+
+    names = ("DATA", "DAT_SCL", "DAT_OFFS", "DAT_WTS") if apply_scales else ("DATA",)
+    header1, columns = _map_subint_columns(fitsfile, names)
+    npol = _check_npol(header1)
+    nchan = header1["NCHAN"]
+    nbits = header1["NBITS"]
+    nsblk = int(header1["NSBLK"])  #type: ignore
+    column = columns["DATA"]
+    first, stop = samples if samples is not None else (0, column.shape[0] * nsblk)
+    c0, c1 = channels if channels is not None else (0, nchan)
+    # Only the first two polarizations and the selected channels of each row are read
+    read_fraction = min(npol, 2) / npol * (c1 - c0) / nchan
+    start = 0
+    # Rows holding the selected samples
+    for i0 in range(first // nsblk, -(-stop // nsblk), nsubint_per_chunk):
+        i1 = min(i0 + nsubint_per_chunk, -(-stop // nsblk))
+        scales = None
+        if apply_scales:
+            scales = (columns["DAT_SCL"][i0:i1], columns["DAT_OFFS"][i0:i1], columns["DAT_WTS"][i0:i1])
+        rows = column[i0:i1]
+        # The rows are memory-mapped, so the disk is read while they are copied
+        with stage("read", int(rows.nbytes * read_fraction), fitsfile):
+            block = _pol_rows(rows, npol, nchan, nbits, scales, channels)
+        # Trim the samples outside the selection from the first and last rows
+        head = max(first - i0 * nsblk, 0)
+        block = block[head : block.shape[0] - max(i1 * nsblk - stop, 0)]
+        yield start, block
+        start += block.shape[0]
+
+
+def iter_stokesi_chunks(
+    fitsfile: str, nsubint_per_chunk: int = 16, apply_scales: bool = False
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Iterate over Stokes I data of a PSRFITS file in blocks of subints.
+
+    Only ``nsubint_per_chunk`` rows of the memory-mapped SUBINT table are
+    read and polarization-summed at a time, so files larger than memory can
+    be processed.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Path to the PSRFITS file.
+    nsubint_per_chunk : int
+        Number of subints per yielded block.
+    apply_scales : bool
+        Apply DAT_SCL, DAT_OFFS and DAT_WTS, yielding float32 blocks.
+
+    Yields
+    ------
+    tuple[int, np.ndarray]
+        Index of the first time sample of the block within the file, and the
+        Stokes I block with shape (nsubint_per_chunk * NSBLK, nchan). The last
+        block may be shorter.
+    """
+    for start, block in iter_pol_chunks(fitsfile, nsubint_per_chunk, apply_scales):
+        yield start, stokesi_downsample(block)
 
 
 def downsample_data(data: np.ndarray, dchan_factor: int = 1, dt_factor: int = 1) -> np.ndarray:
@@ -134,17 +636,78 @@ def downsample_data(data: np.ndarray, dchan_factor: int = 1, dt_factor: int = 1)
     np.ndarray
         Downsampled data array.
     """
-    dtype = data.dtype
-    # Downsample frequency channels
-    if dchan_factor > 1:
-        ntime, nchan = data.shape
-        nchan_ds = nchan // dchan_factor
-        data = data[:, :nchan_ds * dchan_factor].reshape(ntime, nchan_ds, dchan_factor).mean(axis=2)
-
-    # Downsample time samples
-    if dt_factor > 1:
-        ntime, nchan = data.shape
-        ntime_ds = ntime // dt_factor
-        data = data[:ntime_ds * dt_factor, :].reshape(ntime_ds, dt_factor, nchan).mean(axis=1)
-
-    return data.astype(dtype)
\ No newline at end of file
+    return downsample(data, dchan_factor=dchan_factor, dt_factor=dt_factor)
+
+
+def align_chunks(chunks: Iterable[tuple[int, np.ndarray]], dt_factor: int = 1) -> Iterator[tuple[int, np.ndarray]]:
+    """Regroup a stream of (start_sample, block) chunks into whole ``dt_factor`` blocks.
+
+    Samples that do not fill a whole ``dt_factor`` block are carried over and
+    completed from the head of the next chunk; a trailing remainder at the end of the stream is dropped,
+    as ``downsample_data`` does. Each yielded block can then be downsampled
+    independently of the others.
+
+    Parameters
+    ----------
+    chunks : Iterable[tuple[int, np.ndarray]]
+        Chunks as yielded by ``iter_stokesi_chunks``.
+    dt_factor : int
+        Time downsampling factor the block lengths must be a multiple of.
+
+    Yields
+    ------
+    tuple[int, np.ndarray]
+        Index of the first sample of the block in the input stream, and the
+        block, whose length is a multiple of ``dt_factor``.
+    """
+    tail = None
+    start = 0
+    for _, block in chunks:
+        if tail is not None:
+            # Complete the carried-over samples with the head of this block;
+            # only these few rows are copied, never the whole block.
+            need = dt_factor - tail.shape[0]
+            if block.shape[0] < need:
+                tail = np.concatenate([tail, block])
+                continue
+            yield start, np.concatenate([tail, block[:need]])
+            start += dt_factor
+            block = block[need:]
+        nuse = (block.shape[0] // dt_factor) * dt_factor
+        tail = block[nuse:] if nuse < block.shape[0] else None
+        if nuse:
+            yield start, block[:nuse]
+            start += nuse
+
+
+def downsample_chunks(
+    chunks: Iterable[tuple[int, np.ndarray]], dchan_factor: int = 1, dt_factor: int = 1
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Downsample a stream of (start_sample, block) chunks.
+
+    A ``Downsampler`` carries partial ``dt_factor`` blocks across chunk
+    boundaries, so the result is identical to downsampling the concatenated
+    stream with ``downsample_data``.
+
+    Parameters
+    ----------
+    chunks : Iterable[tuple[int, np.ndarray]]
+        Chunks as yielded by ``iter_stokesi_chunks``.
+    dchan_factor : int
+        Factor by which to downsample frequency channels.
+    dt_factor : int
+        Factor by which to downsample time samples.
+
+    Yields
+    ------
+    tuple[int, np.ndarray]
+        Index of the first downsampled sample of the block, and the block.
+    """
+    downsampler = Downsampler(dchan_factor=dchan_factor, dt_factor=dt_factor)
+    start = 0
+    for _, block in chunks:
+        block = downsampler.process(block)
+        if not block.shape[0]:
+            continue
+        yield start, block
+        start += block.shape[0]
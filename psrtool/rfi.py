@@ -0,0 +1,268 @@
+import os
+import threading
+import numpy as np
+
+from typing import Optional, Sequence, Union
+
+from .options import RFI_FILLS
+from .profiling import stage
+
+
+# Scale factor turning a median absolute deviation into a Gaussian sigma
+_MAD_SIGMA = 1.4826
+
+
+def rfi_mask_path(outfile: str) -> str:
+    """Path of the sidecar mask written next to ``outfile``, e.g. ``obs.rfimask.npz`` for ``obs.fil``."""
+    return os.path.splitext(outfile)[0] + ".rfimask.npz"
+
+
+def load_channel_mask(mask: Union[str, Sequence[int]], nchan: int) -> np.ndarray:
+    """Read a static channel mask.
+
+    Parameters
+    ----------
+    mask : Union[str, Sequence[int]]
+        Channel numbers to mask, counted from 0 in file order, or the path
+        of a text file listing them separated by whitespace or commas, with
+        ``#`` starting a comment.
+    nchan : int
+        Number of channels of the input data.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array of length ``nchan``, True for masked channels.
+    """
+    if isinstance(mask, str):
+        with open(mask) as f:
+            text = " ".join(line.split("#", 1)[0] for line in f)
+        try:
+            channels = [int(token) for token in text.replace(",", " ").split()]
+        except ValueError:
+            raise ValueError(f"Channel mask {mask} must list integer channel numbers") from None
+    else:
+        channels = [int(channel) for channel in mask]
+    masked = np.zeros(nchan, dtype=bool)
+    if any(channel < 0 or channel >= nchan for channel in channels):
+        raise ValueError(f"Masked channels must be between 0 and {nchan - 1}")
+    masked[channels] = True
+    return masked
+
+
+def make_rfi_masker(
+    nchan: int,
+    channels: tuple[int, int],
+    nsamples: int,
+    sigma: Optional[float] = None,
+    mask: Optional[Union[str, Sequence[int]]] = None,
+    fill: str = "mean",
+) -> Optional["RfiMasker"]:
+    """Build the ``RfiMasker`` of a conversion, or None if neither ``sigma`` nor ``mask`` is given.
+
+    Parameters
+    ----------
+    nchan : int
+        Number of channels of the input file, which ``mask`` refers to.
+    channels : tuple[int, int]
+        First and one past the last channel converted.
+    nsamples : int
+        Number of input time samples covered by the output.
+    sigma, fill
+        As for ``RfiMasker``.
+    mask : Optional[Union[str, Sequence[int]]]
+        Static channel mask, as for ``load_channel_mask``.
+    """
+    if fill not in RFI_FILLS:
+        raise ValueError(f"rfi_fill must be one of {', '.join(RFI_FILLS)}")
+    if sigma is None and mask is None:
+        return None
+    static = load_channel_mask(mask, nchan)[channels[0] : channels[1]] if mask is not None else None
+    return RfiMasker(channels[1] - channels[0], nsamples, sigma, static, fill)
+
+
+def _outliers(values: np.ndarray, valid: np.ndarray, sigma: float) -> np.ndarray:
+    """Flag values more than ``sigma`` robust standard deviations from the median of the valid ones."""
+    if valid.sum() < 3:
+        return np.zeros(values.shape, dtype=bool)
+    median = np.median(values[valid])
+    spread = _MAD_SIGMA * np.median(np.abs(values[valid] - median))
+    if not spread > 0:
+        return np.zeros(values.shape, dtype=bool)
+    return valid & (np.abs(values - median) > sigma * spread)
+
+
+class RfiMasker:
+    """Mask RFI in Stokes I chunks as they stream through a conversion.
+
+    Each chunk is masked on its own: channels whose mean, standard deviation
+    or excess kurtosis is more than ``sigma`` robust standard deviations
+    from that of the other channels are flagged, then time samples whose
+    zero-DM (channel-normalised, band-averaged) value is an outlier by the
+    same criterion. Channels of ``static_mask`` are always flagged and left
+    out of the statistics. Flagged time samples are replaced with the mean
+    of each channel's unflagged samples, and flagged channels, whose own
+    mean is contaminated, with the median of the unflagged channels' means;
+    or everything flagged is replaced with zeros.
+
+    The flags of every chunk are kept so ``save`` can write them as a
+    sidecar file. A masker may be called from several threads; when it is
+    pickled into a worker process the copy starts without flags, and the
+    worker returns ``records()`` for the parent to ``merge``.
+
+    Parameters
+    ----------
+    nchan : int
+        Number of channels of the chunks.
+    nsamples : int
+        Number of time samples covered by the chunks, for the sample mask.
+    sigma : Optional[float]
+        Outlier threshold; None applies only ``static_mask``.
+    static_mask : Optional[np.ndarray]
+        Boolean array of length ``nchan``, True for channels always masked.
+    fill : str
+        ``"mean"`` or ``"zero"``.
+    """
+
+    def __init__(
+        self,
+        nchan: int,
+        nsamples: int,
+        sigma: Optional[float] = None,
+        static_mask: Optional[np.ndarray] = None,
+        fill: str = "mean",
+    ) -> None:
+        if fill not in RFI_FILLS:
+            raise ValueError(f"fill must be one of {', '.join(RFI_FILLS)}")
+        if sigma is not None and sigma <= 0:
+            raise ValueError("sigma must be > 0")
+        self.nchan = nchan
+        self.nsamples = nsamples
+        self.sigma = sigma
+        self.static_mask = np.zeros(nchan, dtype=bool) if static_mask is None else np.asarray(static_mask, bool)
+        if self.static_mask.shape != (nchan,):
+            raise ValueError(f"static_mask must have {nchan} channels")
+        self.fill = fill
+        self._lock = threading.Lock()
+        self._records: list[tuple[int, np.ndarray, np.ndarray]] = []
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_records"] = []
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def flag(self, data: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find the flagged channels and samples of one chunk.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Stokes I samples with shape (ntime, nchan).
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray]
+            Channel flags, time sample flags and the channel means of the
+            unflagged samples, as float32.
+        """
+        x = data.astype(np.float32, copy=False)
+        channels = self.static_mask.copy()
+        samples = np.zeros(x.shape[0], dtype=bool)
+        mean = x.mean(axis=0, dtype=np.float32)
+        if self.sigma is not None and x.shape[0] > 1:
+            # Central moments from one float32 temporary, squared in place
+            dev = x - mean
+            np.square(dev, out=dev)
+            var = dev.mean(axis=0)
+            np.square(dev, out=dev)
+            m4 = dev.mean(axis=0)
+            del dev
+            std = np.sqrt(var)
+            live = var > 0
+            kurtosis = np.zeros_like(var)
+            kurtosis[live] = m4[live] / var[live] ** 2 - 3
+            valid = ~channels
+            for values in (mean, std, kurtosis):
+                channels |= _outliers(values, valid, self.sigma)
+
+            # Zero-DM time series of the clean channels as one matrix-vector product
+            weights = np.zeros(self.nchan, dtype=np.float32)
+            good = ~channels & live
+            if good.any():
+                weights[good] = 1 / (std[good] * good.sum())
+                zero_dm = x @ weights - np.dot(mean, weights)
+                samples = _outliers(zero_dm, np.ones(x.shape[0], dtype=bool), self.sigma)
+                if samples.any() and not samples.all():
+                    mean = x[~samples].mean(axis=0, dtype=np.float32)
+        return channels, samples, mean
+
+    def __call__(self, start: int, data: np.ndarray) -> np.ndarray:
+        """Mask one chunk in place, record its flags and return it.
+
+        Parameters
+        ----------
+        start : int
+            Index of the chunk's first sample among the ``nsamples``.
+        data : np.ndarray
+            Stokes I samples with shape (ntime, nchan). Copied first if it
+            is a view, e.g. of a read-only input memory map.
+
+        Returns
+        -------
+        np.ndarray
+            The masked samples, in the input dtype.
+        """
+        with stage("rfi", data.nbytes):
+            data = np.require(data, requirements=["W", "O"])
+            channels, samples, mean = self.flag(data)
+            if channels.any() or samples.any():
+                if self.fill == "zero" or channels.all():
+                    value = np.zeros(self.nchan, dtype=data.dtype)
+                else:
+                    # A flagged channel's own mean carries the RFI it was flagged for
+                    mean[channels] = np.median(mean[~channels])
+                    value = mean.astype(data.dtype) if data.dtype.kind == "f" else np.rint(mean).astype(data.dtype)
+                data[:, channels] = value[channels]
+                data[samples] = value
+        with self._lock:
+            self._records.append((start, channels, samples))
+        return data
+
+    def records(self) -> list[tuple[int, np.ndarray, np.ndarray]]:
+        """(start, channel flags, sample flags) of every chunk masked so far."""
+        with self._lock:
+            return list(self._records)
+
+    def merge(self, records: Optional[list[tuple[int, np.ndarray, np.ndarray]]]) -> None:
+        """Add chunk flags from ``records`` of another masker, e.g. one in a worker process."""
+        if records:
+            with self._lock:
+                self._records.extend(records)
+
+    def save(self, path: str, **metadata) -> None:
+        """Write the flags as a compressed ``.npz`` sidecar file.
+
+        The file holds ``static_mask`` (nchan,), ``chunk_start`` and
+        ``chunk_nsamples`` (nchunk,), ``channel_mask`` (nchunk, nchan) with
+        each chunk's channel flags, ``sample_mask`` (nsamples,) with the
+        flagged time samples, and ``metadata`` as scalars (e.g. ``fch1``,
+        ``chan_bw``, ``tsamp`` and ``tstart`` of the masked samples).
+        """
+        records = sorted(self.records(), key=lambda record: record[0])
+        sample_mask = np.zeros(self.nsamples, dtype=bool)
+        for start, _, samples in records:
+            sample_mask[start : start + samples.shape[0]] = samples
+        np.savez_compressed(
+            path,
+            static_mask=self.static_mask,
+            chunk_start=np.array([record[0] for record in records], dtype=np.int64),
+            chunk_nsamples=np.array([record[2].shape[0] for record in records], dtype=np.int64),
+            channel_mask=np.array([record[1] for record in records], dtype=bool).reshape(-1, self.nchan),
+            sample_mask=sample_mask,
+            **{key: np.asarray(value) for key, value in metadata.items()},
+        )
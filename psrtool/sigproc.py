@@ -0,0 +1,314 @@
+import os
+import struct
+import numpy as np
+
+from typing import Optional
+
+from .bits import unpack_bits
+
+
+# Header keywords and their struct codes ("str" for strings), in the order
+# they are written. See sigproc's filterbank_header.c and read_header.c.
+HEADER_TYPES = {
+    "rawdatafile": "str",
+    "source_name": "str",
+    "machine_id": "i",
+    "barycentric": "i",
+    "pulsarcentric": "i",
+    "telescope_id": "i",
+    "src_raj": "d",
+    "src_dej": "d",
+    "az_start": "d",
+    "za_start": "d",
+    "data_type": "i",
+    "fch1": "d",
+    "foff": "d",
+    "nchans": "i",
+    "nbeams": "i",
+    "ibeam": "i",
+    "nbits": "i",
+    "tstart": "d",
+    "tsamp": "d",
+    "nifs": "i",
+    "refdm": "d",
+    "period": "d",
+    "nsamples": "i",
+    "signed": "b",
+}
+
+# Data types of byte-sized and larger samples by nbits; 16-bit samples are
+# unsigned, as Your and PRESTO read them
+_DTYPES = {8: np.uint8, 16: np.uint16, 32: np.float32}
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("i", len(data)) + data
+
+
+def _read_string(fp) -> str:
+    (nchar,) = struct.unpack("i", fp.read(4))
+    if not 0 <= nchar <= 80:
+        raise ValueError(f"Invalid SIGPROC header string length: {nchar}")
+    return fp.read(nchar).decode()
+
+
+def make_header(
+    source_name: str,
+    nchans: int,
+    foff: float,
+    fch1: float,
+    tsamp: float,
+    tstart: float,
+    nbits: int = 8,
+    nifs: int = 1,
+    rawdatafile: str = "",
+    src_raj: float = 112233.44,
+    src_dej: float = 112233.44,
+    telescope_id: int = 6,
+    machine_id: int = 0,
+) -> dict:
+    """Build a filterbank header with the fields psrtool writes.
+
+    The defaults of the fields PSRFITS input does not provide match those
+    ``your`` used to write, so outputs stay byte-identical.
+
+    Parameters
+    ----------
+    source_name : str
+        Source name.
+    nchans : int
+        Number of frequency channels.
+    foff : float
+        Channel width in MHz; negative for a descending band.
+    fch1 : float
+        Frequency of the first channel in MHz.
+    tsamp : float
+        Sampling time in seconds.
+    tstart : float
+        MJD of the first sample.
+    nbits : int
+        Bits per sample.
+    nifs : int
+        Number of IFs (polarizations).
+    rawdatafile : str
+        Name recorded as the raw data file.
+    src_raj, src_dej : float
+        Source position as ``hhmmss.s`` and ``ddmmss.s``.
+    telescope_id, machine_id : int
+        SIGPROC telescope and backend identifiers.
+
+    Returns
+    -------
+    dict
+        Header keywords and values.
+    """
+    return {
+        "rawdatafile": rawdatafile,
+        "source_name": source_name,
+        "machine_id": machine_id,
+        "barycentric": 0,
+        "pulsarcentric": 0,
+        "telescope_id": telescope_id,
+        "src_raj": src_raj,
+        "src_dej": src_dej,
+        "az_start": -1.0,
+        "za_start": -1.0,
+        "data_type": 1,
+        "fch1": fch1,
+        "foff": foff,
+        "nchans": nchans,
+        "nbeams": 0,
+        "ibeam": 0,
+        "nbits": nbits,
+        "tstart": tstart,
+        "tsamp": tsamp,
+        "nifs": nifs,
+    }
+
+
+def encode_header(header: dict) -> bytes:
+    """Encode a filterbank header, writing keywords in ``HEADER_TYPES`` order.
+
+    Missing keywords and empty strings, e.g. the default ``rawdatafile``,
+    are left out.
+    """
+    parts = [_encode_string("HEADER_START")]
+    for key, code in HEADER_TYPES.items():
+        value = header.get(key)
+        if value is None or value == "":
+            continue
+        parts.append(_encode_string(key))
+        parts.append(_encode_string(value) if code == "str" else struct.pack(code, value))
+    parts.append(_encode_string("HEADER_END"))
+    return b"".join(parts)
+
+
+def read_header(filfile: str) -> tuple[dict, int]:
+    """Read the header of a filterbank file.
+
+    Returns
+    -------
+    tuple[dict, int]
+        Header keywords and values, and the header length in bytes.
+    """
+    with open(filfile, "rb") as fp:
+        if _read_string(fp) != "HEADER_START":
+            raise ValueError(f"{filfile} is not a SIGPROC filterbank file")
+        header = {}
+        while True:
+            key = _read_string(fp)
+            if key == "HEADER_END":
+                return header, fp.tell()
+            code = HEADER_TYPES.get(key)
+            if code is None:
+                raise ValueError(f"Unknown SIGPROC header keyword {key!r} in {filfile}")
+            if code == "str":
+                header[key] = _read_string(fp)
+            else:
+                (header[key],) = struct.unpack(code, fp.read(struct.calcsize(code)))
+
+
+def spectrum_bytes(header: dict) -> int:
+    """Return the number of bytes of one spectrum (all IFs) of a filterbank."""
+    nbits = header["nbits"]
+    if nbits not in (1, 2, 4) and nbits not in _DTYPES:
+        raise ValueError(f"Unsupported nbits value: {nbits}")
+    nbytes = header.get("nifs", 1) * header["nchans"] * nbits
+    if nbytes % 8:
+        raise ValueError(f"Spectra of {header['nchans']} {nbits}-bit channels are not a whole number of bytes")
+    return nbytes // 8
+
+
+def sigproc_samples(samples: np.ndarray) -> np.ndarray:
+    """Return signed 16-bit samples (as PSRFITS stores them) as unsigned SIGPROC samples.
+
+    The samples are offset by 32768, so -32768 becomes 0 and no value
+    wraps; other samples are returned unchanged.
+    """
+    if samples.dtype.kind != "i" or samples.dtype.itemsize != 2:
+        return samples
+    return np.bitwise_xor(samples.astype(np.int16, copy=False).view(np.uint16), 0x8000)
+
+
+def psrfits_samples(samples: np.ndarray) -> np.ndarray:
+    """Return unsigned 16-bit SIGPROC samples as signed PSRFITS samples; the inverse of ``sigproc_samples``."""
+    if samples.dtype != np.uint16:
+        return samples
+    return np.bitwise_xor(samples, 0x8000).view(np.int16)
+
+
+class Filterbank:
+    """A SIGPROC filterbank file with its data section mapped into memory.
+
+    ``data`` is a ``np.memmap`` of shape (nspectra, nifs * nchans) for 8, 16
+    and 32-bit samples, or of the packed bytes of each spectrum for 1, 2 and
+    4-bit samples, so slicing it reads nothing that is not used. Opened with
+    ``mode="r+"``, assigning to ``data`` writes to the file in place.
+
+    Parameters
+    ----------
+    filfile : str
+        Filterbank file path.
+    mode : str
+        ``"r"`` to read or ``"r+"`` to also write the data section.
+    """
+
+    def __init__(self, filfile: str, mode: str = "r") -> None:
+        self.filfile = filfile
+        self.header, self.hdrbytes = read_header(filfile)
+        self.nbits = int(self.header["nbits"])
+        self.nchans = int(self.header["nchans"])
+        self.nifs = int(self.header.get("nifs", 1))
+        row_bytes = spectrum_bytes(self.header)
+        self.nspectra = (os.path.getsize(filfile) - self.hdrbytes) // row_bytes
+
+        if self.nbits < 8:
+            dtype, width = np.dtype(np.uint8), row_bytes
+        else:
+            dtype, width = np.dtype(_DTYPES[self.nbits]), self.nifs * self.nchans
+        if self.nspectra:
+            self.data = np.memmap(filfile, dtype=dtype, mode=mode, offset=self.hdrbytes, shape=(self.nspectra, width))
+        else:
+            # An empty data section cannot be mapped
+            self.data = np.zeros((0, width), dtype=dtype)
+
+    def __enter__(self) -> "Filterbank":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def tsamp(self) -> float:
+        return self.header["tsamp"]
+
+    @property
+    def tstart(self) -> float:
+        return self.header["tstart"]
+
+    @property
+    def fch1(self) -> float:
+        return self.header["fch1"]
+
+    @property
+    def foff(self) -> float:
+        return self.header["foff"]
+
+    @property
+    def source_name(self) -> str:
+        return self.header.get("source_name", "")
+
+    def get_spectra(self, start: int, nsamp: int, ifs: int = 0) -> np.ndarray:
+        """Return ``nsamp`` spectra of one IF from ``start``, with shape (nsamp, nchans).
+
+        Samples of fewer than 8 bits are unpacked to uint8.
+        """
+        block = self.data[start : start + nsamp]
+        if self.nbits < 8:
+            block = unpack_bits(block, self.nbits, bitorder="little")
+        return block.reshape(block.shape[0], self.nifs, self.nchans)[:, ifs]
+
+    def close(self) -> None:
+        """Flush writes and release the mapping."""
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.data = np.zeros((0,) + self.data.shape[1:], dtype=self.data.dtype)
+
+
+def create_filterbank(filfile: str, header: dict, nspectra: int) -> Filterbank:
+    """Create a filterbank file of ``nspectra`` zeroed spectra and map it for writing.
+
+    The file is allocated to its final size up front, so converters can
+    write each block of output straight into its place in ``data``.
+
+    Parameters
+    ----------
+    filfile : str
+        Output filterbank file path.
+    header : dict
+        Header, e.g. from ``make_header``.
+    nspectra : int
+        Number of spectra in the file.
+
+    Returns
+    -------
+    Filterbank
+        The new file, opened with ``mode="r+"``.
+    """
+    header_bytes = encode_header(header)
+    with open(filfile, "wb") as fp:
+        fp.write(header_bytes)
+        fp.truncate(len(header_bytes) + nspectra * spectrum_bytes(header))
+    return Filterbank(filfile, mode="r+")
+
+
+def sigproc_to_sexagesimal(value: Optional[float], sign: bool = False) -> str:
+    """Format a SIGPROC ``hhmmss.s``/``ddmmss.s`` angle as ``hh:mm:ss.ssss``."""
+    value = value or 0.0
+    negative = value < 0
+    value = abs(value)
+    units, rest = divmod(value, 10000)
+    minutes, seconds = divmod(rest, 100)
+    prefix = "-" if negative else ("+" if sign else "")
+    return f"{prefix}{int(units):02d}:{int(minutes):02d}:{seconds:07.4f}"
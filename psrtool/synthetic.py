@@ -0,0 +1,111 @@
+import numpy as np
+
+from typing import Optional
+
+from .fitswriter import DATA_FORMATS, PsrfitsWriter
+
+
+def write_psrfits(
+    fitsfile: str,
+    data: np.ndarray,
+    nbits: int = 8,
+    tbin: float = 64e-6,
+    obsfreq: float = 1250.0,
+    obsbw: float = 500.0,
+    stt_imjd: int = 60000,
+    stt_smjd: int = 0,
+    stt_offs: float = 0.0,
+    src_name: str = "SYNTHETIC",
+    dat_scl: Optional[np.ndarray] = None,
+    dat_offs: Optional[np.ndarray] = None,
+    dat_wts: Optional[np.ndarray] = None,
+) -> None:
+    """Write a search-mode PSRFITS file from an array of samples.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Output PSRFITS file path.
+    data : np.ndarray
+        Samples with shape (nsubint, nsblk, npol, nchan). For ``nbits < 8``
+        these are unpacked values, which are packed most significant bits
+        first as PSRFITS requires.
+    nbits : int
+        Bits per sample: 1, 2, 4, 8, 16 or 32.
+    tbin : float
+        Sampling time in seconds.
+    obsfreq : float
+        Centre frequency in MHz.
+    obsbw : float
+        Bandwidth in MHz; negative for a descending band.
+    stt_imjd, stt_smjd, stt_offs : int, int, float
+        Start day, second and fractional second.
+    src_name : str
+        Source name.
+    dat_scl, dat_offs : Optional[np.ndarray]
+        Per-subint scales and offsets with shape (nsubint, npol * nchan);
+        default to 1 and 0.
+    dat_wts : Optional[np.ndarray]
+        Per-subint channel weights with shape (nsubint, nchan); default to 1.
+    """
+    nsubint, nsblk, npol, nchan = data.shape
+    with PsrfitsWriter(
+        fitsfile,
+        nchan=nchan,
+        nsblk=nsblk,
+        tbin=tbin,
+        obsfreq=obsfreq,
+        obsbw=obsbw,
+        nbits=nbits,
+        npol=npol,
+        stt_imjd=stt_imjd,
+        stt_smjd=stt_smjd,
+        stt_offs=stt_offs,
+        src_name=src_name,
+        telescope="SYNTHETIC",
+    ) as writer:
+        if nbits >= 8:
+            data = data.astype(DATA_FORMATS[nbits][1])
+        writer.write_subints(data, dat_scl=dat_scl, dat_offs=dat_offs, dat_wts=dat_wts)
+
+
+def make_synthetic_psrfits(
+    fitsfile: str,
+    nsubint: int = 4,
+    nsblk: int = 256,
+    nchan: int = 64,
+    npol: int = 1,
+    nbits: int = 8,
+    seed: int = 0,
+    **kwargs,
+) -> np.ndarray:
+    """Write a PSRFITS file of random samples and return the samples.
+
+    Parameters
+    ----------
+    fitsfile : str
+        Output PSRFITS file path.
+    nsubint, nsblk, nchan, npol : int
+        Shape of the data.
+    nbits : int
+        Bits per sample.
+    seed : int
+        Seed of the random generator.
+    **kwargs
+        Further arguments of ``write_psrfits``.
+
+    Returns
+    -------
+    np.ndarray
+        Samples with shape (nsubint, nsblk, npol, nchan), unpacked.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (nsubint, nsblk, npol, nchan)
+    if nbits == 32:
+        data = rng.normal(size=shape).astype(np.float32)
+    elif nbits == 16:
+        data = rng.integers(-(1 << 15), 1 << 15, size=shape, dtype=np.int16)
+    else:
+        data = rng.integers(0, 1 << nbits, size=shape, dtype=np.uint8)
+    write_psrfits(fitsfile, data, nbits=nbits, **kwargs)
+    return data
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from psrtool.batch import batch_fits2fil, batch_outfile, format_batch_report, is_conversion_complete
+from psrtool.fits2fil import fits2fil
+
+
+class TestBatchFits2Fil(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits",
+    ]
+
+    def test_batch_converts_and_resumes(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            results = batch_fits2fil(self.fitsfiles, outdir, dchan_factor=2, dt_factor=2, workers=2)
+            self.assertEqual([r.status for r in results], ["ok", "ok"])
+            self.assertEqual([r.fitsfile for r in results], self.fitsfiles)
+            for result in results:
+                self.assertGreater(result.throughput, 0.0)
+                self.assertTrue(is_conversion_complete(result.fitsfile, result.outfile, 2, 2))
+
+            # Same bytes as a direct conversion
+            outfile = results[0].outfile
+            with open(outfile, "rb") as f:
+                batch_bytes = f.read()
+            fits2fil(self.fitsfiles[0], outfile, dchan_factor=2, dt_factor=2)
+            with open(outfile, "rb") as f:
+                self.assertEqual(f.read(), batch_bytes)
+
+            # Truncate one output to simulate an interrupted run
+            with open(results[1].outfile, "r+b") as f:
+                f.truncate(os.path.getsize(results[1].outfile) - 10)
+            results = batch_fits2fil(self.fitsfiles, outdir, dchan_factor=2, dt_factor=2, workers=2)
+            self.assertEqual([r.status for r in results], ["skipped", "ok"])
+
+            results = batch_fits2fil(self.fitsfiles, outdir, dchan_factor=2, dt_factor=2, workers=1, overwrite=True)
+            self.assertEqual([r.status for r in results], ["ok", "ok"])
+
+    def test_batch_isolates_failures(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            fitsfiles = ["tests/testdata/missing.fits"] + self.fitsfiles[:1]
+            results = batch_fits2fil(fitsfiles, outdir, workers=2)
+            self.assertEqual([r.status for r in results], ["failed", "ok"])
+            self.assertIn("missing.fits", results[0].error)
+
+            report = format_batch_report(results)
+            self.assertIn("1 converted, 0 skipped, 1 failed", report)
+
+    def test_batch_rejects_duplicate_names(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            with self.assertRaises(ValueError):
+                batch_fits2fil(["a/x.fits", "b/x.fits"], outdir)
+
+    def test_batch_outfile(self):
+        self.assertEqual(batch_outfile("/data/beam01.fits", "/out"), "/out/beam01.fil")
+
+
+if __name__ == "__main__":
+    unittest.main()
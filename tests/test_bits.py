@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from psrtool.bits import pack_bits, unpack_bits
+
+
+class TestUnpackBits(unittest.TestCase):
+
+    def test_known_patterns_big_endian(self):
+        packed = np.array([0b10000001, 0b11100100, 0xAB], dtype=np.uint8)
+        np.testing.assert_array_equal(unpack_bits(packed[:1], 1), [1, 0, 0, 0, 0, 0, 0, 1])
+        np.testing.assert_array_equal(unpack_bits(packed[1:2], 2), [3, 2, 1, 0])
+        np.testing.assert_array_equal(unpack_bits(packed[2:], 4), [10, 11])
+
+    def test_known_patterns_little_endian(self):
+        np.testing.assert_array_equal(unpack_bits(np.array([0b00000011], dtype=np.uint8), 1, "little"), [1, 1, 0, 0, 0, 0, 0, 0])
+        np.testing.assert_array_equal(unpack_bits(np.array([0b11100100], dtype=np.uint8), 2, "little"), [0, 1, 2, 3])
+        np.testing.assert_array_equal(unpack_bits(np.array([0xAB], dtype=np.uint8), 4, "little"), [11, 10])
+
+    def test_unpacks_last_axis(self):
+        packed = np.array([[0x12, 0x34], [0x56, 0x78]], dtype=np.uint8)
+        np.testing.assert_array_equal(unpack_bits(packed, 4), [[1, 2, 3, 4], [5, 6, 7, 8]])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            unpack_bits(np.zeros(1, dtype=np.uint8), 3)
+        with self.assertRaises(ValueError):
+            unpack_bits(np.zeros(1, dtype=np.uint8), 2, "middle")
+
+
+class TestPackBits(unittest.TestCase):
+
+    def test_known_patterns(self):
+        np.testing.assert_array_equal(pack_bits(np.array([3, 2, 1, 0]), 2), [0b11100100])
+        np.testing.assert_array_equal(pack_bits(np.array([3, 2, 1, 0]), 2, "little"), [0b00011011])
+        np.testing.assert_array_equal(pack_bits(np.array([10, 11]), 4), [0xAB])
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(3)
+        for nbits in (1, 2, 4):
+            data = rng.integers(0, 1 << nbits, size=(5, 64), dtype=np.uint8)
+            for bitorder in ("big", "little"):
+                packed = pack_bits(data, nbits, bitorder)
+                self.assertEqual(packed.shape, (5, 64 * nbits // 8))
+                np.testing.assert_array_equal(unpack_bits(packed, nbits, bitorder), data)
+
+    def test_length_must_fill_bytes(self):
+        with self.assertRaises(ValueError):
+            pack_bits(np.zeros(3, dtype=np.uint8), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
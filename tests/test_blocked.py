@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from astropy.io import fits
+
+from psrtool.blocked import BlockedSpectra, blocked_header_path, create_blocked
+from psrtool.combinefits import combinefits
+from psrtool.fits2fil import fits2fil
+from psrtool.psrfits import get_stokesi_data, get_stokesi_downsampled
+from psrtool.sigproc import Filterbank, make_header
+
+
+class TestBlockedSpectra(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "out.npy")
+        self.header = make_header("TEST", nchans=300, foff=-1.0, fch1=1500.0, tsamp=1e-3, tstart=60000.0, nbits=32)
+
+    def test_slices_round_trip(self):
+        spectra = np.random.default_rng(0).normal(size=(1000, 300)).astype(np.float32)
+        with create_blocked(self.path, self.header, 1000, block_length=384) as blocked:
+            blocked[0:500] = spectra[:500]
+            blocked[500:1000] = spectra[500:]
+            blocked[100:110] = 7.0
+        spectra[100:110] = 7.0
+
+        data = np.load(self.path)
+        self.assertEqual(data.shape, (3, 300, 384))
+        np.testing.assert_array_equal(data[1, 5], spectra[384:768, 5])
+        np.testing.assert_array_equal(data[2, :, 1000 - 768 :], 0)
+        with BlockedSpectra(self.path) as blocked:
+            self.assertEqual(blocked.shape, (1000, 300))
+            self.assertEqual(blocked.fch1, 1500.0)
+            np.testing.assert_array_equal(blocked.get_spectra(300, 500), spectra[300:800])
+            np.testing.assert_array_equal(blocked.get_channel(17), spectra[:, 17])
+            with self.assertRaises(IndexError):
+                blocked[::2]
+
+    def test_rejects_packed_samples(self):
+        with self.assertRaises(ValueError):
+            create_blocked(self.path, dict(self.header, nbits=2), 1000, 384)
+        with self.assertRaises(ValueError):
+            create_blocked(self.path, self.header, 1000, 0)
+
+
+class TestChannelMajorConversion(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits"
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.outfile = os.path.join(self.tmpdir.name, "out.npy")
+
+    def test_fits2fil_channel_layout(self):
+        fits2fil(self.fitsfiles[1], self.outfile, dchan_factor=2, dt_factor=3, nsubint_per_chunk=1,
+                 layout="channel", block_length=1000)
+        self.assertFalse(os.path.exists(self.outfile + ".part"))
+        expected = get_stokesi_downsampled(self.fitsfiles[1], dchan_factor=2, dt_factor=3)
+        filfile = os.path.join(self.tmpdir.name, "out.fil")
+        fits2fil(self.fitsfiles[1], filfile, dchan_factor=2, dt_factor=3)
+        with BlockedSpectra(self.outfile) as blocked, Filterbank(filfile) as fil:
+            np.testing.assert_array_equal(blocked[:], expected)
+            for key in ("fch1", "foff", "tsamp", "tstart", "nbits"):
+                self.assertEqual(blocked.header[key], fil.header[key])
+
+    def test_combinefits_channel_layout_with_gap(self):
+        first = os.path.join(self.tmpdir.name, "first.fits")
+        second = os.path.join(self.tmpdir.name, "second.fits")
+        shutil.copy(self.fitsfiles[0], first)
+        shutil.copy(self.fitsfiles[1], second)
+        tbin = fits.getval(second, "TBIN", ext=1)
+        fits.setval(second, "STT_OFFS", value=fits.getval(second, "STT_OFFS", ext=0) + 10 * tbin, ext=0)
+        data1, data2 = get_stokesi_data(first), get_stokesi_data(second)
+        median = np.median(data1[-1024:], axis=0).astype(np.uint8)
+        expected = np.vstack([data1, np.tile(median, (10, 1)), data2])
+        for workers in (1, 2):
+            combinefits([first, second], self.outfile, nsubint_per_chunk=1, gap_policy="median", workers=workers,
+                        layout="channel", block_length=3000)
+            self.assertTrue(os.path.exists(blocked_header_path(self.outfile)))
+            with BlockedSpectra(self.outfile) as blocked:
+                np.testing.assert_array_equal(blocked[:], expected)
+
+    def test_channel_layout_needs_whole_bytes(self):
+        with self.assertRaises(ValueError):
+            fits2fil(self.fitsfiles[1], self.outfile, nbits_out=2, layout="channel")
+        with self.assertRaises(ValueError):
+            fits2fil(self.fitsfiles[1], self.outfile, layout="frequency")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+
+from astropy.io import fits
+from unittest.mock import patch
+
+from psrtool import fits2fil as fits2fil_module
+from psrtool.blocked import break_link, open_output
+from psrtool.cache import ConversionCache
+from psrtool.combinefits import combinefits
+from psrtool.fits2fil import fits2fil
+from psrtool.sigproc import Filterbank
+
+
+class TestConversionCache(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits"
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def read(self, path):
+        with Filterbank(path) as fil:
+            return fil.get_spectra(0, fil.nspectra)
+
+    def test_fits2fil_hit_links_output(self):
+        fitsfile = self.path("obs.fits")
+        shutil.copy(self.fitsfiles[0], fitsfile)
+        first, second = self.path("a/first.fil"), self.path("b/second.fil")
+        fits2fil(fitsfile, first, dt_factor=2, rfi_mask=[3], cache_dir=self.cache_dir)
+        with patch.object(fits2fil_module, "run_pipeline") as run_pipeline:
+            fits2fil(fitsfile, second, dt_factor=2, rfi_mask=[3], threads=0, cache_dir=self.cache_dir)
+            run_pipeline.assert_not_called()
+        # Both outputs are linked with the read-only cached file
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(os.stat(second).st_nlink, 3)
+        self.assertFalse(os.stat(second).st_mode & stat.S_IWUSR)
+        self.assertTrue(os.path.exists(self.path("b/second.rfimask.npz")))
+        self.assertEqual(len(ConversionCache(self.cache_dir).entries()), 1)
+
+        # Other options, or a modified input, are converted again
+        fits2fil(fitsfile, self.path("third.fil"), dt_factor=4, cache_dir=self.cache_dir)
+        os.utime(fitsfile, ns=(0, 0))
+        fits2fil(fitsfile, self.path("fourth.fil"), dt_factor=2, rfi_mask=[3], cache_dir=self.cache_dir)
+        self.assertFalse(os.path.samefile(first, self.path("fourth.fil")))
+        np.testing.assert_array_equal(self.read(first), self.read(self.path("fourth.fil")))
+        self.assertEqual(len(ConversionCache(self.cache_dir).entries()), 3)
+
+    def test_combinefits_split_outputs(self):
+        second = self.path("second.fits")
+        shutil.copy(self.fitsfiles[1], second)
+        fits.setval(second, "STT_OFFS", value=fits.getval(second, "STT_OFFS", ext=0) + 1.0, ext=0)
+        inputs = [second, self.fitsfiles[0]]
+        result = combinefits(inputs, self.path("x.fil"), gap_policy="split", cache_dir=self.cache_dir)
+        cached = combinefits(inputs[::-1], self.path("y.fil"), gap_policy="split", workers=2, cache_dir=self.cache_dir)
+        self.assertEqual(cached.outfiles, [self.path("y_000.fil"), self.path("y_001.fil")])
+        self.assertEqual(cached.gaps, result.gaps)
+        for made, linked in zip(result.outfiles, cached.outfiles):
+            self.assertTrue(os.path.samefile(made, linked))
+
+    def test_writing_linked_output_leaves_cache_intact(self):
+        first, second = self.path("first.fil"), self.path("second.fil")
+        fits2fil(self.fitsfiles[0], first, cache_dir=self.cache_dir)
+        fits2fil(self.fitsfiles[0], second, cache_dir=self.cache_dir)
+        expected = self.read(first)
+        break_link(second)
+        fil, out = open_output(second)
+        with fil:
+            out[:] = 0
+        self.assertEqual(os.stat(second).st_nlink, 1)
+        self.assertTrue(np.all(self.read(second) == 0))
+        np.testing.assert_array_equal(self.read(first), expected)
+        third = self.path("third.fil")
+        fits2fil(self.fitsfiles[0], third, cache_dir=self.cache_dir)
+        np.testing.assert_array_equal(self.read(third), expected)
+
+    def test_lru_eviction_skips_locked_entries(self):
+        cache = ConversionCache(self.cache_dir)
+        for name, dt_factor in (("old.fil", 1), ("new.fil", 2)):
+            fits2fil(self.fitsfiles[0], self.path(name), dt_factor=dt_factor, cache_dir=self.cache_dir)
+        old, new = [key for key, _, _ in cache.entries()]
+        for when, key in enumerate((old, new)):
+            os.utime(os.path.join(self.cache_dir, "entries", key, "manifest.json"), (when, when))
+        # Using the older entry makes it the most recently used
+        with cache.lock(old):
+            self.assertIsNotNone(cache.fetch(old, self.path("again.fil")))
+        self.assertEqual([key for key, _, _ in cache.entries()], [new, old])
+        with cache.lock(new):
+            self.assertEqual(cache.evict(0), [old])
+        self.assertEqual(cache.evict(0), [new])
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, "locks")), [])
+        # Outputs linked from evicted entries stay valid
+        self.assertTrue(os.path.getsize(self.path("again.fil")) > 0)
+
+    def test_waiter_relocks_removed_lock_file(self):
+        cache = ConversionCache(self.cache_dir)
+        lock_path = os.path.join(self.cache_dir, "locks", "key.lock")
+        held = []
+
+        def wait():
+            with cache.lock("key"):
+                held.append(os.path.exists(lock_path))
+
+        with cache.lock("key"):
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            time.sleep(0.1)
+            # As evict does, while the lock is held
+            os.remove(lock_path)
+        waiter.join()
+        self.assertEqual(held, [True])
+
+    def test_uncached_conversions_skip_cache_module(self):
+        code = (
+            "import sys\n"
+            "from psrtool.combinefits import combinefits\n"
+            "from psrtool.fits2fil import fits2fil\n"
+            f"fits2fil({self.fitsfiles[0]!r}, {self.path('a.fil')!r})\n"
+            f"combinefits({self.fitsfiles!r}, {self.path('b.fil')!r})\n"
+            "print('psrtool.cache' in sys.modules)\n"
+        )
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip().splitlines()[-1], "False")
+
+
+if __name__ == "__main__":
+    unittest.main()
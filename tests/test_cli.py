@@ -1,38 +1,294 @@
+import json
+import subprocess
 import sys
 import unittest
 from unittest.mock import patch
 
 from psrtool import cli
+from psrtool.combinefits import CombineResult
+from psrtool.options import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES
 
 
 class TestCLI(unittest.TestCase):
-    @patch("psrtool.cli.combinefits")
+    @patch("psrtool.combinefits.combinefits", return_value=CombineResult(["out.fil"], []))
     def test_combinefitscli_calls_impl(self, mock_combine):
         argv = ["prog", "a.fits", "b.fits", "-o", "out.fil", "-c", "4", "-t", "2"]
         with patch.object(sys, "argv", argv):
             cli.combinefitscli()
 
         mock_combine.assert_called_once_with(
-            ["a.fits", "b.fits"], "out.fil", dchan_factor=4, dt_factor=2
+            ["a.fits", "b.fits"],
+            "out.fil",
+            dchan_factor=4,
+            dt_factor=2,
+            nsubint_per_chunk=16,
+            threads=1,
+            prefetch=2,
+            index_path=None,
+            scan_workers=None,
+            gap_policy="error",
+            repack=False,
+            apply_scales=False,
+            requantize=None,
+            workers=1,
+            nbits_out=None,
+            start=None,
+            start_mjd=None,
+            duration=None,
+            fmin=None,
+            fmax=None,
+            rfi_sigma=None,
+            rfi_mask=None,
+            rfi_fill="mean",
+            layout="time",
+            block_length=8192,
+            cache_dir=None,
+            cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
         )
 
-    @patch("psrtool.cli.fits2fil")
+    @patch("psrtool.combinefits.combinefits", return_value=CombineResult(["out.fil"], []))
+    def test_combinefitscli_cache(self, mock_combine):
+        for flags, cache_dir in ((["--cache"], DEFAULT_CACHE_DIR), (["--cache", "/shared/cache"], "/shared/cache")):
+            with self.subTest(flags=flags):
+                argv = ["prog", "a.fits", "-o", "out.fil", "--cache-max-gb", "0.5"] + flags
+                with patch.object(sys, "argv", argv):
+                    cli.combinefitscli()
+                kwargs = mock_combine.call_args.kwargs
+                self.assertEqual(kwargs["cache_dir"], cache_dir)
+                self.assertEqual(kwargs["cache_max_bytes"], 512 * 1024**2)
+
+    @patch("psrtool.combinefits.follow_combinefits", return_value=CombineResult(["out.fil"], []))
+    def test_combinefitscli_follow(self, mock_follow):
+        argv = ["prog", "incoming/", "-o", "out.fil", "--follow", "--poll-interval", "2", "--idle-timeout", "60"]
+        with patch.object(sys, "argv", argv):
+            cli.combinefitscli()
+
+        mock_follow.assert_called_once_with(
+            ["incoming/"],
+            "out.fil",
+            dchan_factor=1,
+            dt_factor=1,
+            nsubint_per_chunk=16,
+            threads=1,
+            prefetch=2,
+            gap_policy="error",
+            repack=False,
+            apply_scales=False,
+            requantize=None,
+            nbits_out=None,
+            poll_interval=2.0,
+            settle=10.0,
+            idle_timeout=60.0,
+            index_path=None,
+        )
+
+        argv = ["prog", "incoming/", "-o", "out.fil", "--follow", "--gap-policy", "split"]
+        with patch.object(sys, "argv", argv), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                cli.combinefitscli()
+
+    @patch("psrtool.combinefits.combinefits", return_value=CombineResult(["out.fil"], []))
+    def test_combinefitscli_chunk_size(self, mock_combine):
+        argv = [
+            "prog", "a.fits", "-o", "out.fil", "-n", "2", "--threads", "4", "--prefetch", "3",
+            "--index", "idx.json", "--scan-workers", "8", "--gap-policy", "zero", "-j", "4",
+        ]
+        with patch.object(sys, "argv", argv):
+            cli.combinefitscli()
+
+        mock_combine.assert_called_once_with(
+            ["a.fits"],
+            "out.fil",
+            dchan_factor=1,
+            dt_factor=1,
+            nsubint_per_chunk=2,
+            threads=4,
+            prefetch=3,
+            index_path="idx.json",
+            scan_workers=8,
+            gap_policy="zero",
+            repack=False,
+            apply_scales=False,
+            requantize=None,
+            workers=4,
+            nbits_out=None,
+            start=None,
+            start_mjd=None,
+            duration=None,
+            fmin=None,
+            fmax=None,
+            rfi_sigma=None,
+            rfi_mask=None,
+            rfi_fill="mean",
+            layout="time",
+            block_length=8192,
+            cache_dir=None,
+            cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+        )
+
+    @patch("psrtool.fits2fil.fits2fil")
     def test_fits2filcli_calls_impl(self, mock_fits2fil):
         argv = ["prog", "input.fits", "-o", "out.fil", "-c", "4", "-t", "2"]
         with patch.object(sys, "argv", argv):
             cli.fits2filcli()
 
         mock_fits2fil.assert_called_once_with(
-            "input.fits", "out.fil", dchan_factor=4, dt_factor=2
+            "input.fits",
+            "out.fil",
+            dchan_factor=4,
+            dt_factor=2,
+            nsubint_per_chunk=16,
+            threads=1,
+            prefetch=2,
+            repack=False,
+            apply_scales=False,
+            requantize=None,
+            nbits_out=None,
+            start=None,
+            start_mjd=None,
+            duration=None,
+            fmin=None,
+            fmax=None,
+            rfi_sigma=None,
+            rfi_mask=None,
+            rfi_fill="mean",
+            layout="time",
+            block_length=8192,
+            cache_dir=None,
+            cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+        )
+
+    @patch("psrtool.fits2fil.fits2fil")
+    def test_fits2filcli_selection(self, mock_fits2fil):
+        argv = [
+            "prog", "input.fits", "-o", "out.fil", "--start-mjd", "60000.5", "--duration", "30",
+            "--fmin", "1100", "--fmax", "1200.5",
+        ]
+        with patch.object(sys, "argv", argv):
+            cli.fits2filcli()
+
+        kwargs = mock_fits2fil.call_args.kwargs
+        self.assertEqual(
+            (kwargs["start"], kwargs["start_mjd"], kwargs["duration"], kwargs["fmin"], kwargs["fmax"]),
+            (None, 60000.5, 30.0, 1100.0, 1200.5),
+        )
+
+    def test_fits2filcli_selection_rejected(self):
+        for extra in (["--start", "1", "--start-mjd", "60000"], ["--batch", "--fmin", "1100"]):
+            argv = ["prog", "a.fits", "-o", "out"] + extra
+            with self.subTest(extra=extra), patch.object(sys, "argv", argv), patch("sys.stderr"):
+                with self.assertRaises(SystemExit):
+                    cli.fits2filcli()
+
+    @patch("psrtool.batch.format_batch_report", return_value="")
+    @patch("psrtool.batch.batch_fits2fil", return_value=[])
+    def test_fits2filcli_batch(self, mock_batch, mock_report):
+        argv = ["prog", "--batch", "a.fits", "b.fits", "-o", "outdir", "-j", "3"]
+        with patch.object(sys, "argv", argv):
+            cli.fits2filcli()
+
+        mock_batch.assert_called_once_with(
+            ["a.fits", "b.fits"],
+            "outdir",
+            dchan_factor=1,
+            dt_factor=1,
+            workers=3,
+            nsubint_per_chunk=16,
+            threads=1,
+            overwrite=False,
+            repack=False,
+            apply_scales=False,
+            requantize=None,
+            nbits_out=None,
+            rfi_sigma=None,
+            rfi_mask=None,
+            rfi_fill="mean",
+            cache_dir=None,
+            cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
         )
 
-    @patch("psrtool.cli.fil2fits")
+    def test_fits2filcli_requantize_requires_apply_scales(self):
+        argv = ["prog", "a.fits", "-o", "out.fil", "--requantize", "saturate"]
+        with patch.object(sys, "argv", argv), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                cli.fits2filcli()
+
+    def test_fits2filcli_requires_single_input(self):
+        argv = ["prog", "a.fits", "b.fits", "-o", "out.fil"]
+        with patch.object(sys, "argv", argv), patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                cli.fits2filcli()
+
+    @patch("psrtool.fits2fil.fil2fits")
     def test_fil2fitscli_calls_impl(self, mock_fil2fits):
         argv = ["prog", "input.fil", "-o", "out.fits"]
         with patch.object(sys, "argv", argv):
             cli.fil2fitscli()
 
-        mock_fil2fits.assert_called_once_with("input.fil", "out.fits")
+        mock_fil2fits.assert_called_once_with("input.fil", "out.fits", nsblk=1024, nsubint_per_chunk=16)
+
+    @patch("psrtool.fits2fil.fil2fits")
+    def test_fil2fitscli_block_size(self, mock_fil2fits):
+        argv = ["prog", "input.fil", "-o", "out.fits", "-b", "256", "-n", "4"]
+        with patch.object(sys, "argv", argv):
+            cli.fil2fitscli()
+
+        mock_fil2fits.assert_called_once_with("input.fil", "out.fits", nsblk=256, nsubint_per_chunk=4)
+
+    @patch("psrtool.fits2fil.fildecimate")
+    def test_fildecimatecli_calls_impl(self, mock_fildecimate):
+        argv = ["prog", "input.fil", "-o", "out.fil", "-c", "2", "-t", "8", "--threads", "4"]
+        with patch.object(sys, "argv", argv):
+            cli.fildecimatecli()
+
+        mock_fildecimate.assert_called_once_with(
+            "input.fil",
+            "out.fil",
+            dchan_factor=2,
+            dt_factor=8,
+            nspectra_per_chunk=16384,
+            threads=4,
+            prefetch=2,
+            repack=False,
+            nbits_out=None,
+        )
+
+
+class TestCLIStartup(unittest.TestCase):
+    # Import time budget of psrtool.cli in seconds, with a wide margin over
+    # the ~15 ms it takes without the converters' dependencies
+    IMPORT_BUDGET = 0.15
+
+    def run_help(self, command: str) -> tuple[list[str], float]:
+        """Run ``<command> --help`` in a fresh interpreter; return heavy modules loaded and cli import time."""
+        code = (
+            "import json, sys\n"
+            f"sys.argv = ['{command}', '--help']\n"
+            "from psrtool import cli\n"
+            "try:\n"
+            f"    cli.{command}cli()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "heavy = ('numpy', 'astropy', 'your', 'tqdm')\n"
+            "print(json.dumps(sorted(name for name in sys.modules if name.split('.')[0] in heavy)))\n"
+        )
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+        # -X importtime lines are "import time: self | cumulative | module", in microseconds
+        cumulative = [
+            int(line.split("|")[1]) for line in proc.stderr.splitlines() if line.split("|")[-1].strip() == "psrtool.cli"
+        ]
+        return loaded, cumulative[0] / 1e6
+
+    def test_help_skips_heavy_imports(self):
+        for command in ("fits2fil", "combinefits", "fil2fits", "fildecimate"):
+            with self.subTest(command=command):
+                loaded, _ = self.run_help(command)
+                self.assertEqual(loaded, [])
+
+    def test_fits2fil_help_import_budget(self):
+        _, seconds = self.run_help("fits2fil")
+        self.assertLess(seconds, self.IMPORT_BUDGET)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,17 @@
 
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
+from astropy.io import fits
 from your import Your
 from unittest.mock import patch
 
-from psrtool.combinefits import combinefits
+from psrtool import combinefits as combinefits_module
+from psrtool.combinefits import combinefits, follow_combinefits, format_combine_report
+from psrtool.psrfits import get_stokesi_data
+from psrtool.synthetic import make_synthetic_psrfits
 
 class TestCombineFits(unittest.TestCase):
 
@@ -33,3 +40,290 @@ class TestCombineFits(unittest.TestCase):
         data_fits = out_fil.get_data(0, out_header.nspectra, pol=0)
         np.testing.assert_array_equal(data_fil, data_fits)
         
+    def test_combinefits_chunk_size_invariant(self):
+        fitsfiles = [
+            "tests/testdata/test1.fits",
+            "tests/testdata/test2.fits"
+        ]
+        outfile = "/tmp/combined_chunked.fil"
+
+        combinefits(fitsfiles, outfile, dchan_factor=2, dt_factor=3, nsubint_per_chunk=4)
+        with open(outfile, "rb") as f:
+            reference = f.read()
+        for nsubint_per_chunk in (1, 3):
+            combinefits(fitsfiles, outfile, dchan_factor=2, dt_factor=3, nsubint_per_chunk=nsubint_per_chunk)
+            with open(outfile, "rb") as f:
+                self.assertEqual(f.read(), reference)
+
+    def test_combinefits_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            combinefits(["tests/testdata/test1.fits"], "/tmp/combined_bad.fil", nsubint_per_chunk=0)
+
+class TestCombineFitsGaps(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits"
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.data1 = get_stokesi_data(self.fitsfiles[0])
+        self.data2 = get_stokesi_data(self.fitsfiles[1])
+
+    def shifted_copies(self, nshift):
+        """Copy the test files with names that sort in reverse time order,
+        moving the second file's start by ``nshift`` samples."""
+        first = os.path.join(self.tmpdir.name, "z_first.fits")
+        second = os.path.join(self.tmpdir.name, "a_second.fits")
+        shutil.copy(self.fitsfiles[0], first)
+        shutil.copy(self.fitsfiles[1], second)
+        tbin = fits.getval(second, "TBIN", ext=1)
+        offs = fits.getval(second, "STT_OFFS", ext=0)
+        fits.setval(second, "STT_OFFS", value=offs + nshift * tbin, ext=0)
+        return [second, first]
+
+    def read_data(self, filfile):
+        fil = Your(filfile)
+        return fil.get_data(0, fil.your_header.nspectra, pol=0).reshape(-1, 128)
+
+    def test_orders_by_start_time(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        result = combinefits(self.shifted_copies(0), outfile)
+        self.assertEqual(result.outfiles, [outfile])
+        self.assertEqual(result.gaps, [])
+        np.testing.assert_array_equal(self.read_data(outfile), np.vstack([self.data1, self.data2]))
+
+    def test_gap_error(self):
+        with self.assertRaises(ValueError):
+            combinefits(self.shifted_copies(10), os.path.join(self.tmpdir.name, "out.fil"))
+
+    def test_gap_zero_fill(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        result = combinefits(self.shifted_copies(10), outfile, gap_policy="zero")
+        self.assertEqual(len(result.gaps), 1)
+        self.assertEqual(result.gaps[0].nsamples, 10)
+        self.assertGreater(result.gaps[0].seconds, 0)
+        expected = np.vstack([self.data1, np.zeros((10, 128), dtype=np.uint8), self.data2])
+        np.testing.assert_array_equal(self.read_data(outfile), expected)
+        self.assertIn("1 gap(s)", format_combine_report(result))
+
+    def test_gap_median_fill(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        combinefits(self.shifted_copies(10), outfile, gap_policy="median", nsubint_per_chunk=1)
+        median = np.median(self.data1[-1024:], axis=0).astype(np.uint8)
+        data = self.read_data(outfile)
+        self.assertEqual(data.shape[0], 8192 + 10)
+        np.testing.assert_array_equal(data[4096:4106], np.tile(median, (10, 1)))
+
+    def test_gap_split(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        result = combinefits(self.shifted_copies(10), outfile, gap_policy="split")
+        self.assertEqual(
+            result.outfiles,
+            [os.path.join(self.tmpdir.name, "out_000.fil"), os.path.join(self.tmpdir.name, "out_001.fil")],
+        )
+        np.testing.assert_array_equal(self.read_data(result.outfiles[0]), self.data1)
+        np.testing.assert_array_equal(self.read_data(result.outfiles[1]), self.data2)
+        self.assertNotEqual(Your(result.outfiles[1]).your_header.tstart, Your(result.outfiles[0]).your_header.tstart)
+
+    def test_overlap_trimmed(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        result = combinefits(self.shifted_copies(-5), outfile, gap_policy="zero")
+        self.assertEqual(result.gaps[0].nsamples, 5)
+        self.assertLess(result.gaps[0].seconds, 0)
+        np.testing.assert_array_equal(self.read_data(outfile), np.vstack([self.data1, self.data2[5:]]))
+
+    def test_parallel_matches_serial(self):
+        for nshift, gap_policy in ((0, "error"), (10, "median"), (10, "zero"), (-5, "median")):
+            files = self.shifted_copies(nshift)
+            outfile = os.path.join(self.tmpdir.name, "out.fil")
+            reference = os.path.join(self.tmpdir.name, "serial.fil")
+            # Both runs write the same output name, since the header records it
+            combinefits(files, outfile, 2, 3, nsubint_per_chunk=1, gap_policy=gap_policy)
+            shutil.move(outfile, reference)
+            combinefits(files, outfile, 2, 3, nsubint_per_chunk=1, gap_policy=gap_policy, workers=2)
+            with open(reference, "rb") as f1, open(outfile, "rb") as f2:
+                self.assertEqual(f1.read(), f2.read(), (nshift, gap_policy))
+
+    def test_invalid_gap_policy(self):
+        with self.assertRaises(ValueError):
+            combinefits(self.fitsfiles, "/tmp/combined_bad.fil", gap_policy="ignore")
+
+
+class TestCombineFitsWindow(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits"
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.outfile = os.path.join(self.tmpdir.name, "out.fil")
+        self.full = np.vstack([get_stokesi_data(path) for path in self.fitsfiles])
+        self.tbin = fits.getval(self.fitsfiles[0], "TBIN", ext=1)
+
+    def read(self, filfile):
+        fil = Your(filfile)
+        return fil.your_header, fil.get_data(0, fil.your_header.nspectra, pol=0).reshape(fil.your_header.nspectra, -1)
+
+    def test_window_across_files(self):
+        combinefits(self.fitsfiles, self.outfile, start=4000 * self.tbin, duration=200 * self.tbin, nsubint_per_chunk=1)
+        header, data = self.read(self.outfile)
+        np.testing.assert_array_equal(data, self.full[4000:4200])
+        reference = Your("tests/testdata/combined.fil").your_header
+        self.assertAlmostEqual((header.tstart - reference.tstart) * 86400, 4000 * self.tbin, places=5)
+
+    def test_window_start_mjd_and_downsampling(self):
+        reference = Your("tests/testdata/combined.fil").your_header
+        start_mjd = reference.tstart + 100 * self.tbin / 86400
+        combinefits(self.fitsfiles, self.outfile, dt_factor=4, start_mjd=start_mjd, duration=80 * self.tbin)
+        _, data = self.read(self.outfile)
+        expected = self.full[100:180].reshape(20, 4, -1).mean(axis=1).astype(np.uint8)
+        np.testing.assert_array_equal(data, expected)
+
+    def test_files_outside_window_not_read(self):
+        opened = []
+        iter_pol_chunks = combinefits_module.iter_pol_chunks
+
+        def record(path, *args, **kwargs):
+            opened.append(path)
+            return iter_pol_chunks(path, *args, **kwargs)
+
+        with patch.object(combinefits_module, "iter_pol_chunks", record):
+            combinefits(self.fitsfiles, self.outfile, start=5000 * self.tbin, duration=10 * self.tbin)
+        self.assertEqual(opened, [self.fitsfiles[1]])
+        _, data = self.read(self.outfile)
+        np.testing.assert_array_equal(data, self.full[5000:5010])
+
+    def test_channel_range(self):
+        fch1 = Your("tests/testdata/combined.fil").your_header.fch1
+        foff = Your("tests/testdata/combined.fil").your_header.foff
+        fmin, fmax = sorted((fch1 + 10 * foff, fch1 + 41 * foff))
+        combinefits(self.fitsfiles, self.outfile, dchan_factor=2, fmin=fmin, fmax=fmax, workers=2)
+        header, data = self.read(self.outfile)
+        self.assertEqual(header.nchans, 16)
+        self.assertAlmostEqual(header.fch1, fch1 + 10 * foff)
+        expected = self.full[:, 10:42].reshape(-1, 16, 2).mean(axis=2).astype(np.uint8)
+        np.testing.assert_array_equal(data, expected)
+
+    def test_empty_window(self):
+        with self.assertRaises(ValueError):
+            combinefits(self.fitsfiles, self.outfile, start=1e6)
+        with self.assertRaises(ValueError):
+            combinefits(self.fitsfiles, self.outfile, fmin=1e6)
+
+
+class TestFollowCombineFits(unittest.TestCase):
+    nsamples = 4 * 64
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.indir = os.path.join(self.tmpdir.name, "incoming")
+        os.makedirs(self.indir)
+        self.outfile = os.path.join(self.tmpdir.name, "out.fil")
+        self.reference = os.path.join(self.tmpdir.name, "ref.fil")
+
+    def add_file(self, i, shift=0):
+        path = os.path.join(self.indir, f"obs_{i:02d}.fits")
+        make_synthetic_psrfits(
+            path, nsubint=4, nsblk=64, nchan=32, npol=2, seed=i, stt_offs=(i * self.nsamples + shift) * 64e-6
+        )
+        return path
+
+    def follow(self, **kwargs):
+        return follow_combinefits(
+            [self.indir], self.outfile, poll_interval=0, settle=0, idle_timeout=0, nsubint_per_chunk=1, **kwargs
+        )
+
+    def assert_matches_combinefits(self, **kwargs):
+        files = sorted(os.path.join(self.indir, name) for name in os.listdir(self.indir))
+        combinefits(files, self.reference, nsubint_per_chunk=1, **kwargs)
+        with open(self.outfile, "rb") as f1, open(self.reference, "rb") as f2:
+            self.assertEqual(f1.read().replace(self.outfile.encode(), b""), f2.read().replace(self.reference.encode(), b""))
+
+    def test_appends_new_files(self):
+        self.add_file(0)
+        self.add_file(1)
+        result = self.follow(dchan_factor=2, dt_factor=3)
+        self.assertEqual(result.outfiles, [self.outfile])
+        self.assert_matches_combinefits(dchan_factor=2, dt_factor=3)
+
+        self.add_file(2)
+        opened = []
+        iter_pol_chunks = combinefits_module.iter_pol_chunks
+
+        def record(path, *args, **kwargs):
+            opened.append(os.path.basename(path))
+            return iter_pol_chunks(path, *args, **kwargs)
+
+        with patch.object(combinefits_module, "iter_pol_chunks", record):
+            self.follow(dchan_factor=2, dt_factor=3)
+        self.assertEqual(opened, ["obs_02.fits"])
+        self.assert_matches_combinefits(dchan_factor=2, dt_factor=3)
+
+    def test_resumes_partial_output(self):
+        for i in range(3):
+            self.add_file(i)
+        self.follow(dt_factor=2)
+        size = os.path.getsize(self.outfile)
+        # Interrupted in the middle of a spectrum of the second file
+        with open(self.outfile, "r+b") as f:
+            f.truncate(size - 200 * 32 - 7)
+        self.follow(dt_factor=2)
+        self.assertEqual(os.path.getsize(self.outfile), size)
+        self.assert_matches_combinefits(dt_factor=2)
+
+        with self.assertRaises(ValueError):
+            self.follow(dt_factor=4)
+
+    def test_appends_to_own_copy_of_linked_output(self):
+        self.add_file(0)
+        self.follow()
+        # e.g. an output linked from a conversion cache
+        linked = os.path.join(self.tmpdir.name, "linked.fil")
+        os.link(self.outfile, linked)
+        os.chmod(linked, 0o444)
+        with open(linked, "rb") as f:
+            before = f.read()
+        self.add_file(1)
+        self.follow()
+        self.assertEqual(os.stat(self.outfile).st_nlink, 1)
+        self.assertGreater(os.path.getsize(self.outfile), len(before))
+        with open(linked, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assert_matches_combinefits()
+
+    def test_gap_fill(self):
+        self.add_file(0)
+        self.add_file(1, shift=10)
+        result = self.follow(gap_policy="zero")
+        self.assertEqual(result.gaps[0].nsamples, 10)
+        self.assert_matches_combinefits(gap_policy="zero")
+        with self.assertRaises(ValueError):
+            self.follow(gap_policy="split")
+
+    def test_gap_error_and_late_file(self):
+        self.add_file(0)
+        self.add_file(2)
+        with self.assertRaises(ValueError):
+            self.follow()
+        self.assertFalse(os.path.exists(self.outfile))
+
+        follower = combinefits_module._Follower(
+            self.outfile, 0, None, dchan_factor=1, dt_factor=1, nsubint_per_chunk=1, threads=1, prefetch=2,
+            gap_policy="zero", repack=False, apply_scales=False, requantize=None, nbits_out=None,
+        )
+        self.assertTrue(follower.poll([self.indir]))
+        self.assertFalse(follower.poll([self.indir]))
+        self.add_file(1)
+        with self.assertRaises(ValueError):
+            follower.poll([self.indir])
+
+    def test_waits_for_settled_files(self):
+        self.add_file(0)
+        result = follow_combinefits([self.indir], self.outfile, poll_interval=0, settle=3600, idle_timeout=0)
+        self.assertEqual(result.gaps, [])
+        self.assertFalse(os.path.exists(self.outfile))
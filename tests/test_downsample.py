@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+
+from psrtool.downsample import Downsampler, accumulator_dtype, downsample, _reference_downsample
+
+
+class TestAccumulatorDtype(unittest.TestCase):
+
+    def test_narrowest_safe_type(self):
+        self.assertEqual(accumulator_dtype(np.uint8, 32), np.uint16)
+        self.assertEqual(accumulator_dtype(np.uint8, 1024), np.uint32)
+        self.assertEqual(accumulator_dtype(np.int8, 64), np.int16)
+        self.assertEqual(accumulator_dtype(np.uint16, 4), np.uint32)
+        self.assertEqual(accumulator_dtype(np.float32, 32), np.float32)
+
+    def test_unsupported_dtype(self):
+        with self.assertRaises(TypeError):
+            accumulator_dtype(np.complex64, 2)
+
+
+class TestDownsample(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.data = {
+            np.uint8: rng.integers(0, 256, size=(203, 67), dtype=np.uint8),
+            np.uint16: rng.integers(0, 65536, size=(203, 67), dtype=np.uint16),
+            np.int8: rng.integers(-128, 128, size=(203, 67), dtype=np.int8),
+            np.float32: (rng.normal(size=(203, 67)) * 50).astype(np.float32),
+        }
+
+    def test_matches_two_stage_mean(self):
+        for dtype, data in self.data.items():
+            for dchan_factor in (1, 2, 3, 8):
+                for dt_factor in (1, 2, 5):
+                    expected = _reference_downsample(data, dchan_factor, dt_factor)
+                    result = downsample(data, dchan_factor, dt_factor)
+                    self.assertEqual(result.dtype, data.dtype)
+                    np.testing.assert_array_equal(result, expected, err_msg=f"{dtype} {dchan_factor} {dt_factor}")
+
+    def test_saturated_input(self):
+        data = np.full((64, 64), 255, dtype=np.uint8)
+        np.testing.assert_array_equal(downsample(data, 16, 16), np.full((4, 4), 255, dtype=np.uint8))
+
+    def test_out_buffer(self):
+        data = self.data[np.uint8]
+        out = np.empty((203 // 4, 67 // 2), dtype=np.uint8)
+        result = downsample(data, 2, 4, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, _reference_downsample(data, 2, 4))
+
+        with self.assertRaises(ValueError):
+            downsample(data, 2, 4, out=np.empty((1, 1), dtype=np.uint8))
+
+    def test_64bit_input(self):
+        rng = np.random.default_rng(3)
+        for dtype in (np.int64, np.uint64):
+            data = rng.integers(0, 1 << 40, size=(40, 16)).astype(dtype)
+            result = downsample(data, 2, 4)
+            self.assertEqual(result.dtype, dtype)
+            np.testing.assert_array_equal(result, _reference_downsample(data, 2, 4))
+            parts = Downsampler(dchan_factor=2, dt_factor=3)
+            np.testing.assert_array_equal(
+                np.vstack([parts.process(data[:7]), parts.process(data[7:])]), _reference_downsample(data, 2, 3)
+            )
+
+    def test_invalid_factors(self):
+        with self.assertRaises(ValueError):
+            downsample(self.data[np.uint8], 0, 1)
+
+
+class TestDownsampler(unittest.TestCase):
+
+    def test_streaming_matches_whole(self):
+        data = np.random.default_rng(1).integers(0, 256, size=(500, 32), dtype=np.uint8)
+        expected = _reference_downsample(data, 4, 7)
+        for chunk in (1, 5, 7, 64):
+            downsampler = Downsampler(dchan_factor=4, dt_factor=7)
+            parts = [downsampler.process(data[i:i + chunk]) for i in range(0, len(data), chunk)]
+            np.testing.assert_array_equal(np.vstack(parts), expected)
+            self.assertEqual(downsampler.ntail, len(data) % 7)
+
+    def test_output_length_and_out(self):
+        data = np.arange(40, dtype=np.uint8).reshape(10, 4)
+        downsampler = Downsampler(dt_factor=3)
+        self.assertEqual(downsampler.output_length(4), 1)
+        first = downsampler.process(data[:4])
+        self.assertEqual(downsampler.output_length(6), 2)
+        out = np.empty((2, 4), dtype=np.uint8)
+        second = downsampler.process(data[4:], out=out)
+        self.assertIs(second, out)
+        np.testing.assert_array_equal(np.vstack([first, second]), _reference_downsample(data, 1, 3))
+
+        downsampler.reset()
+        self.assertEqual(downsampler.ntail, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from astropy.io import fits
+
+from psrtool.fitswriter import PsrfitsWriter, split_mjd
+from psrtool.psrfits import get_stokesi_data, read_fits_header
+
+
+class TestPsrfitsWriter(unittest.TestCase):
+
+    def _writer(self, fitsfile, **kwargs):
+        params = dict(nchan=16, nsblk=32, tbin=1e-4, obsfreq=1400.0, obsbw=-200.0, stt_imjd=60000, src_name="J0000+0000")
+        params.update(kwargs)
+        return PsrfitsWriter(fitsfile, **params)
+
+    def test_write_spectra_in_pieces(self):
+        rng = np.random.default_rng(0)
+        spectra = rng.integers(0, 256, (150, 16), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "out.fits")
+            with self._writer(fitsfile) as writer:
+                for start in range(0, 150, 45):
+                    writer.write_spectra(spectra[start : start + 45])
+
+            with fits.open(fitsfile) as hdul:
+                hdul.verify("exception")
+                np.testing.assert_allclose(hdul[1].data["OFFS_SUB"], (np.arange(5) + 0.5) * 32e-4)
+                self.assertAlmostEqual(hdul[0].header["SCANLEN"], 5 * 32e-4)
+            header0, header1 = read_fits_header(fitsfile)
+            self.assertEqual(header1["NAXIS2"], 5)
+            self.assertEqual(header0["SRC_NAME"], "J0000+0000")
+            data = get_stokesi_data(fitsfile)
+            np.testing.assert_array_equal(data[:150], spectra)
+            np.testing.assert_array_equal(data[150:], 0)
+
+    def test_low_bit(self):
+        rng = np.random.default_rng(1)
+        spectra = rng.integers(0, 4, (64, 16), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "out.fits")
+            with self._writer(fitsfile, nbits=2) as writer:
+                writer.write_spectra(spectra)
+            self.assertEqual(fits.getval(fitsfile, "NBITS", 1), 2)
+            np.testing.assert_array_equal(get_stokesi_data(fitsfile), spectra)
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "out.fits")
+            with self.assertRaises(ValueError):
+                self._writer(fitsfile, nbits=3)
+            with self.assertRaises(ValueError):
+                self._writer(fitsfile, nsblk=0)
+
+    def test_split_mjd(self):
+        stt_imjd, stt_smjd, stt_offs = split_mjd(60000.5 + 1.25 / 86400)
+        self.assertEqual((stt_imjd, stt_smjd), (60000, 43201))
+        self.assertAlmostEqual(stt_offs, 0.25, places=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
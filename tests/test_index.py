@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from psrtool.index import FitsIndex, is_meta_contiguous, read_fits_meta, scan_fits_headers
+from psrtool.psrfits import is_time_contiguous, read_fits_header
+
+
+class TestFitsIndex(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test1.fits",
+        "tests/testdata/test2.fits",
+    ]
+
+    def test_read_fits_meta(self):
+        meta = read_fits_meta(self.fitsfiles[0])
+        self.assertEqual(meta.path, self.fitsfiles[0])
+        self.assertEqual(meta.nchan, 128)
+        self.assertEqual(meta.npol, 1)
+        self.assertEqual(meta.nbits, 8)
+        self.assertEqual(meta.nsamples, 4096)
+        self.assertEqual(meta.size, os.path.getsize(self.fitsfiles[0]))
+        self.assertAlmostEqual(meta.end_mjd, meta.start_mjd + meta.duration / 86400.0)
+
+    def test_contiguity_matches_header_check(self):
+        metas = scan_fits_headers(self.fitsfiles)
+        self.assertEqual(
+            is_meta_contiguous(metas[0], metas[1]),
+            is_time_contiguous(self.fitsfiles[0], self.fitsfiles[1]),
+        )
+        self.assertFalse(is_meta_contiguous(metas[1], metas[0]))
+
+    def test_headers_read_once(self):
+        with patch("psrtool.index.read_fits_header", wraps=read_fits_header) as mock_read:
+            index = FitsIndex()
+            index.scan(self.fitsfiles, workers=2)
+            index.scan(self.fitsfiles)
+            self.assertEqual(mock_read.call_count, 2)
+
+    def test_on_disk_index_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index_path = os.path.join(tmpdir, "index.json")
+            fitsfile = os.path.join(tmpdir, "a.fits")
+            shutil.copy(self.fitsfiles[0], fitsfile)
+
+            first = scan_fits_headers([fitsfile], index_path=index_path)
+            self.assertTrue(os.path.exists(index_path))
+
+            with patch("psrtool.index.read_fits_header") as mock_read:
+                second = scan_fits_headers([fitsfile], index_path=index_path)
+                mock_read.assert_not_called()
+            self.assertEqual(first, second)
+
+            # A changed file is re-read
+            shutil.copy(self.fitsfiles[1], fitsfile)
+            os.utime(fitsfile, ns=(0, first[0].mtime_ns + 1))
+            third = scan_fits_headers([fitsfile], index_path=index_path)
+            self.assertNotEqual(third[0].start_mjd, first[0].start_mjd)
+
+    def test_corrupt_index_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index_path = os.path.join(tmpdir, "index.json")
+            with open(index_path, "w") as f:
+                f.write("{not json")
+            index = FitsIndex(index_path)
+            self.assertEqual(len(index), 0)
+            index.scan(self.fitsfiles)
+            index.save()
+            self.assertEqual(len(FitsIndex(index_path)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
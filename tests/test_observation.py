@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from astropy.io import fits
+from unittest.mock import patch
+
+from psrtool import observation as observation_module
+from psrtool.observation import Observation
+from psrtool.psrfits import downsample_data, get_stokesi_data
+from psrtool.synthetic import make_synthetic_psrfits
+
+
+class TestObservation(unittest.TestCase):
+    fitsfiles = [
+        "tests/testdata/test2.fits",
+        "tests/testdata/test1.fits"
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.full = np.vstack([get_stokesi_data(path) for path in reversed(cls.fitsfiles)])
+
+    def test_virtual_array_across_files(self):
+        with Observation(self.fitsfiles) as obs:
+            self.assertEqual(obs.fitsfiles, list(reversed(self.fitsfiles)))
+            self.assertEqual(obs.shape, self.full.shape)
+            self.assertEqual(len(obs), self.full.shape[0])
+            np.testing.assert_array_equal(obs[:], self.full)
+            np.testing.assert_array_equal(obs[4000:4200, 10:50], self.full[4000:4200, 10:50])
+            np.testing.assert_array_equal(obs[-5:, ::3], self.full[-5:, ::3])
+            np.testing.assert_array_equal(obs[4096], self.full[4096])
+            np.testing.assert_array_equal(obs[100:110, 7], self.full[100:110, 7])
+            self.assertEqual(obs[100, 7], self.full[100, 7])
+            with self.assertRaises(IndexError):
+                obs[len(obs)]
+
+    def test_downsampled(self):
+        expected = downsample_data(self.full, dchan_factor=2, dt_factor=3)
+        with Observation(self.fitsfiles, dchan_factor=2, dt_factor=3) as obs:
+            self.assertEqual(obs.shape, expected.shape)
+            self.assertAlmostEqual(obs.tsamp, 3 * fits.getval(self.fitsfiles[0], "TBIN", ext=1))
+            # The block at row 1365 spans both files
+            np.testing.assert_array_equal(obs[1360:1370, 5:20], expected[1360:1370, 5:20])
+
+    def test_reads_only_overlapping_subints(self):
+        decoded = []
+        pol_rows = observation_module._pol_rows
+
+        def record(rows, *args, **kwargs):
+            decoded.append(rows.shape[0])
+            return pol_rows(rows, *args, **kwargs)
+
+        with Observation(self.fitsfiles, cache_size=2) as obs, patch.object(observation_module, "_pol_rows", record):
+            obs[5000:5010]
+            self.assertEqual(len(decoded), 1)
+            self.assertEqual(len(obs._columns), 1)
+            obs[5000:5020]
+            self.assertEqual(len(decoded), 1)
+            info = obs.cache_info()
+            self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+            obs[0:10]
+            obs[7000:7010]
+            obs[5000:5010]
+            self.assertEqual(len(decoded), 4)
+            self.assertEqual(obs.cache_info().currsize, 2)
+
+    def test_rejects_gaps(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shifted = os.path.join(tmpdir, "shifted.fits")
+            shutil.copy(self.fitsfiles[0], shifted)
+            offs = fits.getval(shifted, "STT_OFFS", ext=0)
+            fits.setval(shifted, "STT_OFFS", value=offs + 1.0, ext=0)
+            with self.assertRaises(ValueError):
+                Observation([self.fitsfiles[1], shifted])
+
+    def test_apply_scales(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "scaled.fits")
+            scl = np.full((2, 32), 0.5, dtype=np.float32)
+            data = make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=16, nchan=32, dat_scl=scl)
+            with Observation([fitsfile], apply_scales=True) as obs:
+                self.assertEqual(obs.dtype, np.float32)
+                np.testing.assert_allclose(obs[:], data.reshape(-1, 32) * 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
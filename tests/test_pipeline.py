@@ -0,0 +1,61 @@
+import time
+import unittest
+import numpy as np
+
+from psrtool.pipeline import run_pipeline, downsample_chunk
+from psrtool.psrfits import get_stokesi_data, iter_stokesi_chunks, align_chunks, downsample_data
+
+
+class TestRunPipeline(unittest.TestCase):
+
+    def test_preserves_order(self):
+        def process(i):
+            time.sleep(0.001 * (i % 3))
+            return i * 2
+
+        for threads in (0, 1, 4):
+            out = []
+            run_pipeline(range(50), process, out.append, threads=threads, prefetch=2)
+            self.assertEqual(out, [i * 2 for i in range(50)])
+
+    def test_process_error_propagates(self):
+        def process(i):
+            if i == 5:
+                raise RuntimeError("bad chunk")
+            return i
+
+        out = []
+        with self.assertRaises(RuntimeError):
+            run_pipeline(range(100), process, out.append, threads=2, prefetch=1)
+        self.assertEqual(out, list(range(5)))
+
+    def test_reader_error_propagates(self):
+        def chunks():
+            yield 1
+            raise OSError("read failed")
+
+        out = []
+        with self.assertRaises(OSError):
+            run_pipeline(chunks(), lambda i: i, out.append, threads=1)
+        self.assertEqual(out, [1])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            run_pipeline([], lambda i: i, print, threads=-1)
+        with self.assertRaises(ValueError):
+            run_pipeline([], lambda i: i, print, prefetch=0)
+
+
+class TestDownsampleChunk(unittest.TestCase):
+    testdata: str = "tests/testdata/test1.fits"
+
+    def test_pipelined_downsample_matches_whole_file(self):
+        expected = downsample_data(get_stokesi_data(self.testdata), dchan_factor=4, dt_factor=5)
+        out = []
+        chunks = align_chunks(iter_stokesi_chunks(self.testdata, 1), 5)
+        run_pipeline(chunks, lambda c: downsample_chunk(c, dchan_factor=4, dt_factor=5), out.append, threads=3)
+        np.testing.assert_array_equal(np.vstack(out), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from unittest.mock import patch
+
+from psrtool import cli, profiling
+from psrtool.combinefits import combinefits
+from psrtool.fits2fil import fits2fil
+from psrtool.profiling import Profiler, stage
+
+
+class TestProfiler(unittest.TestCase):
+    def test_stage_is_noop_when_disabled(self):
+        self.assertFalse(profiling.is_active())
+        with stage("read", 10, "a.fits"):
+            pass
+        self.assertIs(stage("read"), stage("write"))
+
+    def test_records_per_stage_and_file(self):
+        with Profiler("test") as profiler:
+            with stage("read", 10, "a.fits"):
+                pass
+            with stage("read", 5, "a.fits"):
+                pass
+            with stage("read", 7, "b.fits"):
+                pass
+        summary = profiler.summary()
+        self.assertEqual(summary["command"], "test")
+        self.assertGreater(summary["peak_rss_mb"], 0)
+        records = {(item["stage"], item["file"]): item for item in summary["stages"]}
+        self.assertEqual(records[("read", "a.fits")]["calls"], 2)
+        self.assertEqual(records[("read", "a.fits")]["nbytes"], 15)
+        self.assertEqual(records[("read", "b.fits")]["nbytes"], 7)
+        self.assertIn("read", profiler.format_report())
+        self.assertFalse(profiling.is_active())
+
+    def test_memory_per_stage(self):
+        with Profiler("test") as profiler:
+            with stage("allocate", 0, "a.fits"):
+                block = np.ones(50_000_000 // 8)
+            with stage("small", 0, "a.fits"):
+                pass
+        del block
+        records = {item["stage"]: item for item in profiler.summary()["stages"]}
+        self.assertGreater(records["allocate"]["rss_delta_mb"], 40)
+        self.assertLess(records["small"]["rss_delta_mb"], 40)
+        self.assertIn("+RSS MB", profiler.format_report())
+
+        merged = Profiler()
+        merged.merge(profiler.summary()["stages"])
+        self.assertEqual(merged.summary()["stages"][0]["rss_delta_mb"], records["allocate"]["rss_delta_mb"])
+
+    def test_rss_without_resource_module(self):
+        with Profiler("test") as profiler:
+            with stage("read", 10):
+                pass
+        self.assertNotIn("peak_rss_mb", profiler.summary()["stages"][0])
+        with patch.dict(sys.modules, {"resource": None}):
+            self.assertIsNone(profiler.summary()["peak_rss_mb"])
+            self.assertIn("process peak RSS unavailable", profiler.format_report())
+
+    def test_fits2fil_stages(self):
+        with tempfile.TemporaryDirectory() as tmpdir, Profiler("fits2fil") as profiler:
+            fits2fil("tests/testdata/test2.fits", os.path.join(tmpdir, "out.fil"), dchan_factor=2, dt_factor=2)
+        stages = {item["stage"] for item in profiler.summary()["stages"]}
+        self.assertTrue({"read", "polsum", "downsample", "write", "flush"} <= stages)
+        read = [item for item in profiler.summary()["stages"] if item["stage"] == "read"]
+        self.assertEqual([item["file"] for item in read], ["tests/testdata/test2.fits"])
+
+    def test_parallel_workers_merge_stages(self):
+        fitsfiles = ["tests/testdata/test1.fits", "tests/testdata/test2.fits"]
+        with tempfile.TemporaryDirectory() as tmpdir, Profiler() as profiler:
+            combinefits(fitsfiles, os.path.join(tmpdir, "out.fil"), workers=2)
+        read_files = {item["file"] for item in profiler.summary()["stages"] if item["stage"] == "read"}
+        self.assertEqual(read_files, set(fitsfiles))
+
+    def test_hook_receives_unprofiled_runs(self):
+        summaries = []
+        profiling.add_hook(summaries.append)
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fits2fil("tests/testdata/test2.fits", os.path.join(tmpdir, "out.fil"))
+        finally:
+            profiling.remove_hook(summaries.append)
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]["command"], "fits2fil")
+        self.assertTrue(summaries[0]["stages"])
+
+    def test_cli_stats_json(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            statsfile = os.path.join(tmpdir, "stats.json")
+            argv = ["prog", "tests/testdata/test2.fits", "-o", os.path.join(tmpdir, "out.fil"), "--stats-json", statsfile]
+            with patch.object(sys, "argv", argv):
+                cli.fits2filcli()
+            with open(statsfile) as f:
+                stats = json.load(f)
+        self.assertEqual(stats["command"], "fits2fil")
+        self.assertGreater(stats["wall_seconds"], 0)
+        self.assertIn("read", {item["stage"] for item in stats["stages"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,18 @@
+import os
+import tempfile
 import unittest
 import numpy as np
 from your import Your
+from your.formats.pysigproc import SigprocFile
 from unittest.mock import patch
 
-from psrtool.fits2fil import fits2fil, fil2fits
+from astropy.io import fits
+from psrtool.bits import unpack_bits
+from psrtool.blocked import BlockedSpectra
+from psrtool.psrfits import get_stokesi_data, get_stokesi_downsampled, requantize_block
+from psrtool.fits2fil import fits2fil, fil2fits, fildecimate
+from psrtool.sigproc import Filterbank, create_filterbank, make_header
+from psrtool.synthetic import make_synthetic_psrfits
 
 
 
@@ -31,6 +40,99 @@ class TestFits2Fil(unittest.TestCase):
         data_fits = out_fil.get_data(0, out_header.nspectra, pol=0)
         np.testing.assert_array_equal(data_fil, data_fits)
 
+    def test_fits2fil_low_bit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "lowbit.fits")
+            data = make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=64, nchan=32, nbits=2)
+            expected = data.reshape(-1, 32)
+
+            outfile = os.path.join(tmpdir, "unpacked.fil")
+            fits2fil(fitsfile, outfile)
+            out_fil = Your(outfile)
+            self.assertEqual(out_fil.your_header.nbits, 8)
+            np.testing.assert_array_equal(out_fil.get_data(0, 128, pol=0).reshape(-1, 32), expected)
+
+            outfile = os.path.join(tmpdir, "repacked.fil")
+            fits2fil(fitsfile, outfile, repack=True)
+            out_fil = SigprocFile(outfile)
+            self.assertEqual(out_fil.nbits, 2)
+            with open(outfile, "rb") as f:
+                f.seek(out_fil.hdrbytes)
+                packed = np.frombuffer(f.read(), dtype=np.uint8)
+            self.assertEqual(packed.size, 128 * 32 // 4)
+            np.testing.assert_array_equal(unpack_bits(packed, 2, "little").reshape(-1, 32), expected)
+
+    def test_fits2fil_selection(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for nbits, npol in ((8, 2), (2, 1)):
+                fitsfile = os.path.join(tmpdir, f"select_{nbits}.fits")
+                make_synthetic_psrfits(fitsfile, nsubint=6, nsblk=32, nchan=32, npol=npol, nbits=nbits)
+                full = get_stokesi_data(fitsfile)
+                tbin = fits.getval(fitsfile, "TBIN", ext=1)
+                fullfile = os.path.join(tmpdir, "full.fil")
+                fits2fil(fitsfile, fullfile)
+                full_header = Filterbank(fullfile).header
+
+                # 50 samples from sample 40 and channels 3 to 28, spanning partial subints and bytes
+                outfile = os.path.join(tmpdir, "window.fil")
+                fch1, foff = full_header["fch1"], full_header["foff"]
+                fmin, fmax = sorted((fch1 + 3 * foff, fch1 + 28 * foff))
+                fits2fil(
+                    fitsfile, outfile, start=40 * tbin, duration=50 * tbin, fmin=fmin, fmax=fmax, nsubint_per_chunk=1
+                )
+                with Filterbank(outfile) as fil:
+                    self.assertEqual(fil.nchans, 26)
+                    self.assertAlmostEqual(fil.fch1, fch1 + 3 * foff)
+                    self.assertAlmostEqual((fil.tstart - full_header["tstart"]) * 86400, 40 * tbin, places=5)
+                    np.testing.assert_array_equal(fil.get_spectra(0, fil.nspectra), full[40:90, 3:29])
+
+                start_mjd = full_header["tstart"] + 100 * tbin / 86400
+                fits2fil(fitsfile, outfile, dt_factor=2, start_mjd=start_mjd)
+                with Filterbank(outfile) as fil:
+                    expected = full[100:].reshape(-1, 2, 32).mean(axis=1).astype(np.uint8)
+                    np.testing.assert_array_equal(fil.get_spectra(0, fil.nspectra), expected)
+
+            with self.assertRaises(ValueError):
+                fits2fil(fitsfile, outfile, start=1e6)
+            with self.assertRaises(ValueError):
+                fits2fil(fitsfile, outfile, start=0, start_mjd=60000)
+
+    def test_fits2fil_nbits_out(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "in.fits")
+            data = make_synthetic_psrfits(fitsfile, nsubint=4, nsblk=64, nchan=32, npol=2)
+            stokesi = (data[:, :, 0].astype(np.float32) + data[:, :, 1]).reshape(-1, 32) / 2
+            averaged = stokesi.reshape(-1, 2, 32).mean(axis=1)
+            outfile = os.path.join(tmpdir, "out.fil")
+
+            fits2fil(fitsfile, outfile, dt_factor=2, nbits_out=32)
+            with Filterbank(outfile) as fil:
+                self.assertEqual(fil.nbits, 32)
+                np.testing.assert_allclose(fil.get_spectra(0, fil.nspectra), averaged, rtol=1e-6)
+
+            # One chunk, so the whole file is requantized with the same statistics
+            fits2fil(fitsfile, outfile, dt_factor=2, nbits_out=2, nsubint_per_chunk=4)
+            with Filterbank(outfile) as fil:
+                self.assertEqual(fil.nbits, 2)
+                self.assertEqual(fil.data.shape, (128, 8))
+                expected = requantize_block(get_stokesi_downsampled(fitsfile, dt_factor=2), 2)
+                np.testing.assert_array_equal(fil.get_spectra(0, fil.nspectra), expected)
+
+            with self.assertRaises(ValueError):
+                fits2fil(fitsfile, outfile, nbits_out=16)
+            with self.assertRaises(ValueError):
+                fits2fil(fitsfile, outfile, nbits_out=3)
+
+            lowbit = os.path.join(tmpdir, "lowbit.fits")
+            make_synthetic_psrfits(lowbit, nsubint=2, nsblk=64, nchan=32, nbits=2)
+            fits2fil(lowbit, outfile, nbits_out=2)
+            repacked = os.path.join(tmpdir, "repacked.fil")
+            fits2fil(lowbit, repacked, repack=True)
+            with Filterbank(outfile) as fil, Filterbank(repacked) as reference:
+                self.assertEqual(fil.nbits, 2)
+                np.testing.assert_array_equal(fil.data, reference.data)
+
+
 class TestFil2Fits(unittest.TestCase):
 
     def test_fil2fits_basic(self):
@@ -54,3 +156,162 @@ class TestFil2Fits(unittest.TestCase):
         data_fil = test_fits.get_data(0, test_header.nspectra, pol=0)
         data_fits = out_fits.get_data(0, out_header.nspectra, pol=0)
         np.testing.assert_array_equal(data_fil, data_fits)
+
+    def test_fil2fits_block_size(self):
+        filfile = "tests/testdata/test2.fil"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = os.path.join(tmpdir, "blocks.fits")
+            fil2fits(filfile, outfile, nsblk=100, nsubint_per_chunk=3)
+
+            with fits.open(outfile) as hdul:
+                hdul.verify("exception")
+                self.assertEqual(hdul[1].header["NSBLK"], 100)
+                self.assertEqual(hdul[1].header["NAXIS2"], 41)
+            data_fil = Your(filfile).get_data(0, 4096)
+            data_fits = get_stokesi_data(outfile)
+            np.testing.assert_array_equal(data_fits[:4096], data_fil)
+            np.testing.assert_array_equal(data_fits[4096:], 0)
+
+    def test_fil2fits_low_bit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "lowbit.fits")
+            data = make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=64, nchan=32, nbits=2)
+            filfile = os.path.join(tmpdir, "lowbit.fil")
+            fits2fil(fitsfile, filfile, repack=True)
+
+            outfile = os.path.join(tmpdir, "roundtrip.fits")
+            fil2fits(filfile, outfile, nsblk=32)
+            self.assertEqual(fits.getval(outfile, "NBITS", 1), 2)
+            np.testing.assert_array_equal(get_stokesi_data(outfile), data.reshape(-1, 32))
+
+    def test_fil2fits_band_direction_round_trip(self):
+        spectra = np.random.default_rng(0).integers(0, 256, size=(64, 8), dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for foff in (-1.0, 1.0):
+                with self.subTest(foff=foff):
+                    filfile = os.path.join(tmpdir, "band.fil")
+                    header = make_header("TEST", nchans=8, foff=foff, fch1=1400.0, tsamp=1e-4, tstart=60000.0,
+                                         rawdatafile="band.fil")
+                    with create_filterbank(filfile, header, 64) as fil:
+                        fil.data[:] = spectra
+
+                    fitsfile = os.path.join(tmpdir, "band.fits")
+                    fil2fits(filfile, fitsfile, nsblk=32)
+                    self.assertEqual(fits.getval(fitsfile, "OBSBW", 0), 8.0)
+                    self.assertEqual(fits.getval(fitsfile, "CHAN_BW", 1), foff)
+                    dat_freq = fits.getdata(fitsfile, 1)["DAT_FREQ"][0]
+                    np.testing.assert_allclose(dat_freq, 1400.0 + np.arange(8) * foff)
+
+                    outfile = os.path.join(tmpdir, "roundtrip.fil")
+                    fits2fil(fitsfile, outfile)
+                    with Filterbank(outfile) as out:
+                        self.assertEqual(out.fch1, 1400.0)
+                        self.assertEqual(out.foff, foff)
+                        np.testing.assert_array_equal(out.get_spectra(0, out.nspectra), spectra)
+
+    def test_fil2fits_16bit_round_trip(self):
+        spectra = np.random.default_rng(0).integers(0, 1 << 16, size=(64, 8), dtype=np.uint16)
+        spectra[0, :2] = [0, 65535]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filfile = os.path.join(tmpdir, "wide.fil")
+            header = make_header("TEST", nchans=8, foff=-1.0, fch1=1400.0, tsamp=1e-4, tstart=60000.0, nbits=16)
+            with create_filterbank(filfile, header, 64) as fil:
+                fil.data[:] = spectra
+            fitsfile = os.path.join(tmpdir, "wide.fits")
+            fil2fits(filfile, fitsfile, nsblk=32)
+            # PSRFITS 16-bit samples are signed: offset, not wrapped
+            np.testing.assert_array_equal(get_stokesi_data(fitsfile), spectra.astype(np.int32) - 32768)
+
+            outfile = os.path.join(tmpdir, "roundtrip.fil")
+            fits2fil(fitsfile, outfile)
+            with Filterbank(outfile) as out:
+                np.testing.assert_array_equal(out.get_spectra(0, out.nspectra), spectra)
+
+    def test_fits2fil_signed_16bit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "signed.fits")
+            data = make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=32, nchan=8, npol=2, nbits=16)
+            self.assertTrue((data < 0).any())
+            unsigned = data.reshape(-1, 2, 8).astype(np.int64) + 32768
+            stokesi = (unsigned[:, 0] + unsigned[:, 1]) // 2
+            for dt_factor in (1, 2):
+                filfile = os.path.join(tmpdir, "signed.fil")
+                fits2fil(fitsfile, filfile, dt_factor=dt_factor)
+                npyfile = os.path.join(tmpdir, "signed.npy")
+                fits2fil(fitsfile, npyfile, dt_factor=dt_factor, layout="channel")
+                expected = stokesi.reshape(-1, dt_factor, 8).sum(axis=1) // dt_factor
+                with Filterbank(filfile) as fil, BlockedSpectra(npyfile) as blocked:
+                    np.testing.assert_array_equal(fil.get_spectra(0, fil.nspectra), expected)
+                    np.testing.assert_array_equal(blocked[:], expected)
+
+    def test_fildecimate(self):
+        fitsfile = "tests/testdata/test2.fits"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            full, direct = os.path.join(tmpdir, "full.fil"), os.path.join(tmpdir, "direct.fil")
+            fits2fil(fitsfile, full)
+            fits2fil(fitsfile, direct, dchan_factor=4, dt_factor=3)
+            outfile = os.path.join(tmpdir, "decimated", "out.fil")
+            for nspectra_per_chunk, threads in ((16384, 1), (100, 0), (7, 3)):
+                with self.subTest(nspectra_per_chunk=nspectra_per_chunk, threads=threads):
+                    fildecimate(full, outfile, dchan_factor=4, dt_factor=3,
+                                nspectra_per_chunk=nspectra_per_chunk, threads=threads)
+                    with Filterbank(direct) as expected, Filterbank(outfile) as fil:
+                        self.assertEqual(fil.header, dict(expected.header, rawdatafile=outfile))
+                        np.testing.assert_array_equal(fil.data, expected.data)
+            self.assertFalse(os.path.exists(outfile + ".part"))
+            with self.assertRaises(ValueError):
+                fildecimate(full, outfile, dt_factor=0)
+
+    def test_fildecimate_16bit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "signed.fits")
+            make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=64, nchan=32, npol=2, nbits=16)
+            full, direct = os.path.join(tmpdir, "full.fil"), os.path.join(tmpdir, "direct.fil")
+            fits2fil(fitsfile, full)
+            fits2fil(fitsfile, direct, dchan_factor=4, dt_factor=3)
+            outfile = os.path.join(tmpdir, "out.fil")
+            fildecimate(full, outfile, dchan_factor=4, dt_factor=3)
+            with Filterbank(direct) as expected, Filterbank(outfile) as fil:
+                self.assertEqual(fil.nbits, 16)
+                np.testing.assert_array_equal(fil.data, expected.data)
+
+    def test_fildecimate_low_bit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "lowbit.fits")
+            make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=64, nchan=32, nbits=2)
+            full, direct = os.path.join(tmpdir, "full.fil"), os.path.join(tmpdir, "direct.fil")
+            fits2fil(fitsfile, full, repack=True)
+            for repack in (False, True):
+                fits2fil(fitsfile, direct, dt_factor=2, repack=repack)
+                outfile = os.path.join(tmpdir, "out.fil")
+                fildecimate(full, outfile, dt_factor=2, repack=repack)
+                with Filterbank(direct) as expected, Filterbank(outfile) as fil:
+                    self.assertEqual(fil.nbits, 2 if repack else 8)
+                    np.testing.assert_array_equal(fil.data, expected.data)
+
+    def test_fits2fil_apply_scales(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "scaled.fits")
+            nsubint, nchan = 4, 16
+            dat_scl = np.full((nsubint, nchan), 1.5, dtype=np.float32)
+            dat_scl[1] = 3.0
+            dat_offs = np.full((nsubint, nchan), -10.0, dtype=np.float32)
+            data = make_synthetic_psrfits(fitsfile, nsubint=nsubint, nsblk=32, nchan=nchan, dat_scl=dat_scl, dat_offs=dat_offs)
+            scaled = (data.reshape(nsubint, 32, nchan) * dat_scl[:, None] + dat_offs[:, None]).reshape(-1, nchan)
+
+            outfile = os.path.join(tmpdir, "float.fil")
+            fits2fil(fitsfile, outfile, apply_scales=True, nsubint_per_chunk=3)
+            out_fil = Your(outfile)
+            self.assertEqual(out_fil.your_header.nbits, 32)
+            np.testing.assert_allclose(out_fil.get_data(0, nsubint * 32, pol=0), scaled, rtol=1e-6)
+
+            outfile = os.path.join(tmpdir, "requantized.fil")
+            fits2fil(fitsfile, outfile, apply_scales=True, requantize="zero")
+            out_fil = Your(outfile)
+            self.assertEqual(out_fil.your_header.nbits, 8)
+            expected = np.rint(scaled)
+            expected[(expected < 0) | (expected > 255)] = 0
+            np.testing.assert_array_equal(out_fil.get_data(0, nsubint * 32, pol=0), expected)
+
+            with self.assertRaises(ValueError):
+                fits2fil(fitsfile, outfile, apply_scales=True, requantize="wrap")
@@ -1,9 +1,26 @@
 
+import os
+import tempfile
 import unittest
 import numpy as np
+from astropy.io import fits
 from unittest.mock import patch
 
-from psrtool.psrfits import read_fits_header, get_header_time_info, is_time_contiguous, get_stokesi_data, downsample_data
+from psrtool.psrfits import (
+    read_fits_header,
+    get_header_time_info,
+    is_time_contiguous,
+    get_stokesi_data,
+    downsample_data,
+    iter_stokesi_chunks,
+    downsample_chunks,
+    stokesi_downsample,
+    get_stokesi_downsampled,
+    requantize,
+    requantize_block,
+    _map_subint_columns,
+)
+from psrtool.synthetic import make_synthetic_psrfits
 
 
 class TestIsTimeContiguous(unittest.TestCase):
@@ -87,4 +104,191 @@ class TestPsrFits(unittest.TestCase):
             data.shape[1] // dchan_factor
         )
 
-        self.assertEqual(downsampled_data.shape, expected_shape)
\ No newline at end of file
+        self.assertEqual(downsampled_data.shape, expected_shape)
+
+
+class TestStokesIChunks(unittest.TestCase):
+    testdata: str = "tests/testdata/test1.fits"
+
+    def test_iter_stokesi_chunks_matches_whole_file(self):
+        data = get_stokesi_data(self.testdata)
+        for nsubint_per_chunk in (1, 3, 16):
+            starts = []
+            blocks = []
+            for start, block in iter_stokesi_chunks(self.testdata, nsubint_per_chunk):
+                starts.append(start)
+                blocks.append(block)
+            self.assertEqual(starts[0], 0)
+            self.assertEqual(starts[1:], list(np.cumsum([len(b) for b in blocks])[:-1]))
+            np.testing.assert_array_equal(np.vstack(blocks), data)
+
+    def test_iter_stokesi_chunks_invalid(self):
+        with self.assertRaises(ValueError):
+            next(iter_stokesi_chunks(self.testdata, 0))
+
+    def test_downsample_chunks_matches_downsample_data(self):
+        data = get_stokesi_data(self.testdata)
+        expected = downsample_data(data, dchan_factor=2, dt_factor=3)
+        chunks = iter_stokesi_chunks(self.testdata, 1)
+        out = list(downsample_chunks(chunks, dchan_factor=2, dt_factor=3))
+        self.assertEqual([start for start, _ in out][:2], [0, out[0][1].shape[0]])
+        np.testing.assert_array_equal(np.vstack([block for _, block in out]), expected)
+
+
+class TestStokesIDownsample(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.data = rng.integers(0, 256, size=(96, 2, 32), dtype=np.uint8)
+
+    def test_polarization_sum_does_not_overflow(self):
+        data = np.array([[[200, 3], [100, 4]]], dtype=np.uint8)
+        np.testing.assert_array_equal(stokesi_downsample(data), np.array([[150, 3]], dtype=np.uint8))
+
+    def test_signed_truncates_towards_zero(self):
+        data = np.array([[[-3, 3, -128], [0, 0, -128]]], dtype=np.int8)
+        np.testing.assert_array_equal(stokesi_downsample(data), np.array([[-1, 1, -128]], dtype=np.int8))
+
+    def test_float(self):
+        data = np.array([[[1.0, 2.5]], [[3.0, 0.5]]], dtype=np.float32).reshape(1, 2, 2)
+        result = stokesi_downsample(data)
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_array_equal(result, np.array([[2.0, 1.5]], dtype=np.float32))
+
+    def test_matches_stokesi_then_downsample(self):
+        wide = self.data.astype(np.uint16)
+        stokesi = ((wide[:, 0, :] + wide[:, 1, :]) // 2).astype(np.uint8)
+        for dchan_factor, dt_factor in ((1, 1), (2, 3), (3, 4), (8, 1)):
+            np.testing.assert_array_equal(
+                stokesi_downsample(self.data, dchan_factor, dt_factor),
+                downsample_data(stokesi, dchan_factor, dt_factor),
+            )
+
+    def test_tiled_matches_untiled(self):
+        expected = stokesi_downsample(self.data, 2, 3)
+        with patch("psrtool.psrfits._TILE_BYTES", 256):
+            np.testing.assert_array_equal(stokesi_downsample(self.data, 2, 3), expected)
+
+    def test_single_polarization(self):
+        data = self.data[:, :1, :]
+        np.testing.assert_array_equal(stokesi_downsample(data, 2, 2), downsample_data(data[:, 0, :], 2, 2))
+
+    def test_get_stokesi_downsampled(self):
+        testdata = "tests/testdata/test1.fits"
+        expected = downsample_data(get_stokesi_data(testdata), dchan_factor=4, dt_factor=3)
+        result = get_stokesi_downsampled(testdata, dchan_factor=4, dt_factor=3, nsubint_per_chunk=1)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_get_stokesi_downsampled_shorter_than_factor(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "short.fits")
+            make_synthetic_psrfits(fitsfile, nsubint=1, nsblk=4, nchan=16, npol=2)
+            result = get_stokesi_downsampled(fitsfile, dchan_factor=2, dt_factor=8)
+            expected = downsample_data(get_stokesi_data(fitsfile), dchan_factor=2, dt_factor=8)
+            self.assertEqual(result.shape, (0, 8))
+            self.assertEqual(result.dtype, expected.dtype)
+
+
+class TestLowBitData(unittest.TestCase):
+
+    def test_low_bit_stokesi(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for nbits in (1, 2, 4):
+                for npol in (1, 2, 4):
+                    fitsfile = os.path.join(tmpdir, f"lowbit_{nbits}_{npol}.fits")
+                    data = make_synthetic_psrfits(fitsfile, nsubint=3, nsblk=32, nchan=16, npol=npol, nbits=nbits)
+                    data = data.reshape(-1, npol, 16)
+                    expected = stokesi_downsample(data)
+                    np.testing.assert_array_equal(get_stokesi_data(fitsfile), expected)
+                    chunks = [block for _, block in iter_stokesi_chunks(fitsfile, 2)]
+                    np.testing.assert_array_equal(np.vstack(chunks), expected)
+
+
+class TestColumnSelectiveIO(unittest.TestCase):
+
+    def test_columns_match_astropy(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for nbits in (2, 8, 16, 32):
+                fitsfile = os.path.join(tmpdir, f"cols_{nbits}.fits")
+                make_synthetic_psrfits(fitsfile, nsubint=3, nsblk=32, nchan=16, npol=4, nbits=nbits)
+                _, columns = _map_subint_columns(fitsfile, ("DATA", "DAT_SCL", "DAT_WTS"))
+                self.assertIsInstance(columns["DATA"], np.memmap)
+                with fits.open(fitsfile) as hdul:
+                    table = hdul[1].data
+                    for name, column in columns.items():
+                        expected = np.asarray(table[name])
+                        np.testing.assert_array_equal(column.reshape(expected.shape), expected)
+
+    def test_scaled_column_read_through_astropy(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "tzero.fits")
+            data = make_synthetic_psrfits(fitsfile, nsubint=2, nsblk=32, nchan=16, npol=1)
+            with fits.open(fitsfile, mode="update") as hdul:
+                index = hdul[1].columns.names.index("DATA") + 1
+                hdul[1].header[f"TZERO{index}"] = -128
+            _, columns = _map_subint_columns(fitsfile)
+            self.assertNotIsInstance(columns["DATA"], np.memmap)
+            expected = data.reshape(-1, 16).astype(np.int16) - 128
+            np.testing.assert_array_equal(get_stokesi_data(fitsfile), expected)
+
+
+class TestScaledData(unittest.TestCase):
+
+    def _write(self, fitsfile, npol=2):
+        rng = np.random.default_rng(1)
+        nsubint, nchan = 4, 16
+        dat_scl = rng.uniform(0.5, 2.0, (nsubint, npol * nchan)).astype(np.float32)
+        dat_offs = rng.uniform(-4.0, 4.0, (nsubint, npol * nchan)).astype(np.float32)
+        dat_wts = rng.uniform(0.0, 1.0, (nsubint, nchan)).astype(np.float32)
+        data = make_synthetic_psrfits(
+            fitsfile, nsubint=nsubint, nsblk=32, nchan=nchan, npol=npol,
+            dat_scl=dat_scl, dat_offs=dat_offs, dat_wts=dat_wts,
+        )
+        scaled = data * dat_scl.reshape(nsubint, 1, npol, nchan) + dat_offs.reshape(nsubint, 1, npol, nchan)
+        scaled = scaled * dat_wts.reshape(nsubint, 1, 1, nchan)
+        return scaled.astype(np.float32).reshape(-1, npol, nchan)
+
+    def test_apply_scales(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "scaled.fits")
+            scaled = self._write(fitsfile)
+            expected = stokesi_downsample(scaled)
+            result = get_stokesi_data(fitsfile, apply_scales=True)
+            self.assertEqual(result.dtype, np.float32)
+            np.testing.assert_allclose(result, expected, rtol=1e-6)
+            chunks = [block for _, block in iter_stokesi_chunks(fitsfile, 3, apply_scales=True)]
+            np.testing.assert_array_equal(np.vstack(chunks), result)
+
+    def test_scales_ignored_by_default(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fitsfile = os.path.join(tmpdir, "scaled.fits")
+            self._write(fitsfile)
+            self.assertEqual(get_stokesi_data(fitsfile).dtype, np.uint8)
+
+    def test_requantize(self):
+        data = np.array([-3.2, 0.4, 1.6, 254.5, 300.0], dtype=np.float32)
+        np.testing.assert_array_equal(requantize(data, 8), [0, 0, 2, 254, 255])
+        np.testing.assert_array_equal(requantize(data, 8, "zero"), [0, 0, 2, 254, 0])
+        np.testing.assert_array_equal(requantize(data, 2), [0, 0, 2, 3, 3])
+        self.assertEqual(requantize(data, 16).dtype, np.int16)
+        self.assertIs(requantize(data, 32), data)
+        with self.assertRaises(ValueError):
+            requantize(data, 8, "wrap")
+
+    def test_requantize_block(self):
+        rng = np.random.default_rng(2)
+        data = rng.normal(100.0, 10.0, size=(100000, 3)).astype(np.float32)
+        data[:, 2] = 7.0
+        levels = requantize_block(data, 2)
+        self.assertEqual(levels.dtype, np.uint8)
+        # Levels one standard deviation wide, centred on the channel mean
+        fractions = np.bincount(levels[:, 0], minlength=4) / data.shape[0]
+        np.testing.assert_allclose(fractions, [0.159, 0.341, 0.341, 0.159], atol=0.01)
+        np.testing.assert_array_equal(levels[:, 2], 2)
+
+        np.testing.assert_array_equal(requantize_block(data, 1)[:, 1], data[:, 1] >= data[:, 1].mean())
+        self.assertEqual(requantize_block(data, 16).dtype, np.uint16)
+        zeroed = requantize_block(data, 2, "zero")
+        np.testing.assert_array_equal(zeroed[np.abs(data[:, 0] - data[:, 0].mean()) > 2.1 * data[:, 0].std(), 0], 0)
+        with self.assertRaises(ValueError):
+            requantize_block(data, 3)
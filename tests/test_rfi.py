@@ -0,0 +1,122 @@
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+
+from psrtool.combinefits import combinefits
+from psrtool.fits2fil import fits2fil
+from psrtool.rfi import RfiMasker, load_channel_mask, make_rfi_masker, rfi_mask_path
+from psrtool.sigproc import Filterbank
+from psrtool.synthetic import write_psrfits
+
+
+def noise_with_rfi(nsamples=2048, nchan=64, seed=0):
+    """Gaussian noise around 100 with a narrowband channel and a broadband burst."""
+    rng = np.random.default_rng(seed)
+    data = rng.normal(100, 10, size=(nsamples, nchan))
+    data[:, 10] += rng.normal(0, 60, size=nsamples)
+    data[300:303] += 80
+    return np.clip(np.rint(data), 0, 255).astype(np.uint8)
+
+
+class TestRfiMasker(unittest.TestCase):
+    def test_flags_channel_and_burst(self):
+        data = noise_with_rfi()
+        masker = RfiMasker(64, data.shape[0], sigma=5)
+        channels, samples, mean = masker.flag(data)
+        self.assertEqual(np.flatnonzero(channels).tolist(), [10])
+        self.assertEqual(np.flatnonzero(samples).tolist(), [300, 301, 302])
+        self.assertAlmostEqual(float(mean[0]), 100, delta=1)
+
+        masked = masker(0, data.copy())
+        self.assertEqual(masked.dtype, np.uint8)
+        np.testing.assert_array_equal(masked[:, 10], masked[0, 10])
+        np.testing.assert_array_equal(masked[300], masked[301])
+        np.testing.assert_array_equal(masked[:300, :10], data[:300, :10])
+
+    def test_flagged_channel_filled_from_clean_channels(self):
+        data = noise_with_rfi().astype(np.float32)
+        data[:, 20] += 500
+        masker = RfiMasker(64, data.shape[0], sigma=5)
+        masked = masker(0, data.copy())
+        clean = np.median(data[:, :10].mean(axis=0))
+        self.assertAlmostEqual(float(masked[0, 20]), clean, delta=2)
+        # The strong channel no longer raises the band-averaged level
+        self.assertAlmostEqual(float(masked.mean()), float(np.delete(data, [10, 20], axis=1).mean()), delta=1)
+
+    def test_static_mask_and_zero_fill(self):
+        data = noise_with_rfi()
+        view = data.view()
+        view.flags.writeable = False
+        masker = RfiMasker(64, data.shape[0], static_mask=load_channel_mask([3, 4], 64), fill="zero")
+        masked = masker(0, view)
+        self.assertTrue(np.all(masked[:, 3:5] == 0))
+        # Without a threshold only the static channels are replaced
+        np.testing.assert_array_equal(masked[:, 10], data[:, 10])
+        np.testing.assert_array_equal(view, data)
+
+    def test_load_channel_mask_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "zap.txt")
+            with open(path, "w") as f:
+                f.write("# bad channels\n1, 2\n7  # satellite\n")
+            np.testing.assert_array_equal(np.flatnonzero(load_channel_mask(path, 8)), [1, 2, 7])
+            with self.assertRaises(ValueError):
+                load_channel_mask(path, 4)
+
+    def test_make_rfi_masker(self):
+        self.assertIsNone(make_rfi_masker(64, (0, 64), 100))
+        masker = make_rfi_masker(64, (8, 40), 100, mask=[0, 9])
+        self.assertEqual(np.flatnonzero(masker.static_mask).tolist(), [1])
+        with self.assertRaises(ValueError):
+            make_rfi_masker(64, (0, 64), 100, fill="median")
+
+    def test_pickled_copy_starts_empty(self):
+        masker = RfiMasker(64, 4096, sigma=5)
+        masker(0, noise_with_rfi())
+        copy = pickle.loads(pickle.dumps(masker))
+        self.assertEqual(copy.records(), [])
+        copy(2048, noise_with_rfi(seed=1))
+        masker.merge(copy.records())
+        self.assertEqual(sorted(record[0] for record in masker.records()), [0, 2048])
+
+
+class TestRfiConversion(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.data = noise_with_rfi(nsamples=4 * 512)
+        self.fitsfile = os.path.join(self.tmpdir.name, "rfi.fits")
+        write_psrfits(self.fitsfile, self.data.reshape(4, 512, 1, 64))
+
+    def test_fits2fil_masks_before_downsampling(self):
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        fits2fil(self.fitsfile, outfile, dt_factor=2, nsubint_per_chunk=4, rfi_sigma=5, rfi_mask=[0])
+
+        masker = RfiMasker(64, self.data.shape[0], sigma=5, static_mask=load_channel_mask([0], 64))
+        expected = masker(0, self.data.copy()).reshape(-1, 2, 64).mean(axis=1).astype(np.uint8)
+        with Filterbank(outfile) as fil:
+            np.testing.assert_array_equal(fil.get_spectra(0, fil.nspectra), expected)
+
+        with np.load(rfi_mask_path(outfile)) as mask:
+            self.assertEqual(mask["channel_mask"].shape, (1, 64))
+            self.assertEqual(np.flatnonzero(mask["channel_mask"][0]).tolist(), [0, 10])
+            self.assertEqual(np.flatnonzero(mask["sample_mask"]).tolist(), [300, 301, 302])
+            self.assertEqual(mask["static_mask"].sum(), 1)
+            self.assertEqual(float(mask["tsamp"]), 64e-6)
+
+    def test_combinefits_workers_merge_masks(self):
+        second = os.path.join(self.tmpdir.name, "rfi2.fits")
+        write_psrfits(second, self.data.reshape(4, 512, 1, 64), stt_offs=self.data.shape[0] * 64e-6)
+        outfile = os.path.join(self.tmpdir.name, "out.fil")
+        for workers in (1, 2):
+            combinefits([self.fitsfile, second], outfile, nsubint_per_chunk=2, rfi_sigma=5, workers=workers)
+            with np.load(rfi_mask_path(outfile)) as mask:
+                self.assertEqual(mask["chunk_start"].tolist(), [0, 1024, 2048, 3072])
+                self.assertTrue(mask["channel_mask"][:, 10].all())
+                self.assertEqual(np.flatnonzero(mask["sample_mask"]).tolist(), [300, 301, 302, 2348, 2349, 2350])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import struct
+import tempfile
+import unittest
+import numpy as np
+from your import Your
+from your.formats.filwriter import make_sigproc_object
+
+from psrtool.bits import pack_bits
+from psrtool.sigproc import (
+    Filterbank,
+    create_filterbank,
+    encode_header,
+    make_header,
+    read_header,
+    sigproc_to_sexagesimal,
+)
+
+
+class TestSigproc(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.header = make_header(
+            rawdatafile="out.fil", source_name="J0000+0000", nchans=16, foff=-1.5, fch1=1500.0,
+            tsamp=64e-6, tstart=60000.25,
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_header_matches_your(self):
+        filfile = os.path.join(self.tmpdir.name, "your.fil")
+        sig = make_sigproc_object(
+            rawdatafile="out.fil", source_name="J0000+0000", nchans=16, foff=-1.5, fch1=1500.0,
+            tsamp=64e-6, tstart=60000.25, nbits=8, nifs=1,
+        )
+        sig.write_header(filfile)
+        with open(filfile, "rb") as f:
+            self.assertEqual(f.read(), encode_header(self.header))
+
+    def test_header_round_trip(self):
+        filfile = os.path.join(self.tmpdir.name, "out.fil")
+        with open(filfile, "wb") as f:
+            f.write(encode_header(self.header))
+        header, hdrbytes = read_header(filfile)
+        self.assertEqual(header, self.header)
+        self.assertEqual(hdrbytes, os.path.getsize(filfile))
+
+    def test_create_filterbank(self):
+        filfile = os.path.join(self.tmpdir.name, "out.fil")
+        spectra = np.arange(100 * 16, dtype=np.uint8).reshape(100, 16)
+        with create_filterbank(filfile, self.header, 100) as fil:
+            self.assertTrue(np.all(fil.data == 0))
+            fil.data[50:] = spectra[50:]
+            fil.data[:50] = spectra[:50]
+        y = Your(filfile)
+        self.assertEqual(y.your_header.nspectra, 100)
+        np.testing.assert_array_equal(y.get_data(0, 100), spectra)
+        with Filterbank(filfile) as fil:
+            self.assertEqual(fil.nspectra, 100)
+            self.assertEqual(fil.tstart, 60000.25)
+            np.testing.assert_array_equal(fil.get_spectra(10, 20), spectra[10:30])
+
+    def test_create_filterbank_default_header(self):
+        filfile = os.path.join(self.tmpdir.name, "defaults.fil")
+        header = make_header("X", nchans=8, foff=1.0, fch1=1400.0, tsamp=1e-4, tstart=60000.0)
+        with create_filterbank(filfile, header, 64) as fil:
+            self.assertEqual(fil.nspectra, 64)
+            self.assertNotIn("rawdatafile", fil.header)
+            self.assertEqual(fil.source_name, "X")
+        self.assertEqual(Your(filfile).your_header.nchans, 8)
+
+        # Zero-length strings written by other tools are read as empty
+        with open(filfile, "wb") as f:
+            empty = struct.pack("i", 11) + b"rawdatafile" + struct.pack("i", 0)
+            f.write(encode_header(header).replace(b"HEADER_START", b"HEADER_START" + empty, 1))
+        self.assertEqual(read_header(filfile)[0]["rawdatafile"], "")
+
+    def test_low_bit(self):
+        filfile = os.path.join(self.tmpdir.name, "out.fil")
+        spectra = np.random.default_rng(0).integers(0, 4, (64, 16), dtype=np.uint8)
+        header = dict(self.header, nbits=2)
+        with create_filterbank(filfile, header, 64) as fil:
+            self.assertEqual(fil.data.shape, (64, 4))
+            fil.data[:] = pack_bits(spectra, 2, bitorder="little")
+        with Filterbank(filfile) as fil:
+            np.testing.assert_array_equal(fil.get_spectra(0, 64), spectra)
+
+    def test_invalid(self):
+        filfile = os.path.join(self.tmpdir.name, "bad.fil")
+        with open(filfile, "wb") as f:
+            f.write(b"\x05\x00\x00\x00HELLO")
+        with self.assertRaises(ValueError):
+            read_header(filfile)
+        with self.assertRaises(ValueError):
+            create_filterbank(filfile, dict(self.header, nbits=2, nchans=3), 1)
+
+    def test_sigproc_to_sexagesimal(self):
+        self.assertEqual(sigproc_to_sexagesimal(112233.44), "11:22:33.4400")
+        self.assertEqual(sigproc_to_sexagesimal(-53015.5, sign=True), "-05:30:15.5000")
+        self.assertEqual(sigproc_to_sexagesimal(None, sign=True), "+00:00:00.0000")
+
+
+if __name__ == "__main__":
+    unittest.main()